@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the proclib hot paths, using fake_sim.py as the simulator.
+
+  python benchmarks/bench.py [--quick] [--only start,suspend,...] [--out results.json]
+
+Benchmarks:
+  start      Runner.start() to processes known (set_processes), plain, with children and under mpirun
+  discovery  Process.get_children() time compared to the delay of the child start
+  suspend    suspend/resume(check=True) round trip for 1-256 processes
+  wait       wait_for_files() wake-up latency after the file is created
+  handshake  interface-file/OK-file step round trip, and the pipe/fifo/socket transports
+  time       Runner.time() cost against the size of the log-file
+  idle       CPU used by the controller while waiting
+
+Times are in seconds. The results are written as JSON together with the
+git commit, so that runs from different commits can be compared.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from statistics import mean, median
+
+import psutil
+from proclib.Runner import Runner
+from proclib.Process import Process
+from proclib.ProcessGroup import ProcessGroup
+
+
+FAKE_SIM = str(Path(__file__).with_name('fake_sim.py'))
+PYTHON = sys.executable
+# A fake_sim.py started without --name is found by the interpreter name
+PYTHON_NAME = psutil.Process().name()
+
+
+#------------------------------------------------
+def stats(values):
+#------------------------------------------------
+    values = sorted(values)
+    if not values:
+        return {}
+    return {'n': len(values), 'min': values[0], 'median': median(values), 'mean': mean(values),
+            'p95': values[min(len(values) - 1, int(0.95*len(values)))], 'max': values[-1]}
+
+
+#------------------------------------------------
+def sim_cmd(*args, np=None):
+#------------------------------------------------
+    cmd = [PYTHON, FAKE_SIM]
+    if np:
+        cmd += ['mpirun', '--np', str(np)]
+    return cmd + [str(a) for a in args]
+
+
+#------------------------------------------------
+def make_runner(workdir, cmd, name='sim', app_name=PYTHON_NAME, **kwargs):
+#------------------------------------------------
+    case = Path(workdir)/'CASE'
+    return Runner(name=name, app_name=app_name, case=case, cmd=cmd, verbose=0,
+                  ext_iface=('.iface', '03d'), ext_OK=('.OK',), **kwargs)
+
+
+#------------------------------------------------
+def bench_start(workdir, repeat):
+#------------------------------------------------
+    # Runner.start() includes the Popen call and the process discovery
+    configs = {
+        'plain': sim_cmd('--steps', 0, '--linger', 30),
+        'children_1': sim_cmd('--name', 'launcher', '--children', 1, '--child-name', 'fakesim', '--steps', 0, '--linger', 30),
+        'children_4': sim_cmd('--name', 'launcher', '--children', 4, '--child-name', 'fakesim', '--steps', 0, '--linger', 30),
+        'mpirun_4': sim_cmd('--steps', 0, '--linger', 30, np=4),
+    }
+    results = {}
+    for name, cmd in configs.items():
+        times = []
+        for _ in range(repeat):
+            runner = make_runner(workdir, cmd, app_name=PYTHON_NAME if name == 'plain' else 'fakesim')
+            start = time.perf_counter()
+            runner.start()
+            times.append(time.perf_counter() - start)
+            runner.kill(v=5)
+        results[name] = stats(times)
+    return results
+
+
+#------------------------------------------------
+def bench_discovery(workdir, repeat):
+#------------------------------------------------
+    # Time from the start of the child process until it is found
+    results = {}
+    for delay in (0, 0.05, 0.2):
+        late = []
+        for _ in range(repeat):
+            popen = subprocess.Popen(sim_cmd('--name', 'launcher', '--children', 1, '--child-name', 'fakesim',
+                                             '--child-delay', delay, '--steps', 0, '--linger', 30))
+            parent = Process(pid=popen.pid, app_name='fakesim')
+            children, found = parent.get_children()
+            late.append((found or 0) - delay)
+            popen.kill()
+            popen.wait()
+            for child in children:
+                child.process().kill()
+        results[f'delay_{delay}'] = stats(late)
+    return results
+
+
+#------------------------------------------------
+def bench_suspend(workdir, repeat, sizes):
+#------------------------------------------------
+    results = {}
+    for size in sizes:
+        popens = [subprocess.Popen(sim_cmd('worker')) for _ in range(size)]
+        group = ProcessGroup([Process(pid=p.pid) for p in popens])
+        rounds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            group.suspend(check=True)
+            group.resume(check=True)
+            rounds.append(time.perf_counter() - start)
+        results[f'procs_{size}'] = stats(rounds)
+        for popen in popens:
+            popen.kill()
+        for popen in popens:
+            popen.wait()
+    return results
+
+
+#------------------------------------------------
+def bench_wait(workdir, repeat):
+#------------------------------------------------
+    # Latency from the creation of the file until wait_for_files() returns
+    runner = make_runner(workdir, sim_cmd('--steps', 0, '--linger', 60))
+    runner.start()
+    path = Path(workdir)/'wake.flag'
+    latency = []
+    for _ in range(repeat):
+        created = []
+        def create():
+            time.sleep(random.uniform(0.005, 0.05))
+            path.touch()
+            created.append(time.perf_counter())
+        thread = threading.Thread(target=create)
+        thread.start()
+        runner.wait_for_files(path, v=5)
+        latency.append(time.perf_counter() - (created[0] if created else time.perf_counter()))
+        thread.join()
+        path.unlink()
+    runner.kill(v=5)
+    return {'latency': stats(latency)}
+
+
+#------------------------------------------------
+def bench_handshake(workdir, repeat):
+#------------------------------------------------
+    # One coupling step: send to the simulator and wait for its reply
+    results = {}
+    for transport in ('file', 'pipe', 'fifo', 'socket'):
+        args = ['--steps', repeat]
+        if transport == 'file':
+            args += ['--iface', f'{workdir}/CASE.iface{{n:03d}}', '--ok', f'{workdir}/CASE.OK']
+        runner = make_runner(workdir, sim_cmd(*args), transport=transport)
+        runner.start()
+        rounds = []
+        for n in range(repeat):
+            start = time.perf_counter()
+            runner.send(n=n)
+            runner.receive(v=5)
+            rounds.append(time.perf_counter() - start)
+        runner.kill(v=5)
+        results[transport] = stats(rounds)
+    return results
+
+
+#------------------------------------------------
+def bench_time(workdir, repeat, sizes_mb):
+#------------------------------------------------
+    # Cost of Runner.time() after the log has grown by 'size' MB, and when it has not grown
+    runner = make_runner(workdir, sim_cmd(), time_regex=r'TIME = ([\d.]+)')
+    runner.prepare_start()
+    line = 'x'*79 + '\n'
+    results = {}
+    total = 0
+    for size in sizes_mb:
+        block = line*(size*1024*1024//len(line)) + 'TIME = 1.0\n'
+        grown, idle = [], []
+        for _ in range(repeat):
+            runner.log.write(block)
+            total += len(block)
+            start = time.perf_counter()
+            runner.time()
+            grown.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            runner.time()
+            idle.append(time.perf_counter() - start)
+        results[f'append_{size}MB'] = {'grown': stats(grown), 'unchanged': stats(idle), 'log_MB': total/2**20}
+    runner.close()
+    return results
+
+
+#------------------------------------------------
+def bench_idle(workdir, seconds):
+#------------------------------------------------
+    # CPU time of the controller (this process) per second of waiting
+    results = {}
+    runner = make_runner(workdir, sim_cmd('--steps', 0, '--linger', 3*seconds + 30))
+    runner.start()
+    waits = {
+        'wait_for_files': lambda: runner.wait_for_files(Path(workdir)/'never', wait_min=seconds/60, v=5),
+        'wait_for_polling': lambda: runner.wait_for((Path(workdir)/'never').is_file, wait_min=seconds/60, v=5),
+    }
+    for name, func in waits.items():
+        cpu, wall = time.process_time(), time.perf_counter()
+        try:
+            func()
+        except SystemError:
+            pass
+        results[name] = {'cpu_per_second': (time.process_time() - cpu)/(time.perf_counter() - wall)}
+    runner.kill(v=5)
+    return results
+
+
+#------------------------------------------------
+def git_commit():
+#------------------------------------------------
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return None
+
+
+#------------------------------------------------
+def main(argv=None):
+#------------------------------------------------
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default='bench_results.json', help='JSON result file')
+    parser.add_argument('--only', help='Comma separated list of benchmarks')
+    parser.add_argument('--quick', action='store_true', help='Fewer repetitions and sizes')
+    args = parser.parse_args(argv)
+
+    repeat = 3 if args.quick else 20
+    benchmarks = {
+        'start': lambda w: bench_start(w, repeat=repeat),
+        'discovery': lambda w: bench_discovery(w, repeat=repeat),
+        'suspend': lambda w: bench_suspend(w, repeat=repeat, sizes=(1, 16) if args.quick else (1, 4, 16, 64, 256)),
+        'wait': lambda w: bench_wait(w, repeat=repeat),
+        'handshake': lambda w: bench_handshake(w, repeat=10*repeat),
+        'time': lambda w: bench_time(w, repeat=repeat, sizes_mb=(1,) if args.quick else (1, 8, 64)),
+        'idle': lambda w: bench_idle(w, seconds=1 if args.quick else 5),
+    }
+    selected = args.only.split(',') if args.only else list(benchmarks)
+    unknown = set(selected) - set(benchmarks)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    results = {}
+    for name in selected:
+        workdir = tempfile.mkdtemp(prefix=f'proclib-bench-{name}-')
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        print(f'{name} ...', end=' ', flush=True)
+        start = time.perf_counter()
+        try:
+            results[name] = benchmarks[name](workdir)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f'{time.perf_counter() - start:.1f} sec')
+
+    output = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'quick': args.quick,
+        'results': results,
+    }
+    Path(args.out).write_text(json.dumps(output, indent=1))
+    print(f'Results saved in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
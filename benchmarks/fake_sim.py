@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Stand-in for a coupled simulator, used by the benchmarks.
+
+  fake_sim.py [options]                     the simulator
+  fake_sim.py mpirun --np N [options]       an 'mpirun'-like launcher that starts N ranks
+  fake_sim.py worker                        an idle process
+
+The simulator writes 'TIME = <t>' tags to stdout. With --iface and --ok it
+waits for the interface file of each step, deletes it and creates the
+OK-file. If PROCLIB_TRANSPORT is set (pipe, fifo or socket) the handshake
+is done by messages instead. With --children it starts named child
+processes after --child-delay seconds and waits for them. The ranks started
+by the launcher are named 'fakesim'.
+"""
+import os
+import sys
+import time
+import socket
+import ctypes
+import argparse
+import subprocess
+
+
+PR_SET_NAME = 15
+
+
+#------------------------------------------------
+def set_name(name):
+#------------------------------------------------
+    # Set the process name (comm) seen in /proc and by psutil
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.prctl(PR_SET_NAME, name.encode()[:15], 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+
+#------------------------------------------------
+def orphaned(ppid):
+#------------------------------------------------
+    return os.getppid() != ppid
+
+
+#------------------------------------------------
+def worker(args):
+#------------------------------------------------
+    # Idle until the parent is gone
+    ppid = os.getppid()
+    while not orphaned(ppid):
+        time.sleep(0.05)
+
+
+#------------------------------------------------
+def spawn(args, argv, n):
+#------------------------------------------------
+    return [subprocess.Popen([sys.executable, __file__, *argv]) for _ in range(n)]
+
+
+#------------------------------------------------
+def mpirun(args, rest):
+#------------------------------------------------
+    set_name('mpirun')
+    ranks = [subprocess.Popen([sys.executable, __file__, '--name', 'fakesim', *rest, '--rank', str(i)])
+             for i in range(args.np)]
+    code = 0
+    for rank in ranks:
+        code = rank.wait() or code
+    return code
+
+
+#====================================================================================
+class Channel:
+#====================================================================================
+    # The program side of the proclib transports
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, args):
+    #--------------------------------------------------------------------------------
+        self.args = args
+        kind, _, address = os.environ.get('PROCLIB_TRANSPORT', 'file:').partition(':')
+        self.kind = kind
+        if kind == 'pipe':
+            self.rd, self.wr = sys.stdin.buffer, os.fdopen(int(address), 'wb', 0)
+        elif kind == 'fifo':
+            to_app, from_app = address.split(',')
+            self.wr = open(from_app, 'wb', 0)
+            self.rd = open(to_app, 'rb', 0)
+        elif kind == 'socket':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(address)
+            self.rd, self.wr = sock.makefile('rb', 0), sock.makefile('wb', 0)
+
+    #--------------------------------------------------------------------------------
+    def receive(self, n):
+    #--------------------------------------------------------------------------------
+        # Return False if the controller is gone
+        if self.kind == 'file':
+            path = self.args.iface.format(n=n)
+            while not os.path.exists(path):
+                time.sleep(self.args.poll)
+            os.remove(path)
+            return True
+        return bool(self.rd.readline())
+
+    #--------------------------------------------------------------------------------
+    def reply(self, n):
+    #--------------------------------------------------------------------------------
+        if self.kind == 'file':
+            path = self.args.ok.format(n=n)
+            with open(path + '.tmp', 'w') as file:
+                file.write(f'{n}\n')
+            os.replace(path + '.tmp', path)
+        else:
+            self.wr.write(f'{n}\n'.encode())
+
+
+#------------------------------------------------
+def simulate(args):
+#------------------------------------------------
+    if args.name:
+        set_name(args.name)
+    children = []
+    if args.children and not args.rank:
+        time.sleep(args.child_delay)
+        children = spawn(args, ['worker', '--name', args.child_name], args.children)
+    if args.rank:
+        # Only rank 0 talks to the controller
+        worker(args)
+        return 0
+    channel = Channel(args) if (args.iface or 'PROCLIB_TRANSPORT' in os.environ) else None
+    filler = 'x'*max(args.line_bytes - 1, 0) + '\n'
+    t = 0.0
+    for n in range(args.steps):
+        if channel and not channel.receive(n):
+            break
+        if args.work:
+            end = time.perf_counter() + args.work
+            while time.perf_counter() < end:
+                pass
+        t += args.dt
+        sys.stdout.write(filler*args.lines + f'TIME = {t:.6f}\n')
+        sys.stdout.flush()
+        if channel:
+            channel.reply(n)
+    if args.linger:
+        time.sleep(args.linger)
+    for child in children:
+        child.kill()
+        child.wait()
+    return 0
+
+
+#------------------------------------------------
+def main(argv=None):
+#------------------------------------------------
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--name', help='Process name (default: the interpreter name)')
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--dt', type=float, default=1.0, help='Simulated time per step')
+    parser.add_argument('--work', type=float, default=0, help='Seconds of busy work per step')
+    parser.add_argument('--lines', type=int, default=0, help='Filler lines written per step')
+    parser.add_argument('--line-bytes', type=int, default=80)
+    parser.add_argument('--iface', help="Interface file, e.g. 'case.iface{n:03d}'")
+    parser.add_argument('--ok', help="OK-file, e.g. 'case.OK'")
+    parser.add_argument('--poll', type=float, default=0.001, help='Seconds between interface file checks')
+    parser.add_argument('--children', type=int, default=0)
+    parser.add_argument('--child-name', default='fakechild')
+    parser.add_argument('--child-delay', type=float, default=0)
+    parser.add_argument('--linger', type=float, default=0, help='Seconds to stay alive after the last step')
+    parser.add_argument('--rank', type=int, default=0, help=argparse.SUPPRESS)
+    if argv and argv[0] == 'worker':
+        args = parser.parse_args(argv[1:])
+        if args.name:
+            set_name(args.name)
+        return worker(args)
+    if argv and argv[0] == 'mpirun':
+        launcher = argparse.ArgumentParser()
+        launcher.add_argument('--np', type=int, default=1)
+        args, rest = launcher.parse_known_args(argv[1:])
+        return mpirun(args, rest)
+    return simulate(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
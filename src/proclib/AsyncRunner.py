@@ -0,0 +1,204 @@
+import asyncio
+from pathlib import Path
+
+from proclib.Runner import Runner, loop_steps, FILE_CHECK_PAUSE, EXIT_CHECK_PAUSE
+from proclib.ProcessGroup import TERM_GRACE, KILL_TIMEOUT
+from proclib.Watcher import watch_files
+from proclib.Wait import Backoff
+from proclib.Trace import traced
+
+
+#====================================================================================
+class AsyncRunner(Runner):                                             # AsyncRunner
+#====================================================================================
+    """
+
+    Runner for use with asyncio, so that many simulations can be driven
+    from one event loop. The program is started with
+    asyncio.create_subprocess_exec and all waits are awaitable.
+    Execution is controlled by the same interface- and OK-files as Runner.
+
+    Initialization:
+    AsyncRunner(...), same arguments as Runner
+
+    Coroutines:
+      start()
+      wait_for(func)
+      wait_for_files(*files)
+      wait_for_time(time)
+      receive()
+      wait_for_process_to_finish()
+      suspend()
+      resume()
+      quit()
+      kill()
+
+    """
+
+    @traced
+    #--------------------------------------------------------------------------------
+    async def start(self, error_func=None):                            # AsyncRunner
+    #--------------------------------------------------------------------------------
+        self.popen = await asyncio.create_subprocess_exec(*self.cmd, **self.prepare_start())
+        self.enter_cgroup()
+        self.stdin = self.popen.stdin
+        if self.output:
+            self._drain = asyncio.create_task(self.output.drain_async(self.popen.stdout, log=self.log))
+        await asyncio.to_thread(self.transport.connect, self.popen)
+        # The child process search scans /proc and is done in a worker thread
+        await asyncio.to_thread(self.set_processes, error_func=error_func)
+        self.start_suspend_timer()
+
+    #--------------------------------------------------------------------------------
+    async def wait_for(self, func, *args, timer=False, wait_min=None, pause=0.01, v=2, error=None,
+                       raise_error=False, log=None, loop_func=None, func_name=None, sleep_func=asyncio.sleep,
+                       strategy=None, **kwargs):                       # AsyncRunner
+    #--------------------------------------------------------------------------------
+        # Same as Runner.wait_for, but the pause between checks is awaited
+        strategy, timeout, loop_func, func_name = self._wait_for_setup(func, wait_min, pause, v, loop_func,
+                                                                       func_name, strategy, kwargs)
+        with self.tracer.span('wait_for', func=func_name, n=self.n) as span:
+            n = await async_loop_until(func, *args, timeout=timeout, strategy=strategy, loop_func=loop_func,
+                                       sleep_func=sleep_func, iteration=self._iteration, **kwargs)
+            span['loops'] = n
+        return self._wait_for_result(n, strategy, timer, wait_min, v, error, raise_error, log, func_name)
+
+    @traced
+    #--------------------------------------------------------------------------------
+    async def wait_for_files(self, *files, wait_min=None, log=None, pause=FILE_CHECK_PAUSE, **kwargs):  # AsyncRunner
+    #--------------------------------------------------------------------------------
+        # With inotify the event loop is woken by the watcher file descriptor,
+        # otherwise the files are polled with an awaited backoff
+        paths = [Path(f) for f in files]
+        with self.timed('wait'), watch_files(*paths) as watcher:
+            sleep_func = self._watcher_sleep(watcher)
+            try:
+                for path in paths:
+                    func_name = f'Path({path.name}).is_file'
+                    await self.wait_for(path.is_file, wait_min=wait_min, pause=pause, sleep_func=sleep_func,
+                                        raise_error=True, error=f'{path} is missing', func_name=func_name, **kwargs)
+                    if callable(log):
+                        log(f'{path.name} exists')
+            finally:
+                if hasattr(watcher, 'fileno'):
+                    asyncio.get_running_loop().remove_reader(watcher.fileno())
+
+    @traced
+    #--------------------------------------------------------------------------------
+    async def receive(self, wait_min=None, pause=FILE_CHECK_PAUSE, **kwargs):  # AsyncRunner
+    #--------------------------------------------------------------------------------
+        # Same as Runner.receive, the event loop is woken by the pipe/socket or the file watcher
+        with self.timed('wait'), self.transport.waiting() as waiter:
+            sleep_func = self._watcher_sleep(waiter)
+            try:
+                await self.wait_for(self.transport.ready, wait_min=wait_min, pause=pause, sleep_func=sleep_func,
+                                    raise_error=True, error=f'No reply from {self.name}', func_name='transport.ready', **kwargs)
+            finally:
+                if hasattr(waiter, 'fileno'):
+                    asyncio.get_running_loop().remove_reader(waiter.fileno())
+        message = self.transport.take()
+        if message is None:
+            self.unexpected_stop_error()
+        return message
+
+    #--------------------------------------------------------------------------------
+    def _watcher_sleep(self, watcher):                                 # AsyncRunner
+    #--------------------------------------------------------------------------------
+        # Return a coroutine function that sleeps until the watcher has events or timeout
+        if not hasattr(watcher, 'fileno'):
+            backoff = Backoff(start=1e-3, cap=0.05)
+            async def poll(timeout):
+                left = timeout
+                while left > 0 and not watcher.wait(0):
+                    pause = min(backoff.pause(), left)
+                    await asyncio.sleep(pause)
+                    left -= pause
+            return poll
+        event = asyncio.Event()
+        asyncio.get_running_loop().add_reader(watcher.fileno(), event.set)
+        async def wait(timeout):
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            event.clear()
+            # Consume the events
+            watcher.wait(0)
+        return wait
+
+    #--------------------------------------------------------------------------------
+    async def wait_for_time(self, time, wait_min=None, strategy=None, v=2, **kwargs):  # AsyncRunner
+    #--------------------------------------------------------------------------------
+        # Wait until the simulated time in the log reaches 'time'
+        strategy = strategy or Backoff(start=1e-3, cap=0.5)
+        return await self.wait_for(lambda: self.time() >= time, wait_min=wait_min, strategy=strategy, v=v,
+                                   func_name=f'time>={time}', **kwargs)
+
+    #--------------------------------------------------------------------------------
+    async def wait_for_process_to_finish(self, v=2, wait_min=None, pause=None, loop_func=None, msg=None,
+                                         strategy=None):                 # AsyncRunner
+    #--------------------------------------------------------------------------------
+        # Await the exit of the started process, no polling. This also reaps the process.
+        # As in Runner, loop_func is called every pause seconds while waiting.
+        msg = msg or 'Waiting for parent process to finish'
+        self._print(msg, v=v)
+        exit_task = asyncio.ensure_future(self.popen.wait())
+        async def sleep_func(timeout):
+            try:
+                await asyncio.wait_for(asyncio.shield(exit_task), timeout)
+            except asyncio.TimeoutError:
+                pass
+        try:
+            success = await self.wait_for(exit_task.done, pause=pause or EXIT_CHECK_PAUSE, wait_min=wait_min,
+                                          loop_func=loop_func, strategy=strategy, sleep_func=sleep_func, func_name='exit')
+        finally:
+            exit_task.cancel()
+        if not success:
+            self._print('', tag='')
+            self._print(f'process did not finish within {wait_min:.2f} minutes and will be killed', v=v)
+            self._print([p.name() for p in self.active if p])
+            await self.kill()
+
+    #--------------------------------------------------------------------------------
+    async def suspend(self, check=False, v=2, strategy=None):         # AsyncRunner
+    #--------------------------------------------------------------------------------
+        # The signal fan-out and confirmation is done in a worker thread
+        await asyncio.to_thread(super().suspend, check=check, v=v, strategy=strategy)
+
+    #--------------------------------------------------------------------------------
+    async def resume(self, check=False, v=2, strategy=None):          # AsyncRunner
+    #--------------------------------------------------------------------------------
+        await asyncio.to_thread(super().resume, check=check, v=v, strategy=strategy)
+
+    #--------------------------------------------------------------------------------
+    async def quit(self, v=1, loop_func=lambda:None, **kwargs):        # AsyncRunner
+    #--------------------------------------------------------------------------------
+        self._print('', tag='', v=v)
+        self._print('Quitting', v=v)
+        await self.resume()
+        await self.wait_for_process_to_finish(msg='Waiting for process to quit', wait_min=1, pause=60, loop_func=loop_func)
+        self.close()
+        self._print('Finished', v=v)
+
+    #--------------------------------------------------------------------------------
+    async def kill(self, v=2, grace=TERM_GRACE, timeout=KILL_TIMEOUT):  # AsyncRunner
+    #--------------------------------------------------------------------------------
+        await asyncio.to_thread(super().kill, v=v, grace=grace, timeout=timeout)
+        if self.popen and self.popen.returncode is None:
+            await self.popen.wait()
+
+
+#------------------------------------------------
+async def async_loop_until(func, *args, sleep_func=asyncio.sleep, **kwargs):
+#------------------------------------------------
+    # Same as loop_until, but the pause is awaited
+    steps = loop_steps(func, *args, **kwargs)
+    try:
+        while True:
+            if pause := next(steps):
+                await sleep_func(pause)
+            else:
+                # Let other tasks run while spinning
+                await asyncio.sleep(0)
+    except StopIteration as stop:
+        return stop.value
@@ -0,0 +1,255 @@
+import os
+import sys
+import traceback
+from threading import Thread, Lock, Event
+
+from proclib.Follower import bytes_regex
+
+
+CHUNK_SIZE = 64*1024     # Bytes read from the pipe at a time
+TAIL_SIZE = 64*1024      # Bytes of recent output kept in memory
+MAX_LINE = 1024*1024     # Incomplete lines longer than this are scanned without waiting for the newline
+
+
+#====================================================================================
+class Pattern:
+#====================================================================================
+    # A registered regex with its match count, last converted value and callback.
+    # Exceptions raised by the callback or convert are counted in 'errors', the
+    # first is reported, and the scan goes on so that the output is still drained.
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, name, regex, callback=None, convert=None):           # Pattern
+    #--------------------------------------------------------------------------------
+        self.name = name
+        self.regex = bytes_regex(regex)
+        self.callback = callback
+        self.convert = convert
+        self.reset()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                     # Pattern
+    #--------------------------------------------------------------------------------
+        return f'<Pattern({self.name}, count={self.count}, last={self.last})>'
+
+    #--------------------------------------------------------------------------------
+    def reset(self):                                                        # Pattern
+    #--------------------------------------------------------------------------------
+        self.count = 0
+        self.last = None
+        self.errors = 0
+        self.error = None
+
+    #--------------------------------------------------------------------------------
+    def scan(self, data):                                                   # Pattern
+    #--------------------------------------------------------------------------------
+        match = None
+        for match in self.regex.finditer(data):
+            self.count += 1
+            if self.callback:
+                try:
+                    self.callback(match)
+                except Exception as error:
+                    self._failed(error, 'callback')
+        if match:
+            value = match.group(1 if self.regex.groups else 0)
+            try:
+                self.last = self.convert(value) if self.convert else value
+            except Exception as error:
+                self._failed(error, 'convert')
+
+    #--------------------------------------------------------------------------------
+    def _failed(self, error, where):                                        # Pattern
+    #--------------------------------------------------------------------------------
+        self.errors += 1
+        self.error = error
+        if self.errors == 1:
+            print(f'WARNING {where} of output pattern {self.name!r} failed, the output is still drained:', 
+                  file=sys.stderr)
+            traceback.print_exc()
+
+
+#====================================================================================
+class OutputCapture:
+#====================================================================================
+    """
+    Drain the output pipe of a program in large chunks, tee it to the
+    log-file, keep the most recent output in memory and scan complete lines
+    for registered patterns as they arrive. Callbacks are called from the
+    reader thread (or the asyncio task if drain_async() is used).
+
+    Initialization:
+    OutputCapture(tail=TAIL_SIZE, chunk=CHUNK_SIZE)
+
+    Methods:
+      watch(name, regex, callback=None, convert=None)
+      value(name, default=None)
+      count(name)
+      errors(name)
+      start(stream, log=None)
+      drain_async(stream, log=None)
+      feed(data)
+      tail(size=None)
+      join(timeout=None)
+      detach()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, tail=TAIL_SIZE, chunk=CHUNK_SIZE):             # OutputCapture
+    #--------------------------------------------------------------------------------
+        self.patterns = {}
+        self.tail_size = tail
+        self.chunk = chunk
+        self.log = None
+        self.nbytes = 0
+        self._tail = bytearray()
+        self._carry = b''
+        self._lock = Lock()
+        self._done = Event()
+        self._thread = None
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                               # OutputCapture
+    #--------------------------------------------------------------------------------
+        return f'<OutputCapture({", ".join(self.patterns)}, bytes={self.nbytes})>'
+
+    #--------------------------------------------------------------------------------
+    def watch(self, name, regex, callback=None, convert=None):        # OutputCapture
+    #--------------------------------------------------------------------------------
+        # Register a pattern. The callback is called with each re.Match, the
+        # value of the last match is group 1 (or the whole match) passed through convert
+        self.patterns[name] = Pattern(name, regex, callback=callback, convert=convert)
+        return self.patterns[name]
+
+    #--------------------------------------------------------------------------------
+    def value(self, name, default=None):                              # OutputCapture
+    #--------------------------------------------------------------------------------
+        last = self.patterns[name].last
+        return default if last is None else last
+
+    #--------------------------------------------------------------------------------
+    def count(self, name):                                            # OutputCapture
+    #--------------------------------------------------------------------------------
+        return self.patterns[name].count
+
+    #--------------------------------------------------------------------------------
+    def errors(self, name):                                           # OutputCapture
+    #--------------------------------------------------------------------------------
+        # Number of exceptions raised by the callback or convert of the pattern
+        return self.patterns[name].errors
+
+    #--------------------------------------------------------------------------------
+    def reset(self, log=None):                                        # OutputCapture
+    #--------------------------------------------------------------------------------
+        self.log = log
+        self.nbytes = 0
+        self._tail = bytearray()
+        self._carry = b''
+        self._done.clear()
+        for pattern in self.patterns.values():
+            pattern.reset()
+
+    #--------------------------------------------------------------------------------
+    def start(self, stream, log=None):                                # OutputCapture
+    #--------------------------------------------------------------------------------
+        # Drain 'stream' (a binary file object or file descriptor) in a daemon thread
+        self.reset(log)
+        fd = stream if isinstance(stream, int) else stream.fileno()
+        self._thread = Thread(target=self._read, args=(fd,), name='OutputCapture', daemon=True)
+        self._thread.start()
+        return self
+
+    #--------------------------------------------------------------------------------
+    def _read(self, fd):                                              # OutputCapture
+    #--------------------------------------------------------------------------------
+        try:
+            while data := os.read(fd, self.chunk):
+                self.feed(data)
+        except OSError:
+            pass
+        finally:
+            self.finish()
+
+    #--------------------------------------------------------------------------------
+    async def drain_async(self, stream, log=None):                    # OutputCapture
+    #--------------------------------------------------------------------------------
+        # Same as start(), but drains an asyncio StreamReader
+        self.reset(log)
+        try:
+            while data := await stream.read(self.chunk):
+                self.feed(data)
+        finally:
+            self.finish()
+
+    #--------------------------------------------------------------------------------
+    def feed(self, data):                                             # OutputCapture
+    #--------------------------------------------------------------------------------
+        with self._lock:
+            if self.log:
+                try:
+                    self.log.write(data)
+                    self.log.flush()
+                except (OSError, ValueError) as error:
+                    # Failing or closed log-file, the output is still drained and kept in the tail
+                    print(f'WARNING Output is no longer written to the log-file: {error}', file=sys.stderr)
+                    self.log = None
+            self.nbytes += len(data)
+            self._tail += data
+            if len(self._tail) > 2*self.tail_size:
+                del self._tail[:-self.tail_size]
+        # Only complete lines are scanned, the rest is carried to the next chunk
+        data = self._carry + data
+        end = data.rfind(b'\n') + 1
+        if not end and len(data) > MAX_LINE:
+            end = len(data)
+        self._carry = data[end:]
+        if end:
+            self._scan(data[:end])
+
+    #--------------------------------------------------------------------------------
+    def _scan(self, data):                                            # OutputCapture
+    #--------------------------------------------------------------------------------
+        for pattern in self.patterns.values():
+            pattern.scan(data)
+
+    #--------------------------------------------------------------------------------
+    def finish(self):                                                 # OutputCapture
+    #--------------------------------------------------------------------------------
+        # End of output, scan the last incomplete line
+        if self._carry:
+            self._scan(self._carry)
+            self._carry = b''
+        with self._lock:
+            if self.log:
+                try:
+                    self.log.flush()
+                except (OSError, ValueError):
+                    pass
+        self._done.set()
+
+    #--------------------------------------------------------------------------------
+    def detach(self):                                                 # OutputCapture
+    #--------------------------------------------------------------------------------
+        # Stop writing to the log-file, e.g. before it is closed
+        with self._lock:
+            self.log = None
+
+    #--------------------------------------------------------------------------------
+    def done(self):                                                   # OutputCapture
+    #--------------------------------------------------------------------------------
+        return self._done.is_set()
+
+    #--------------------------------------------------------------------------------
+    def join(self, timeout=None):                                     # OutputCapture
+    #--------------------------------------------------------------------------------
+        # Wait for the end of the output, returns False on timeout
+        return self._done.wait(timeout)
+
+    #--------------------------------------------------------------------------------
+    def tail(self, size=None):                                        # OutputCapture
+    #--------------------------------------------------------------------------------
+        # The most recent output as text
+        size = min(size or self.tail_size, self.tail_size)
+        with self._lock:
+            data = bytes(self._tail[-size:])
+        return data.decode(errors='replace')
@@ -0,0 +1,278 @@
+import os
+import errno
+import select
+from pathlib import Path
+from time import monotonic
+
+import psutil
+
+
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+FREEZE_TIMEOUT = 5.0           # Seconds to wait for the frozen state in cgroup.events
+CONTROLLERS = ('cpu', 'memory', 'io')
+
+
+#------------------------------------------------
+def cgroup_path(pid):
+#------------------------------------------------
+    # The cgroup v2 directory of process pid, None if not on a unified hierarchy
+    try:
+        with open(f'/proc/{pid}/cgroup') as file:
+            for line in file:
+                if line.startswith('0::'):
+                    path = line[3:].strip().lstrip('/')
+                    for root in (CGROUP_ROOT, CGROUP_ROOT/'unified'):
+                        if (root/'cgroup.controllers').exists():
+                            return root/path
+    except OSError:
+        pass
+    return None
+
+
+#------------------------------------------------
+def read_keys(path):
+#------------------------------------------------
+    # 'key value' lines as a dict of ints
+    values = {}
+    try:
+        for line in Path(path).read_text().splitlines():
+            key, _, value = line.partition(' ')
+            if value.strip().isdigit():
+                values[key] = int(value)
+    except OSError:
+        pass
+    return values
+
+
+#------------------------------------------------
+def enable_controllers(parent, move_self=False):
+#------------------------------------------------
+    # Enable the CONTROLLERS for the children of parent, return None or the reason
+    # they could not be enabled. A cgroup with processes can not enable controllers
+    # (no internal processes rule). Only with move_self=True, and if this controller
+    # is alone in parent, it is moved to a leaf 'proclib-<pid>' first. It is not moved
+    # back and the leaf is not removed, as parent then has controllers enabled.
+    try:
+        available = set((parent/'cgroup.controllers').read_text().split())
+        enabled = set((parent/'cgroup.subtree_control').read_text().split())
+    except OSError as error:
+        return str(error)
+    missing = [c for c in CONTROLLERS if c in available and c not in enabled]
+    if not missing:
+        return None
+    try:
+        procs = [int(p) for p in (parent/'cgroup.procs').read_text().split()]
+        if procs and not move_self:
+            return f'{parent} has processes, the {"/".join(missing)} controllers can not be enabled'
+        if procs == [os.getpid()]:
+            leaf = parent/f'proclib-{os.getpid()}'
+            leaf.mkdir(exist_ok=True)
+            (leaf/'cgroup.procs').write_text('0')
+        (parent/'cgroup.subtree_control').write_text(' '.join(f'+{c}' for c in missing))
+    except OSError as error:
+        if error.errno == errno.EBUSY:
+            return f'{parent} has other processes, the {"/".join(missing)} controllers can not be enabled'
+        return str(error)
+    return None
+
+
+#====================================================================================
+class Cgroup:
+#====================================================================================
+    """
+    A cgroup v2 leaf for the processes of one run. Processes forked inside
+    the cgroup are members as well, so freeze() stops the whole tree in one
+    write, however many processes there are. Pass enter() as preexec_fn so
+    that the program is in the cgroup before it is executed. The parent is
+    $PROCLIB_CGROUP or the cgroup of this controller, and must be delegated
+    to (writable by) the user; create() returns None otherwise.
+
+    The cpu/memory/io accounting needs the controllers enabled in the
+    parent, which a cgroup with processes of its own can not do. Then
+    accounting is False and the reason is in accounting_error, unless
+    move_self=True and the controller is alone in the parent: it is then
+    moved, for good, to a leaf of its own (see enable_controllers()).
+
+    Initialization:
+    Cgroup.create(name, parent=None, move_self=False)
+
+    Methods:
+      enter()
+      add(pid)
+      pids()
+      freeze(wait=True, timeout=FREEZE_TIMEOUT)
+      thaw(wait=True, timeout=FREEZE_TIMEOUT)
+      is_frozen()
+      stats()
+      kill()
+      remove()
+    """
+
+    @classmethod
+    #--------------------------------------------------------------------------------
+    def create(cls, name, parent=None, move_self=False):                        # Cgroup
+    #--------------------------------------------------------------------------------
+        parent = parent or os.environ.get('PROCLIB_CGROUP') or cgroup_path(os.getpid())
+        if not parent:
+            return None
+        parent = Path(parent)
+        if parent.name == f'proclib-{os.getpid()}':
+            # The leaf of this controller, see enable_controllers()
+            parent = parent.parent
+        path = parent/f'proclib-{os.getpid()}-{name}'
+        try:
+            path.mkdir(exist_ok=True)
+        except OSError:
+            return None
+        if not os.access(path/'cgroup.procs', os.W_OK) or not (path/'cgroup.freeze').exists():
+            try:
+                path.rmdir()
+            except OSError:
+                pass
+            return None
+        cgroup = cls(path)
+        cgroup.accounting_error = enable_controllers(parent, move_self=move_self)
+        cgroup.accounting = cgroup.accounting_error is None
+        return cgroup
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, path):                                                   # Cgroup
+    #--------------------------------------------------------------------------------
+        self.path = Path(path)
+        self.accounting = False
+        self.accounting_error = None
+        # Encoded here, enter() runs in the forked child before exec
+        self._procs = os.fsencode(self.path/'cgroup.procs')
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                         # Cgroup
+    #--------------------------------------------------------------------------------
+        return f'<Cgroup({self.path})>'
+
+    #--------------------------------------------------------------------------------
+    def enter(self):                                                            # Cgroup
+    #--------------------------------------------------------------------------------
+        # Move the calling process into the cgroup. Used as preexec_fn of Popen, 
+        # errors are ignored there and the caller checks pids() after the start.
+        try:
+            fd = os.open(self._procs, os.O_WRONLY)
+            try:
+                os.write(fd, b'0')
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    #--------------------------------------------------------------------------------
+    def add(self, pid, children=True):                                          # Cgroup
+    #--------------------------------------------------------------------------------
+        # Move a running process, and with children=True its descendants, into the
+        # cgroup. Processes forked while this runs can be missed, prefer enter().
+        pids = [pid]
+        if children:
+            try:
+                pids += [p.pid for p in psutil.Process(pid).children(recursive=True)]
+            except psutil.NoSuchProcess:
+                pass
+        for pid in pids:
+            try:
+                (self.path/'cgroup.procs').write_text(str(pid))
+            except ProcessLookupError:
+                pass
+
+    #--------------------------------------------------------------------------------
+    def pids(self):                                                             # Cgroup
+    #--------------------------------------------------------------------------------
+        try:
+            return [int(p) for p in (self.path/'cgroup.procs').read_text().split()]
+        except OSError:
+            return []
+
+    #--------------------------------------------------------------------------------
+    def events(self):                                                           # Cgroup
+    #--------------------------------------------------------------------------------
+        return read_keys(self.path/'cgroup.events')
+
+    #--------------------------------------------------------------------------------
+    def is_frozen(self):                                                        # Cgroup
+    #--------------------------------------------------------------------------------
+        return self.events().get('frozen') == 1
+
+    #--------------------------------------------------------------------------------
+    def _set_frozen(self, value, wait, timeout):                                # Cgroup
+    #--------------------------------------------------------------------------------
+        # Write cgroup.freeze and wait for cgroup.events to show the new state.
+        # The kernel wakes poll() (POLLPRI) on every change of cgroup.events.
+        # Return the seconds it took, or None if not confirmed in time.
+        start = monotonic()
+        (self.path/'cgroup.freeze').write_text(str(value))
+        if not wait:
+            return None
+        with open(self.path/'cgroup.events', 'rb', buffering=0) as events:
+            poller = select.poll()
+            poller.register(events, select.POLLPRI | select.POLLERR)
+            while True:
+                events.seek(0)
+                state = dict(line.split() for line in events.read().decode().splitlines())
+                if state.get('frozen') == str(value):
+                    return monotonic() - start
+                # An empty cgroup can not be frozen
+                if state.get('populated') == '0':
+                    return None
+                remaining = timeout - (monotonic() - start)
+                if remaining <= 0:
+                    return None
+                poller.poll(1000*remaining)
+
+    #--------------------------------------------------------------------------------
+    def freeze(self, wait=True, timeout=FREEZE_TIMEOUT):                        # Cgroup
+    #--------------------------------------------------------------------------------
+        return self._set_frozen(1, wait, timeout)
+
+    #--------------------------------------------------------------------------------
+    def thaw(self, wait=True, timeout=FREEZE_TIMEOUT):                          # Cgroup
+    #--------------------------------------------------------------------------------
+        return self._set_frozen(0, wait, timeout)
+
+    #--------------------------------------------------------------------------------
+    def stats(self):                                                            # Cgroup
+    #--------------------------------------------------------------------------------
+        # CPU (microseconds), memory and I/O (bytes) accounting of the run, the
+        # memory and I/O fields need the controllers enabled in the parent
+        cpu = read_keys(self.path/'cpu.stat')
+        stats = {'cpu_usec': cpu.get('usage_usec'), 'user_usec': cpu.get('user_usec'),
+                 'system_usec': cpu.get('system_usec'), 'procs': len(self.pids())}
+        for name in ('memory.current', 'memory.peak', 'memory.swap.current'):
+            try:
+                stats[name.replace('.', '_')] = int((self.path/name).read_text())
+            except (OSError, ValueError):
+                pass
+        try:
+            io = (self.path/'io.stat').read_text().split()
+            stats['io_read'] = sum(int(f[7:]) for f in io if f.startswith('rbytes='))
+            stats['io_write'] = sum(int(f[7:]) for f in io if f.startswith('wbytes='))
+        except OSError:
+            pass
+        return stats
+
+    #--------------------------------------------------------------------------------
+    def kill(self):                                                             # Cgroup
+    #--------------------------------------------------------------------------------
+        # SIGKILL all processes of the cgroup in one write (Linux >= 5.14), False if not available
+        try:
+            (self.path/'cgroup.kill').write_text('1')
+            return True
+        except OSError:
+            return False
+
+    #--------------------------------------------------------------------------------
+    def remove(self):                                                           # Cgroup
+    #--------------------------------------------------------------------------------
+        # Delete the cgroup, return False if it can not be deleted (e.g. still has processes)
+        try:
+            self.path.rmdir()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        return True
@@ -0,0 +1,106 @@
+from re import compile as re_compile, UNICODE
+from pathlib import Path
+
+
+CHUNK_SIZE = 1024*1024   # Bytes read from the log-file at a time
+OVERLAP = 1024           # Bytes kept between reads to catch matches split across chunks
+
+
+#------------------------------------------------
+def bytes_regex(regex):
+#------------------------------------------------
+    # Compiled bytes pattern of a str or bytes regex or a compiled pattern, as the 
+    # data is scanned as bytes. The flags of a compiled str pattern are kept.
+    if isinstance(regex, str):
+        regex = regex.encode()
+    elif hasattr(regex, 'pattern') and isinstance(regex.pattern, str):
+        return re_compile(regex.pattern.encode(), regex.flags & ~UNICODE)
+    return re_compile(regex)
+
+
+#====================================================================================
+class LogFollower:
+#====================================================================================
+    """
+    Follow a growing log-file and keep the last value matched by a regex.
+
+    The byte offset of the last read is remembered, so each call to update()
+    only scans the bytes appended since the previous call. Incomplete lines
+    are held back until the next read, and the tail of the scanned data is
+    rescanned to catch matches split across chunk boundaries. If the file is
+    truncated (e.g. the simulation is restarted) the follower starts over.
+
+    Initialization:
+    LogFollower(path, regex, convert=float)
+
+    Methods:
+      update(tag=None)
+      reset()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, path, regex, convert=float, chunk=CHUNK_SIZE, overlap=OVERLAP):  # LogFollower
+    #--------------------------------------------------------------------------------
+        self.path = Path(path)
+        self._regex = regex and bytes_regex(regex)
+        self._convert = convert
+        self._chunk = chunk
+        self._overlap = overlap
+        self.reset()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                 # LogFollower
+    #--------------------------------------------------------------------------------
+        return f'<LogFollower({self.path.name}, offset={self.offset}, latest={self.latest})>'
+
+    #--------------------------------------------------------------------------------
+    def reset(self):                                                    # LogFollower
+    #--------------------------------------------------------------------------------
+        self.offset = 0        # Bytes read so far
+        self.latest = None     # Last matched value
+        self._carry = b''      # Unscanned or rescan bytes from the previous read
+
+    #--------------------------------------------------------------------------------
+    def value(self, default=0):                                         # LogFollower
+    #--------------------------------------------------------------------------------
+        return default if self.latest is None else self.latest
+
+    #--------------------------------------------------------------------------------
+    def update(self, tag=None):                                         # LogFollower
+    #--------------------------------------------------------------------------------
+        # Scan new bytes and return the latest matched value (None if no match)
+        if not self._regex:
+            return self.latest
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return self.latest
+        if size < self.offset:
+            self.reset()
+        if size == self.offset:
+            return self.latest
+        tag = tag.encode() if isinstance(tag, str) else tag
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            while self.offset < size:
+                data = file.read(min(self._chunk, size - self.offset))
+                if not data:
+                    break
+                self.offset += len(data)
+                self._scan(self._carry + data, tag)
+        return self.latest
+
+    #--------------------------------------------------------------------------------
+    def _scan(self, data, tag):                                         # LogFollower
+    #--------------------------------------------------------------------------------
+        # Only complete lines are scanned, the rest is carried to the next read
+        end = data.rfind(b'\n') + 1
+        start = 0
+        if end and (tag is None or data.find(tag, 0, end) >= 0):
+            match = None
+            for match in self._regex.finditer(data, 0, end):
+                pass
+            if match:
+                self.latest = self._convert(match.group(1 if self._regex.groups else 0))
+                start = match.end()
+        self._carry = data[max(start, end - self._overlap):][-(self._chunk + self._overlap):]
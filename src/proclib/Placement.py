@@ -0,0 +1,268 @@
+import os
+from collections import Counter
+from pathlib import Path
+from contextlib import contextmanager
+try:
+    import fcntl
+    import resource
+except ImportError:
+    # Not available on Windows
+    fcntl = resource = None
+
+import psutil
+from proclib.Status import status_dir, instance_id
+
+
+NODE_DIR = Path('/sys/devices/system/node')
+# I/O class in the delayed-suspend window (psutil.IOPRIO_CLASS_IDLE on Linux)
+IDLE_IONICE = getattr(psutil, 'IOPRIO_CLASS_IDLE', None)
+SUFFIX = '.cpus'
+
+
+#------------------------------------------------
+def parse_cpulist(text):
+#------------------------------------------------
+    # '0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]
+    cpus = []
+    for part in text.strip().split(','):
+        if part:
+            first, _, last = part.partition('-')
+            cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+#------------------------------------------------
+def format_cpulist(cpus):
+#------------------------------------------------
+    # [0, 1, 2, 3, 8] -> '0-3,8'
+    parts = []
+    for cpu in sorted(cpus):
+        if parts and cpu == parts[-1][1] + 1:
+            parts[-1][1] = cpu
+        else:
+            parts.append([cpu, cpu])
+    return ','.join(f'{a}-{b}' if b > a else f'{a}' for a, b in parts)
+
+
+#------------------------------------------------
+def numa_cpus(node):
+#------------------------------------------------
+    # The CPUs of NUMA node 'node'
+    return parse_cpulist((NODE_DIR/f'node{node}'/'cpulist').read_text())
+
+
+#------------------------------------------------
+def allowed_cpus():
+#------------------------------------------------
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(psutil.cpu_count()))
+
+
+#====================================================================================
+class Placement:
+#====================================================================================
+    """
+    CPU placement and priority policy of the processes of a run.
+
+    The CPUs are the given cores, the CPUs of a NUMA node, or all CPUs we may
+    use. count CPUs (default one per process of the run) are picked among
+    them that are not taken by other runs on the node; the picks are kept as
+    claim files in the status directory and released by release(). With
+    spread=True every process gets its own CPU (e.g. one per MPI rank)
+    instead of the whole set.
+
+    nice/ionice are set at start; in the delayed-suspend window (keep_alive)
+    the I/O class is lowered to idle_ionice and restored on resume. The
+    niceness is only raised to idle_nice if given and if it can be lowered
+    again afterwards, which needs root or a large enough RLIMIT_NICE.
+
+    Initialization:
+    Placement(cores=None, numa_node=None, count=None, spread=False, nice=None, ionice=None,
+              idle_nice=None, idle_ionice=IDLE_IONICE, directory=None)
+
+    Methods:
+      allocate(name)
+      release()
+      apply(processes)
+      lower()
+      restore()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, cores=None, numa_node=None, count=None, spread=False, nice=None, ionice=None,
+                 idle_nice=None, idle_ionice=IDLE_IONICE, directory=None):         # Placement
+    #--------------------------------------------------------------------------------
+        self.cores = parse_cpulist(cores) if isinstance(cores, str) else cores
+        self.numa_node = numa_node
+        self.count = count
+        self.spread = spread
+        self.nice = nice
+        self.ionice = ionice
+        self.idle_nice = idle_nice
+        self.idle_ionice = idle_ionice
+        self.directory = Path(directory or status_dir())/'placement'
+        self.cpus = None
+        self.shared = False      # True if the CPUs overlap those of other runs
+        self.errors = []
+        self._claim = None
+        self._id = instance_id()
+        self._procs = []
+        self._saved = {}         # pid -> (nice, ionice) before lower()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                      # Placement
+    #--------------------------------------------------------------------------------
+        cpus = self.cpus and format_cpulist(self.cpus)
+        return f'<Placement(cpus={cpus}, spread={self.spread}, nice={self.nice})>'
+
+    #--------------------------------------------------------------------------------
+    def candidates(self):                                                    # Placement
+    #--------------------------------------------------------------------------------
+        allowed = allowed_cpus()
+        if self.cores is not None:
+            return [c for c in self.cores if c in allowed]
+        if self.numa_node is not None:
+            return [c for c in numa_cpus(self.numa_node) if c in allowed]
+        return allowed
+
+    @contextmanager
+    #--------------------------------------------------------------------------------
+    def _locked(self):                                                       # Placement
+    #--------------------------------------------------------------------------------
+        # Serialize the allocations of the runs on this node
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with open(self.directory/'.lock', 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    #--------------------------------------------------------------------------------
+    def claimed(self):                                                       # Placement
+    #--------------------------------------------------------------------------------
+        # Number of live runs that claim each CPU, claims of controllers that are gone are deleted
+        taken = Counter()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SUFFIX) or entry.path == str(self._claim):
+                continue
+            pid = entry.name.partition('-')[0]
+            if pid.isdigit() and psutil.pid_exists(int(pid)):
+                try:
+                    taken.update(parse_cpulist(Path(entry.path).read_text()))
+                except OSError:
+                    pass
+            else:
+                Path(entry.path).unlink(missing_ok=True)
+        return taken
+
+    #--------------------------------------------------------------------------------
+    def allocate(self, name, nprocs=1):                                      # Placement
+    #--------------------------------------------------------------------------------
+        # Pick the CPUs of run 'name' and claim them, return the CPU list. Without
+        # count the run gets one CPU per process (nprocs), so that runs do not overlap.
+        candidates = self.candidates()
+        if not candidates:
+            raise ValueError(f'No usable CPUs in {self}')
+        with self._locked():
+            taken = self.claimed()
+            free = [c for c in candidates if c not in taken]
+            count = min(self.count or max(nprocs, 1), len(candidates))
+            cpus = free[:count]
+            if len(cpus) < count:
+                # Not enough free CPUs, share the least used ones
+                used = sorted((c for c in candidates if c in taken), key=lambda c: taken[c])
+                cpus += used[:count - len(cpus)]
+            self.shared = any(c in taken for c in cpus)
+            self.cpus = sorted(cpus)
+            self._claim = self.directory/f'{os.getpid()}-{self._id}-{name}{SUFFIX}'
+            self._claim.write_text(format_cpulist(self.cpus))
+        return self.cpus
+
+    #--------------------------------------------------------------------------------
+    def release(self):                                                       # Placement
+    #--------------------------------------------------------------------------------
+        if self._claim:
+            self._claim.unlink(missing_ok=True)
+            self._claim = None
+
+    #--------------------------------------------------------------------------------
+    def _tree(self, processes):                                              # Placement
+    #--------------------------------------------------------------------------------
+        # The psutil processes and all their descendants
+        procs = {}
+        for proc in processes:
+            proc = proc.process() if hasattr(proc, 'process') else proc
+            try:
+                for p in [proc] + proc.children(recursive=True):
+                    procs.setdefault(p.pid, p)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return list(procs.values())
+
+    #--------------------------------------------------------------------------------
+    def _call(self, proc, method, *args):                                    # Placement
+    #--------------------------------------------------------------------------------
+        try:
+            getattr(proc, method)(*args)
+            return True
+        except (psutil.NoSuchProcess, ProcessLookupError):
+            return False
+        except (psutil.AccessDenied, OSError, ValueError) as error:
+            self.errors.append((proc.pid, method, error))
+            return False
+
+    #--------------------------------------------------------------------------------
+    def apply(self, processes):                                              # Placement
+    #--------------------------------------------------------------------------------
+        # Pin the processes (and their descendants) and set their priority
+        self.errors = []
+        self._procs = self._tree(processes)
+        cpus = self.cpus or self.candidates()
+        for i, proc in enumerate(self._procs):
+            if hasattr(proc, 'cpu_affinity'):
+                self._call(proc, 'cpu_affinity', [cpus[i % len(cpus)]] if self.spread else cpus)
+            if self.nice is not None:
+                self._call(proc, 'nice', self.nice)
+            if self.ionice is not None and hasattr(proc, 'ionice'):
+                self._call(proc, 'ionice', *(self.ionice if isinstance(self.ionice, tuple) else (self.ionice,)))
+        return self.errors
+
+    #--------------------------------------------------------------------------------
+    def can_restore_nice(self, nice):                                        # Placement
+    #--------------------------------------------------------------------------------
+        # True if the niceness can be lowered to 'nice' again after it is raised
+        if resource is None or os.geteuid() == 0:
+            return True
+        limit = resource.getrlimit(resource.RLIMIT_NICE)[0]
+        # RLIMIT_NICE is 20 - lowest niceness allowed
+        return limit == resource.RLIM_INFINITY or nice >= 20 - limit
+
+    #--------------------------------------------------------------------------------
+    def lower(self):                                                         # Placement
+    #--------------------------------------------------------------------------------
+        # Drop to idle priority, the current priority is restored by restore()
+        for proc in self._procs:
+            try:
+                self._saved.setdefault(proc.pid, (proc.nice(), proc.ionice() if hasattr(proc, 'ionice') else None))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            nice = self._saved[proc.pid][0]
+            if self.idle_nice is not None and self.idle_nice > nice and self.can_restore_nice(nice):
+                self._call(proc, 'nice', self.idle_nice)
+            if self.idle_ionice is not None and hasattr(proc, 'ionice'):
+                self._call(proc, 'ionice', self.idle_ionice)
+
+    #--------------------------------------------------------------------------------
+    def restore(self):                                                       # Placement
+    #--------------------------------------------------------------------------------
+        for proc in self._procs:
+            if (saved := self._saved.pop(proc.pid, None)) is None:
+                continue
+            nice, ionice = saved
+            try:
+                if proc.nice() != nice:
+                    self._call(proc, 'nice', nice)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            if ionice is not None:
+                self._call(proc, 'ionice', ionice.ioclass, ionice.value)
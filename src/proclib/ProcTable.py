@@ -0,0 +1,233 @@
+import os
+from re import compile as re_compile
+from psutil import process_iter, boot_time
+
+
+PROC = '/proc'
+COMM_LEN = 15     # The kernel truncates process names (comm) to 15 characters
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100    # Unit of starttime in /proc/<pid>/stat
+
+
+#====================================================================================
+class ProcTable:
+#====================================================================================
+    """
+    Index of the process table built from one scan of /proc.
+
+    Each scan reads /proc/<pid>/stat once per process and builds a pid -> name
+    and a parent -> children index. Command lines are read on demand and
+    cached for as long as the process lives, so a refresh only reads the
+    command line of new processes. refresh(ancestor=pid) only reads the stat
+    of new processes and of the previous descendants of pid, the entries of
+    the other processes (and their state) are kept from the last scan. On systems without /proc the table is
+    built from one psutil.process_iter() pass that prefetches name, ppid
+    and cmdline.
+
+    Initialization:
+    ProcTable(scan=True), the first scan is left to refresh() if scan is False
+
+    Methods:
+      refresh(ancestor=None)
+      name(pid)
+      ppid(pid)
+      create_time(pid)
+      cmdline(pid)
+      children(pid, recursive=True)
+      ancestors(pid)
+      group(pgid)
+      find(name=None, ancestor=None, cmdline=None)
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, scan=True):                                         # ProcTable
+    #--------------------------------------------------------------------------------
+        self._names = {}
+        self._ppids = {}
+        self._states = {}
+        self._starts = {}
+        self._pgids = {}
+        self._inodes = {}       # pid -> inode of /proc/<pid>, a new inode is a new process
+        self._children = {}
+        self._cmdlines = {}     # (pid, start) -> cmdline
+        if scan:
+            self.refresh()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                    # ProcTable
+    #--------------------------------------------------------------------------------
+        return f'<ProcTable({len(self._names)} processes)>'
+
+    #--------------------------------------------------------------------------------
+    def __len__(self):                                                     # ProcTable
+    #--------------------------------------------------------------------------------
+        return len(self._names)
+
+    #--------------------------------------------------------------------------------
+    def __contains__(self, pid):                                           # ProcTable
+    #--------------------------------------------------------------------------------
+        return pid in self._names
+
+    #--------------------------------------------------------------------------------
+    def refresh(self, ancestor=None):                                      # ProcTable
+    #--------------------------------------------------------------------------------
+        # With an ancestor pid the stat of processes outside its subtree is only read once
+        if os.path.isdir(PROC):
+            known = set(self._names)
+            if ancestor is not None and known:
+                known.difference_update([ancestor] + self.children(ancestor))
+            entries = self._scan_proc(known)
+        else:
+            entries = self._scan_psutil()
+        names, ppids, states, starts, pgids, inodes, children = {}, {}, {}, {}, {}, {}, {}
+        for pid, name, state, ppid, pgid, start, inode in entries:
+            names[pid] = name
+            ppids[pid] = ppid
+            states[pid] = state
+            starts[pid] = start
+            pgids[pid] = pgid
+            inodes[pid] = inode
+            children.setdefault(ppid, []).append(pid)
+        self._names, self._ppids, self._states, self._starts = names, ppids, states, starts
+        self._pgids, self._inodes, self._children = pgids, inodes, children
+        # Keep the cached command lines of processes that are still alive (same pid and start time)
+        self._cmdlines = {key: cmd for key, cmd in self._cmdlines.items() if starts.get(key[0]) == key[1]}
+        return self
+
+    #--------------------------------------------------------------------------------
+    def _scan_proc(self, known=()):                                        # ProcTable
+    #--------------------------------------------------------------------------------
+        # The previous entry is kept for the pids in known that are listed with the same
+        # inode, a reused pid gets a new /proc/<pid> inode
+        with os.scandir(PROC) as entries:
+            pids = [(int(e.name), e.inode()) for e in entries if e.name.isdigit()]
+        for pid, inode in pids:
+            if pid in known and self._inodes[pid] == inode:
+                yield (pid, self._names[pid], self._states[pid], self._ppids[pid], self._pgids[pid],
+                       self._starts[pid], inode)
+                continue
+            try:
+                with open(f'{PROC}/{pid}/stat', 'rb') as file:
+                    data = file.read()
+            except OSError:
+                # Process ended after the directory listing
+                continue
+            # Format: pid (comm) state ppid pgrp ... starttime (field 22), comm may contain spaces and ')'
+            head, _, tail = data.rpartition(b')')
+            fields = tail.split()
+            name = os.fsdecode(head.partition(b'(')[2])
+            yield pid, name, fields[0].decode(), int(fields[1]), int(fields[2]), int(fields[19]), inode
+
+    #--------------------------------------------------------------------------------
+    def _scan_psutil(self):                                                # ProcTable
+    #--------------------------------------------------------------------------------
+        for proc in process_iter(['name', 'ppid', 'status', 'create_time', 'cmdline']):
+            info = proc.info
+            start = info['create_time']
+            self._cmdlines[(proc.pid, start)] = info['cmdline'] or []
+            try:
+                pgid = os.getpgid(proc.pid)
+            except (OSError, AttributeError):
+                pgid = None
+            yield proc.pid, info['name'] or '', info['status'] or '', info['ppid'] or 0, pgid, start, None
+
+    #--------------------------------------------------------------------------------
+    def name(self, pid):                                                   # ProcTable
+    #--------------------------------------------------------------------------------
+        return self._names.get(pid)
+
+    #--------------------------------------------------------------------------------
+    def ppid(self, pid):                                                   # ProcTable
+    #--------------------------------------------------------------------------------
+        return self._ppids.get(pid)
+
+    #--------------------------------------------------------------------------------
+    def create_time(self, pid):                                            # ProcTable
+    #--------------------------------------------------------------------------------
+        # Start time in seconds since the epoch, same as psutil.Process.create_time()
+        start = self._starts.get(pid)
+        if start is None or not os.path.isdir(PROC):
+            return start
+        return boot_time() + start/CLOCK_TICKS
+
+    #--------------------------------------------------------------------------------
+    def state(self, pid):                                                  # ProcTable
+    #--------------------------------------------------------------------------------
+        return self._states.get(pid)
+
+    #--------------------------------------------------------------------------------
+    def pgid(self, pid):                                                   # ProcTable
+    #--------------------------------------------------------------------------------
+        return self._pgids.get(pid)
+
+    #--------------------------------------------------------------------------------
+    def group(self, pgid):                                                 # ProcTable
+    #--------------------------------------------------------------------------------
+        # Return the pids of all processes in the process group
+        return [pid for pid, group in self._pgids.items() if group == pgid]
+
+    #--------------------------------------------------------------------------------
+    def cmdline(self, pid):                                                # ProcTable
+    #--------------------------------------------------------------------------------
+        if pid not in self._starts:
+            return []
+        key = (pid, self._starts[pid])
+        if key not in self._cmdlines:
+            try:
+                with open(f'{PROC}/{pid}/cmdline', 'rb') as file:
+                    data = file.read()
+                self._cmdlines[key] = [os.fsdecode(a) for a in data.rstrip(b'\0').split(b'\0')] if data else []
+            except OSError:
+                return []
+        return self._cmdlines[key]
+
+    #--------------------------------------------------------------------------------
+    def ancestors(self, pid):                                              # ProcTable
+    #--------------------------------------------------------------------------------
+        found = []
+        while (pid := self._ppids.get(pid)) and pid not in found:
+            found.append(pid)
+        return found
+
+    #--------------------------------------------------------------------------------
+    def find(self, name=None, ancestor=None, cmdline=None):                # ProcTable
+    #--------------------------------------------------------------------------------
+        # Return pids (ascending) matching all given criteria:
+        #   name     : exact process name
+        #   ancestor : pid of the process itself or one of its ancestors
+        #   cmdline  : regex searched in the space-joined command line
+        if ancestor is not None:
+            pids = sorted([ancestor] + self.children(ancestor)) if ancestor in self._names else []
+        else:
+            pids = sorted(self._names)
+        if name is not None:
+            pids = [p for p in pids if self._names[p] == name or 
+                    (len(self._names[p]) == COMM_LEN and name.startswith(self._names[p]))]
+        if cmdline is not None:
+            regex = re_compile(cmdline) if isinstance(cmdline, str) else cmdline
+            pids = [p for p in pids if regex.search(' '.join(self.cmdline(p)))]
+        return pids
+
+    #--------------------------------------------------------------------------------
+    def children(self, pid, recursive=True):                               # ProcTable
+    #--------------------------------------------------------------------------------
+        # Same ordering as psutil.Process.children(recursive=True)
+        if not recursive:
+            return list(self._children.get(pid, ()))
+        found, seen, stack = [], {pid}, [pid]
+        while stack:
+            for child in self._children.get(stack.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    found.append(child)
+                    stack.append(child)
+        return found
+
+    #--------------------------------------------------------------------------------
+    def name_matches(self, pid, name):                                     # ProcTable
+    #--------------------------------------------------------------------------------
+        # Case-insensitive prefix match that allows for truncated names
+        proc_name = (self._names.get(pid) or '').lower()
+        name = name.lower()
+        if proc_name.startswith(name):
+            return True
+        return len(proc_name) == COMM_LEN and name.startswith(proc_name)
@@ -1,11 +1,18 @@
 from time import sleep
-from psutil import (STATUS_SLEEPING, STATUS_STOPPED, STATUS_ZOMBIE, Process as psutil_Process, process_iter, wait_procs,
+from collections import namedtuple
+from psutil import (STATUS_SLEEPING, STATUS_STOPPED, STATUS_TRACING_STOP, STATUS_ZOMBIE, Process as psutil_Process,
                     NoSuchProcess, AccessDenied)
+from proclib.ProcTable import ProcTable
+from proclib.Wait import Backoff
+from proclib.Reclaim import Reclaimer
+from proclib.ProcessGroup import teardown, KILL_TIMEOUT
 
 DEBUG = False
 
-CHILD_SEARCH_WAIT = 0.5        # Seconds to sleep during child process search
-CHILD_SEARCH_LIMIT = 500       # Total number of iterations in child process search 
+CHILD_SEARCH_WAIT = 0.1        # Max seconds to sleep between child process searches
+CHILD_SEARCH_LIMIT = 2500      # The child process search gives up after CHILD_SEARCH_WAIT*CHILD_SEARCH_LIMIT seconds
+CHILD_SEARCH_START = 0.001     # First pause of the child process search, doubled after each search
+START_TOLERANCE = 0.05         # Seconds the start time of a process may differ between ProcTable and psutil
 
 
 #--------------------------------------------------------------------------------
@@ -18,6 +25,51 @@ def ignore_process_error(func):
             return f'{args[0]._name} is missing'
     return inner
 
+#--------------------------------------------------------------------------------
+def started_as_listed(process, table):
+#--------------------------------------------------------------------------------
+    # False if the pid of the psutil process was reused after the table was read
+    start = table.create_time(process.pid)
+    return start is None or abs(process.create_time() - start) < START_TOLERANCE
+
+
+#====================================================================================
+class ProcessState(namedtuple('ProcessState', 'pid name status cpu rss ppid create_time')):
+#====================================================================================
+    # Immutable snapshot of a process, status is None if the process is gone
+    __slots__ = ()
+
+    @classmethod
+    #--------------------------------------------------------------------------------
+    def missing(cls, pid, name=None):                                  # ProcessState
+    #--------------------------------------------------------------------------------
+        return cls(pid, name, None, None, None, None, None)
+
+    @property
+    #--------------------------------------------------------------------------------
+    def exists(self):                                                  # ProcessState
+    #--------------------------------------------------------------------------------
+        return self.status is not None
+
+    @property
+    #--------------------------------------------------------------------------------
+    def running(self):                                                 # ProcessState
+    #--------------------------------------------------------------------------------
+        return self.status not in (None, STATUS_ZOMBIE)
+
+    @property
+    #--------------------------------------------------------------------------------
+    def sleeping(self):                                                # ProcessState
+    #--------------------------------------------------------------------------------
+        return self.status in (STATUS_SLEEPING, STATUS_STOPPED)
+
+    @property
+    #--------------------------------------------------------------------------------
+    def resumed(self):                                                 # ProcessState
+    #--------------------------------------------------------------------------------
+        # Alive and no longer stopped by SIGSTOP
+        return self.running and self.status not in (STATUS_STOPPED, STATUS_TRACING_STOP)
+
 
 #====================================================================================
 class Process:                                                              # Process
@@ -25,11 +77,18 @@ class Process:                                                              # Pr
 
     @classmethod
     #--------------------------------------------------------------------------------
-    def find(self, name):                                                   # Process
+    def find(self, name=None, ancestor=None, cmdline=None, table=None):     # Process
     #--------------------------------------------------------------------------------        
-        for proc in process_iter():
-            if proc.name() == name:
-                return proc
+        # Return the first psutil process that match name, ancestor pid and cmdline 
+        # regex (see ProcTable.find). Pass a ProcTable to reuse it between calls,
+        # with an ancestor only the stat of its subtree and of new processes is re-read.
+        table = table.refresh(ancestor=ancestor) if table is not None else ProcTable()
+        for pid in table.find(name=name, ancestor=ancestor, cmdline=cmdline):
+            try:
+                if started_as_listed(proc := psutil_Process(pid=pid), table):
+                    return proc
+            except (NoSuchProcess, ProcessLookupError):
+                continue
         
     #--------------------------------------------------------------------------------
     def __init__(self, process=None, pid=None, app_name=None, error_func=None):    # Process
@@ -76,16 +135,13 @@ class Process:                                                              # Pr
         return self._process
 
     #--------------------------------------------------------------------------------
-    def kill(self, children=False):                              # Process
+    def kill(self, children=False, grace=0, timeout=KILL_TIMEOUT):         # Process
     #--------------------------------------------------------------------------------
+        # With children=True the whole tree is killed with one deadline (and 
+        # SIGTERM first if grace > 0), and a TeardownReport is returned
         if children:
-            procs = self._process.children(recursive=True) + [self._process]
-            while procs:
-                for p in procs:
-                    p.kill()
-                _, procs = wait_procs(procs, timeout=None)
-        else:
-            self._process.kill()
+            return teardown([self._process], grace=grace, timeout=timeout)
+        self._process.kill()
 
 
     #--------------------------------------------------------------------------------
@@ -93,6 +149,30 @@ class Process:                                                              # Pr
     #--------------------------------------------------------------------------------
         return self._name
 
+    #--------------------------------------------------------------------------------
+    def pid(self):                                                          # Process
+    #--------------------------------------------------------------------------------
+        return self._pid
+
+    #--------------------------------------------------------------------------------
+    def state(self):                                                        # Process
+    #--------------------------------------------------------------------------------
+        # Read the process attributes in one pass using psutil oneshot()
+        proc = self._process
+        try:
+            with proc.oneshot():
+                if not proc.is_running():
+                    return ProcessState.missing(self._pid, self._name)
+                name, status, ppid, create_time = proc.name(), proc.status(), proc.ppid(), proc.create_time()
+                try:
+                    cpu = sum(proc.cpu_times()[:2])
+                    rss = proc.memory_info().rss
+                except AccessDenied:
+                    cpu = rss = None
+                return ProcessState(self._pid, name, status, cpu, rss, ppid, create_time)
+        except (NoSuchProcess, ProcessLookupError):
+            return ProcessState.missing(self._pid, self._name)
+
     # #--------------------------------------------------------------------------------
     # def name_pid(self):                                                     # Process
     # #--------------------------------------------------------------------------------
@@ -105,10 +185,13 @@ class Process:                                                              # Pr
     #     return f"'{self._name}' ({self._pid})"
 
     #--------------------------------------------------------------------------------
-    def suspend(self):                                                      # Process
+    def suspend(self, cold=False):                                          # Process
     #--------------------------------------------------------------------------------
+        # With cold=True the memory of the stopped process is paged out
         try:
             self._process.suspend()
+            if cold:
+                self.page_out()
             return True
         except AccessDenied:
             self._suspend_errors += 1
@@ -116,6 +199,12 @@ class Process:                                                              # Pr
         except (NoSuchProcess, ProcessLookupError):
             return False
 
+    #--------------------------------------------------------------------------------
+    def page_out(self):                                                     # Process
+    #--------------------------------------------------------------------------------
+        # Page out the anonymous memory, return the bytes reclaimed
+        return Reclaimer([self._pid]).reclaim()
+
     #--------------------------------------------------------------------------------
     def resume(self):                                                       # Process
     #--------------------------------------------------------------------------------
@@ -128,9 +217,12 @@ class Process:                                                              # Pr
 
     @ignore_process_error
     #--------------------------------------------------------------------------------
-    def current_status(self):                                               # Process
+    def current_status(self, state=None):                                   # Process
     #--------------------------------------------------------------------------------
-        return f'{self._process.name()} {self._process.status()}'
+        state = state or self.state()
+        if not state.exists:
+            return f'{self._name} is missing'
+        return f'{state.name} {state.status}'
     
 
     #--------------------------------------------------------------------------------
@@ -141,48 +233,46 @@ class Process:                                                              # Pr
         return ''
 
     #--------------------------------------------------------------------------------
-    def is_running(self, raise_error=False, **kwargs):                                # Process
+    def is_running(self, raise_error=False, state=None, **kwargs):          # Process
     #--------------------------------------------------------------------------------
+        # The predicates below evaluate a ProcessState, either a given 
+        # snapshot (see ProcessGroup) or a fresh one
         try:
-            if self._process.is_running() and self._process.status() != STATUS_ZOMBIE:
-                return True
-            if raise_error:
-                raise SystemError(
-                    f'ERROR {self._app_name} is not running ({self._name} is {self._process.status()})'
-                )
-        except (NoSuchProcess, ProcessLookupError):
-            if raise_error:
-                self._error_func(**kwargs)
-            else:
-                return False
+            state = state or self.state()
         except AttributeError as error:
             if raise_error:
                 raise SystemError(f'ERROR {self._app_name} process is {self._process}') from error
             return True
+        if state.running:
+            return True
+        if not raise_error:
+            return False
+        if not state.exists:
+            return self._error_func(**kwargs)
+        raise SystemError(f'ERROR {self._app_name} is not running ({self._name} is {state.status})')
 
     #--------------------------------------------------------------------------------
-    def is_not_running(self):                                               # Process
+    def is_not_running(self, state=None):                                   # Process
     #--------------------------------------------------------------------------------
-        try:
-            if (not self._process or
-                    not self._process.is_running() or
-                    self._process.status() == STATUS_ZOMBIE):
-                return True
-        except (NoSuchProcess, ProcessLookupError):
+        if not self._process:
             return True
+        state = state or self.state()
+        return not state.running
             
     #--------------------------------------------------------------------------------
-    def is_sleeping(self):                                                  # Process
+    def is_sleeping(self, state=None):                                      # Process
     #--------------------------------------------------------------------------------
         try:
-            if self._process.status() in (STATUS_SLEEPING, STATUS_STOPPED):
-                return True
-            if not self._process.is_running() or self._process.status() == STATUS_ZOMBIE:
-                raise SystemError(f'ERROR Process {self.name()} disappeared while trying to sleep')
-        except (NoSuchProcess, ProcessLookupError, AttributeError) as error:
+            state = state or self.state()
+        except AttributeError as error:
             raise SystemError(
                 f'ERROR Process {self._process} disappeared while trying to sleep'
             ) from error
+        if state.sleeping:
+            return True
+        if not state.running:
+            raise SystemError(f'ERROR Process {self.name()} disappeared while trying to sleep')
+        return False
 
                 
     #--------------------------------------------------------------------------------
@@ -192,10 +282,12 @@ class Process:                                                              # Pr
 
 
     #--------------------------------------------------------------------------------
-    def get_children(self, raise_error=True, log=False, wait=CHILD_SEARCH_WAIT, limit=CHILD_SEARCH_LIMIT):      # Process
+    def get_children(self, raise_error=True, log=False, wait=CHILD_SEARCH_WAIT, limit=CHILD_SEARCH_LIMIT, 
+                     strategy=None):      # Process
     #--------------------------------------------------------------------------------
         # Looking for child-processes with a name that match the app_name
         # Only do search if app_name is different from the name of this process  
+        # Returns the child-processes and the time (seconds) it took to find them
         children, time = [], None
         if not self._process:
             if raise_error:
@@ -205,28 +297,44 @@ class Process:                                                              # Pr
         # Return if this is the main process
         if self._process.name().lower().startswith(name):
             return children, time
-        time = None
-        for i in range(limit):
-            #print(self)
-            sleep(wait)
+        # Each search is one scan of /proc, the pause between searches starts 
+        # at a few milliseconds and grows up to 'wait' seconds
+        strategy = strategy or Backoff(start=CHILD_SEARCH_START, cap=wait)
+        strategy.start(timeout=wait*limit)
+        table = ProcTable(scan=False)
+        while True:
             if self.is_not_running():
                 if raise_error:
                     raise SystemError(
                         f'ERROR {self} disappeared while searching for child-processes!'
                     )
                 return children, time
-            children = self._process.children(recursive=True)
+            # Only the stat of new processes and of our subtree is re-read
+            children = table.refresh(ancestor=self._pid).children(self._pid)
+            strategy.checks += 1
             if log:
-                log(children and children or f"  searching for child-process '{name}' ...", v=3)
+                log(children and [f"'{table.name(p)}' ({p})" for p in children] 
+                    or f"  searching for child-process '{name}' ...", v=3)
             # Stop if named child process is found
-            if any(p.name().lower().startswith(name) for p in children):
-                time = wait*i
+            if any(table.name_matches(p, name) for p in children):
+                time = strategy.elapsed()
                 break
+            strategy.wasted += 1
+            if strategy.expired():
+                break
+            sleep(strategy.next_pause())
+            strategy.wakeups += 1
         if time is None and raise_error:
             raise SystemError(
-                f'Unable to find child process of {self} in {wait*limit:.1f} seconds, aborting...'
+                f'Unable to find child process of {self} in {strategy.elapsed():.1f} seconds, aborting...'
             )
         # Child processes inherit app_name and error_func from parent
-        children = [Process(process=c, app_name=self._app_name, error_func=self._error_func) for c in children]
-        return children, time
-
+        procs = []
+        for pid in children:
+            try:
+                proc = psutil_Process(pid=pid)
+                if started_as_listed(proc, table):
+                    procs.append(Process(process=proc, app_name=self._app_name, error_func=self._error_func))
+            except (NoSuchProcess, ProcessLookupError):
+                continue
+        return procs, time
@@ -0,0 +1,331 @@
+import os
+import signal
+from collections import namedtuple
+from contextlib import contextmanager
+from time import monotonic, sleep
+from types import MappingProxyType
+
+import psutil
+
+from proclib.ProcTable import ProcTable
+from proclib.Wait import Backoff
+from proclib.Watcher import watch_exit
+
+
+SNAPSHOT_TTL = 0        # Seconds a snapshot is reused outside ProcessGroup.pinned()
+CONFIRM_TIMEOUT = 1.2   # Seconds to wait for all processes to confirm a suspend/resume
+TERM_GRACE = 1.0        # Seconds the processes get to exit after SIGTERM
+KILL_TIMEOUT = 1.0      # Seconds to wait for the processes to die after SIGKILL
+
+# Result of a signal sent to one process of the group. 'sent' is True if the 
+# signal was delivered, 'confirmed' is the number of seconds until the new 
+# state was observed (None if not confirmed or not checked)
+SignalResult = namedtuple('SignalResult', 'pid name sent confirmed')
+
+# Outcome of a teardown: pids that exited after SIGTERM, that needed SIGKILL, that
+# exited but are not reaped by their parent (zombies), that were already gone and 
+# that are still alive, and the seconds it took
+TeardownReport = namedtuple('TeardownReport', 'terminated killed zombies gone alive elapsed')
+
+SIGSTOP = getattr(signal, 'SIGSTOP', None)    # Not defined on Windows
+SIGCONT = getattr(signal, 'SIGCONT', None)
+
+
+#====================================================================================
+class ProcessGroup:
+#====================================================================================
+    """
+    A group of Process objects that share one cached snapshot.
+
+    The state of all processes is read in one pass (using psutil oneshot()).
+    Inside pinned() (one wait-loop iteration of Runner) the snapshot is
+    reused, so that several predicates in the same iteration cost one read
+    of /proc per process. Outside pinned() it is reused for 'ttl' seconds.
+
+    With a Cgroup, suspend/resume freeze and thaw the cgroup instead of
+    signalling each process, which also stops processes started later.
+
+    Initialization:
+    ProcessGroup(processes, ttl=SNAPSHOT_TTL, cgroup=None)
+
+    Methods:
+      snapshot(refresh=False)
+      pinned()
+      invalidate()
+      is_running()
+      is_not_running()
+      is_sleeping()
+      assert_running(raise_error=True, **kwargs)
+      status()
+      suspend(check=False, timeout=CONFIRM_TIMEOUT, strategy=None, killpg=False)
+      resume(check=False, timeout=CONFIRM_TIMEOUT, strategy=None, killpg=False)
+      teardown(grace=TERM_GRACE, timeout=KILL_TIMEOUT, roots=(), popen=None)
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, processes=(), ttl=SNAPSHOT_TTL, cgroup=None):    # ProcessGroup
+    #--------------------------------------------------------------------------------
+        self.processes = list(processes)
+        self.ttl = ttl
+        self.cgroup = cgroup
+        self._snapshot = None
+        self._snaptime = None
+        self._pins = 0
+        self._pgid = None
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                 # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return f'<ProcessGroup({", ".join(str(p) for p in self.processes)}, ttl={self.ttl})>'
+
+    #--------------------------------------------------------------------------------
+    def __len__(self):                                                  # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return len(self.processes)
+
+    #--------------------------------------------------------------------------------
+    def __iter__(self):                                                 # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return iter(self.processes)
+
+    #--------------------------------------------------------------------------------
+    def snapshot(self, refresh=False):                                  # ProcessGroup
+    #--------------------------------------------------------------------------------
+        # Return a read-only mapping from pid to ProcessState
+        now = monotonic()
+        if refresh or self._snapshot is None or (not self._pins and now - self._snaptime > self.ttl):
+            self._snapshot = MappingProxyType({p.pid(): p.state() for p in self.processes})
+            self._snaptime = now
+        return self._snapshot
+
+    @contextmanager
+    #--------------------------------------------------------------------------------
+    def pinned(self):                                                   # ProcessGroup
+    #--------------------------------------------------------------------------------
+        # Reuse the first snapshot read inside the block, a new one is read after it
+        self._pins += 1
+        try:
+            yield self
+        finally:
+            self._pins -= 1
+            if not self._pins:
+                self._snapshot = None
+
+    #--------------------------------------------------------------------------------
+    def invalidate(self):                                               # ProcessGroup
+    #--------------------------------------------------------------------------------
+        # Force a new read on the next call, e.g. after signalling the processes
+        self._snapshot = None
+
+    #--------------------------------------------------------------------------------
+    def states(self):                                                   # ProcessGroup
+    #--------------------------------------------------------------------------------
+        snapshot = self.snapshot()
+        return [(p, snapshot[p.pid()]) for p in self.processes]
+
+    #--------------------------------------------------------------------------------
+    def is_running(self):                                               # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return all(p.is_running(state=s) for p, s in self.states())
+
+    #--------------------------------------------------------------------------------
+    def is_not_running(self):                                           # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return all(p.is_not_running(state=s) for p, s in self.states())
+
+    #--------------------------------------------------------------------------------
+    def is_sleeping(self):                                              # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return all([p.is_sleeping(state=s) for p, s in self.states()])
+
+    #--------------------------------------------------------------------------------
+    def assert_running(self, raise_error=True, **kwargs):               # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return [p.assert_running(raise_error=raise_error, state=s, **kwargs) for p, s in self.states()]
+
+    #--------------------------------------------------------------------------------
+    def status(self):                                                   # ProcessGroup
+    #--------------------------------------------------------------------------------
+        return ', '.join(str(p.current_status(state=s)) for p, s in self.states())
+
+    #--------------------------------------------------------------------------------
+    def pgid(self):                                                     # ProcessGroup
+    #--------------------------------------------------------------------------------
+        # Return the process group id if it is safe to signal the whole group, i.e.
+        # all processes share a group that is not ours and has no other members
+        if self._pgid is None:
+            self._pgid = False
+            table = ProcTable()
+            pids = {p.pid() for p in self.processes}
+            pgids = {table.pgid(pid) for pid in pids}
+            if len(pgids) == 1 and (pgid := pgids.pop()) and pgid != os.getpgrp():
+                if set(table.group(pgid)) <= pids:
+                    self._pgid = pgid
+        return self._pgid or None
+
+    #--------------------------------------------------------------------------------
+    def suspend(self, check=False, timeout=CONFIRM_TIMEOUT, strategy=None, killpg=False):  # ProcessGroup
+    #--------------------------------------------------------------------------------
+        if self.cgroup:
+            return self._freeze(1, check, timeout)
+        return self._fan_out(SIGSTOP, 'suspend', lambda s: s.sleeping, check, timeout, strategy, killpg)
+
+    #--------------------------------------------------------------------------------
+    def resume(self, check=False, timeout=CONFIRM_TIMEOUT, strategy=None, killpg=False):   # ProcessGroup
+    #--------------------------------------------------------------------------------
+        if self.cgroup:
+            return self._freeze(0, check, timeout)
+        return self._fan_out(SIGCONT, 'resume', lambda s: s.resumed, check, timeout, strategy, killpg)
+
+    #--------------------------------------------------------------------------------
+    def _freeze(self, value, check, timeout):                           # ProcessGroup
+    #--------------------------------------------------------------------------------
+        # One write to cgroup.freeze, confirmed for all processes by cgroup.events
+        try:
+            method = self.cgroup.freeze if value else self.cgroup.thaw
+            confirmed = method(wait=check, timeout=timeout)
+            sent = True
+        except OSError:
+            confirmed, sent = None, False
+        self.invalidate()
+        return [SignalResult(p.pid(), p.name(), sent, confirmed) for p in self.processes]
+
+    #--------------------------------------------------------------------------------
+    def teardown(self, grace=TERM_GRACE, timeout=KILL_TIMEOUT, roots=(), popen=None):  # ProcessGroup
+    #--------------------------------------------------------------------------------
+        # Terminate the processes, their descendants and the extra root pids, see teardown()
+        procs = [p.process() for p in self.processes] + list(roots)
+        report = teardown(procs, grace=grace, timeout=timeout, cgroup=self.cgroup, popen=popen)
+        self.invalidate()
+        return report
+
+    #--------------------------------------------------------------------------------
+    def _fan_out(self, sig, method, confirm, check, timeout, strategy, killpg):  # ProcessGroup
+    #--------------------------------------------------------------------------------
+        # Signal all processes in one pass, then wait for all of them to reach 
+        # the new state with one shared deadline. Returns a list of SignalResult.
+        starttime = monotonic()
+        pgid = killpg and sig and self.pgid()
+        if pgid:
+            try:
+                os.killpg(pgid, sig)
+                sent = {p.pid(): True for p in self.processes}
+            except (ProcessLookupError, PermissionError):
+                sent = {p.pid(): False for p in self.processes}
+        else:
+            sent = {p.pid(): getattr(p, method)() for p in self.processes}
+        self.invalidate()
+        confirmed = {}
+        if check:
+            strategy = strategy or Backoff(start=1e-4, cap=0.01)
+            strategy.start(timeout)
+            pending = [p for p in self.processes if sent[p.pid()]]
+            while pending:
+                for proc in list(pending):
+                    strategy.checks += 1
+                    state = proc.state()
+                    if confirm(state) or not state.exists:
+                        if state.exists:
+                            confirmed[proc.pid()] = monotonic() - starttime
+                        pending.remove(proc)
+                    else:
+                        strategy.wasted += 1
+                if not pending or strategy.expired():
+                    break
+                sleep(strategy.next_pause())
+                strategy.wakeups += 1
+        return [SignalResult(p.pid(), p.name(), sent[p.pid()], confirmed.get(p.pid())) for p in self.processes]
+
+
+#------------------------------------------------
+def process_tree(roots):
+#------------------------------------------------
+    # The psutil processes of roots (psutil processes or pids) and all their descendants
+    procs = {}
+    for root in roots:
+        try:
+            root = root if isinstance(root, psutil.Process) else psutil.Process(root)
+            for proc in [root] + root.children(recursive=True):
+                procs.setdefault(proc.pid, proc)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, ProcessLookupError):
+            pass
+    return list(procs.values())
+
+
+#------------------------------------------------
+def _signal_all(procs, method):
+#------------------------------------------------
+    # Call method (e.g. 'terminate') of all processes, return those that got it
+    sent = []
+    for proc in procs:
+        try:
+            getattr(proc, method)()
+            sent.append(proc)
+        except (psutil.NoSuchProcess, ProcessLookupError):
+            pass
+        except psutil.AccessDenied:
+            sent.append(proc)
+    return sent
+
+
+#------------------------------------------------
+def _wait(procs, timeout, popen=None):
+#------------------------------------------------
+    # Wait for the processes to exit with one deadline for all, woken by their
+    # pidfds (polled without pidfd support). The popen child is reaped, other
+    # processes are left to their parents.
+    end = monotonic() + timeout
+    with watch_exit(*procs, popen=popen) as watcher:
+        while not watcher.done():
+            left = end - monotonic()
+            if left <= 0:
+                break
+            watcher.wait(left)
+        exited = set(watcher.exited)
+    done = [p for p in procs if p.pid in exited]
+    return done, [p for p in procs if p.pid not in exited]
+
+
+#------------------------------------------------
+def _is_zombie(proc):
+#------------------------------------------------
+    try:
+        return proc.status() == psutil.STATUS_ZOMBIE
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
+#------------------------------------------------
+def teardown(roots, grace=TERM_GRACE, timeout=KILL_TIMEOUT, cgroup=None, popen=None):
+#------------------------------------------------
+    # Stop the process trees of roots in parallel: the tree is read once, stopped
+    # processes are resumed so that they can handle SIGTERM, all get SIGTERM, and
+    # those still alive after 'grace' seconds get SIGKILL. With grace=0 SIGKILL is
+    # sent right away. The processes of a cgroup are included, and killed with
+    # cgroup.kill if available. The popen child is reaped, exited processes that
+    # are not reaped by their parent are listed as zombies. Returns a TeardownReport.
+    start = monotonic()
+    procs = process_tree(list(roots) + (cgroup.pids() if cgroup else []))
+    alive = [p for p in procs if p.is_running()]
+    gone = [p.pid for p in procs if p not in alive]
+    terminated, killed = [], []
+    if grace:
+        if cgroup:
+            try:
+                cgroup.thaw(wait=False)
+            except OSError:
+                pass
+        _signal_all(alive, 'resume')
+        sent = _signal_all(alive, 'terminate')
+        gone += [p.pid for p in alive if p not in sent]
+        done, alive = _wait(sent, grace, popen)
+        terminated = [p.pid for p in done]
+    if alive:
+        if not (cgroup and cgroup.kill()):
+            _signal_all(alive, 'kill')
+        done, alive = _wait(alive, timeout, popen)
+        killed = [p.pid for p in done]
+    zombies = [p.pid for p in procs if p.pid in terminated + killed and _is_zombie(p)]
+    terminated = [pid for pid in terminated if pid not in zombies]
+    killed = [pid for pid in killed if pid not in zombies]
+    return TeardownReport(terminated, killed, zombies, gone, [p.pid for p in alive], monotonic() - start)
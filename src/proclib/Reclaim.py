@@ -0,0 +1,235 @@
+import os
+import errno
+import ctypes
+import platform
+from pathlib import Path
+from threading import Lock, Event
+
+from proclib.Cgroup import cgroup_path
+from proclib.Watcher import open_pidfd
+
+
+# process_madvise() has the same number on the architectures that share the generic
+# system call table, it is not used elsewhere (e.g. alpha or mips)
+SYS_PROCESS_MADVISE = {machine: 440 for machine in ('x86_64', 'i386', 'i686', 'aarch64', 'arm64', 'armv7l',
+                       'ppc64', 'ppc64le', 's390x', 'riscv64', 'loongarch64')}.get(platform.machine())
+MADV_PAGEOUT = 21
+IOV_MAX = 1024
+# Mappings that can not be paged out
+SPECIAL = ('[vdso]', '[vvar]', '[vsyscall]', '[vvar_vclock]', '[uprobes]')
+
+
+#====================================================================================
+class iovec(ctypes.Structure):
+#====================================================================================
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+_libc = None
+
+#------------------------------------------------
+def libc():
+#------------------------------------------------
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.syscall.restype = ctypes.c_long
+    return _libc
+
+
+#------------------------------------------------
+def anon_ranges(pid):
+#------------------------------------------------
+    # Address ranges of the private anonymous mappings (heap, stack, anonymous mmaps)
+    ranges = []
+    with open(f'/proc/{pid}/maps') as maps:
+        for line in maps:
+            fields = line.split(maxsplit=5)
+            path = fields[5].strip() if len(fields) > 5 else ''
+            if fields[1][3] != 'p' or (path and not (path.startswith('[') and path not in SPECIAL)):
+                continue
+            start, end = (int(a, 16) for a in fields[0].split('-'))
+            ranges.append((start, end - start))
+    return ranges
+
+
+#------------------------------------------------
+def memory(pid):
+#------------------------------------------------
+    # Resident anonymous memory and swap (bytes) and the number of major page faults
+    mem = {'anon': 0, 'swap': 0, 'majflt': 0}
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                mem['anon'] = 1024*int(line.split()[1])
+            elif line.startswith('VmSwap:'):
+                mem['swap'] = 1024*int(line.split()[1])
+    with open(f'/proc/{pid}/stat', 'rb') as stat:
+        # The fields after the command name, majflt is field 12
+        mem['majflt'] = int(stat.read().rpartition(b')')[2].split()[9])
+    return mem
+
+
+#------------------------------------------------
+def page_out(pid, stop=None):
+#------------------------------------------------
+    # Ask the kernel to page out the anonymous memory of process pid with
+    # process_madvise(MADV_PAGEOUT), Linux >= 5.10. Return the advised bytes.
+    # The page-out ends early if stop (an Event) is set.
+    if SYS_PROCESS_MADVISE is None:
+        raise OSError(errno.ENOSYS, f'process_madvise is not supported on {platform.machine()}')
+    lib = libc()
+    pidfd = open_pidfd(pid)
+    if pidfd is None:
+        raise ProcessLookupError(errno.ESRCH, f'No process {pid}')
+    advised = 0
+    try:
+        ranges = anon_ranges(pid)
+        for i in range(0, len(ranges), IOV_MAX):
+            if stop and stop.is_set():
+                break
+            chunk = ranges[i:i+IOV_MAX]
+            vec = (iovec*len(chunk))(*chunk)
+            done = lib.syscall(SYS_PROCESS_MADVISE, ctypes.c_int(pidfd), vec, ctypes.c_size_t(len(chunk)),
+                               ctypes.c_int(MADV_PAGEOUT), ctypes.c_uint(0))
+            if done < 0:
+                err = ctypes.get_errno()
+                # A range that is unmapped while we work is not an error
+                if err != errno.ENOMEM:
+                    raise OSError(err, os.strerror(err))
+            else:
+                advised += done
+    finally:
+        os.close(pidfd)
+    return advised
+
+
+#------------------------------------------------
+def cgroup_reclaim(cgroup, nbytes):
+#------------------------------------------------
+    # Proactive reclaim of nbytes from the cgroup, Linux >= 5.19
+    try:
+        (Path(cgroup)/'memory.reclaim').write_text(f'{nbytes}\n')
+    except OSError as error:
+        # EAGAIN: less than nbytes could be reclaimed
+        if error.errno != errno.EAGAIN:
+            raise
+
+
+#====================================================================================
+class Reclaimer:
+#====================================================================================
+    """
+    Pages out the anonymous memory of stopped processes and measures the
+    cost of getting it back after the resume. process_madvise(MADV_PAGEOUT)
+    is used, or cgroup memory.reclaim if the processes are alone in their
+    own cgroup v2 and process_madvise is not available. The memory goes to
+    swap (or zram), so without swap nothing is reclaimed.
+
+    Initialization:
+    Reclaimer(pids)
+
+    Methods:
+      arm()
+      reclaim()
+      cancel()
+      resumed()
+      fault_in()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, pids):                                                  # Reclaimer
+    #--------------------------------------------------------------------------------
+        self.pids = list(pids)
+        self.reclaimed = 0       # Bytes reclaimed by the last reclaim()
+        self.method = None
+        self.errors = []
+        self._before = None      # Memory at resume of processes that were paged out
+        self._lock = Lock()
+        self._stop = Event()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                        # Reclaimer
+    #--------------------------------------------------------------------------------
+        return f'<Reclaimer(pids={self.pids}, reclaimed={self.reclaimed/2**20:.1f} MB)>'
+
+    #--------------------------------------------------------------------------------
+    def _memory(self):                                                         # Reclaimer
+    #--------------------------------------------------------------------------------
+        mem = {}
+        for pid in self.pids:
+            try:
+                mem[pid] = memory(pid)
+            except OSError:
+                pass
+        return mem
+
+    #--------------------------------------------------------------------------------
+    def _cgroup(self):                                                         # Reclaimer
+    #--------------------------------------------------------------------------------
+        # A cgroup that holds the processes and not this controller
+        groups = {cgroup_path(pid) for pid in self.pids}
+        if len(groups) == 1 and (group := groups.pop()) and group != cgroup_path(os.getpid()):
+            if (group/'memory.reclaim').exists():
+                return group
+        return None
+
+    #--------------------------------------------------------------------------------
+    def reclaim(self):                                                         # Reclaimer
+    #--------------------------------------------------------------------------------
+        # Page out the memory of the (stopped) processes, return the bytes reclaimed.
+        # Nothing is paged out after a cancel() until the next arm().
+        with self._lock:
+            self.errors = []
+            before = self._memory()
+            self.method = 'process_madvise'
+            for pid in before:
+                if self._stop.is_set():
+                    break
+                try:
+                    page_out(pid, stop=self._stop)
+                except OSError as error:
+                    self.errors.append((pid, error))
+            if self.errors and not self._stop.is_set() and (group := self._cgroup()):
+                self.method = 'memory.reclaim'
+                try:
+                    cgroup_reclaim(group, sum(m['anon'] for m in before.values()))
+                    self.errors = []
+                except OSError as error:
+                    self.errors.append((group, error))
+            after = self._memory()
+            self.reclaimed = sum(max(before[pid]['anon'] - after[pid]['anon'], 0) for pid in after)
+            return self.reclaimed
+
+    #--------------------------------------------------------------------------------
+    def arm(self):                                                             # Reclaimer
+    #--------------------------------------------------------------------------------
+        # Called when a reclaim() is scheduled (at the suspend). Not done in reclaim(),
+        # where it would undo a cancel() made before reclaim() got the lock.
+        self._stop.clear()
+
+    #--------------------------------------------------------------------------------
+    def cancel(self):                                                          # Reclaimer
+    #--------------------------------------------------------------------------------
+        # Make a running reclaim() stop after the current batch of ranges
+        self._stop.set()
+
+    #--------------------------------------------------------------------------------
+    def resumed(self):                                                         # Reclaimer
+    #--------------------------------------------------------------------------------
+        # Called after the resume, fault_in() is measured from here
+        with self._lock:
+            self._before = self._memory() if self.reclaimed else None
+
+    #--------------------------------------------------------------------------------
+    def fault_in(self):                                                        # Reclaimer
+    #--------------------------------------------------------------------------------
+        # Major page faults and bytes read back from swap since resumed(), None if
+        # nothing was paged out before the resume or the processes are gone
+        with self._lock:
+            now = self._memory()
+            if not self._before or not now:
+                return None
+            faults = sum(now[pid]['majflt'] - self._before[pid]['majflt'] for pid in now if pid in self._before)
+            swapped_in = sum(max(self._before[pid]['swap'] - now[pid]['swap'], 0) for pid in now if pid in self._before)
+            return faults, swapped_in
@@ -0,0 +1,163 @@
+import sys
+import json
+import atexit
+from time import time, sleep, monotonic
+from collections import deque
+from threading import Thread, Event, Condition, Lock
+
+
+RUNLOG_RECORDS = 10000   # Records kept in memory, the oldest are dropped when full
+BATCH_DELAY = 0.05       # Seconds the writer waits for more records before it writes
+
+
+#====================================================================================
+class RunLog:
+#====================================================================================
+    """
+    Run-log sink that takes the writes out of the caller's thread. A record
+    is appended to a bounded deque (a short lock, no system call) and a background
+    thread formats and writes the records in batches, one write and flush per
+    batch. If the writer falls behind (e.g. a slow NFS) the oldest records are
+    dropped and the number dropped is logged. A message can be a callable that
+    is called by the writer, so that the formatting is also deferred.
+    Optionally every record is also written as a JSON line.
+
+    Initialization:
+    RunLog(file=None, json_path=None, size=RUNLOG_RECORDS, delay=BATCH_DELAY)
+
+    Methods:
+      write(name, txt, v=1, end='\\n')
+      flush(timeout=None)
+      close()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, file=None, json_path=None, size=RUNLOG_RECORDS, delay=BATCH_DELAY):  # RunLog
+    #--------------------------------------------------------------------------------
+        self.file = file
+        self.json = open(json_path, 'a', encoding='utf-8') if json_path else None
+        self.delay = delay
+        self.dropped = 0
+        self._records = deque(maxlen=size)
+        # Guards the deque and the counters, written by the callers and the writer thread
+        self._lock = Lock()
+        self._queued = 0
+        self._written = 0
+        self._wake = Event()
+        self._done = Condition()
+        self._closed = False
+        self._thread = Thread(target=self._run, name='proclib-runlog', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                         # RunLog
+    #--------------------------------------------------------------------------------
+        return f'<RunLog(queued={len(self._records)}, dropped={self.dropped})>'
+
+    #--------------------------------------------------------------------------------
+    def write(self, name, txt, v=1, end='\n'):                                 # RunLog
+    #--------------------------------------------------------------------------------
+        # Queue a message, txt is a string, a list of strings or a callable returning one
+        if self._closed:
+            # Written directly after close()
+            try:
+                print(_format(name, txt), file=self.file or sys.stdout, end=end, flush=True)
+            except (OSError, ValueError):
+                pass
+            return
+        record = (time(), name, txt, v, end)
+        with self._lock:
+            if len(self._records) == self._records.maxlen:
+                self.dropped += 1
+            self._records.append(record)
+            self._queued += 1
+        if not self._wake.is_set():
+            self._wake.set()
+
+    #--------------------------------------------------------------------------------
+    def flush(self, timeout=None):                                             # RunLog
+    #--------------------------------------------------------------------------------
+        # Wait until the queued records are written, False on timeout
+        with self._lock:
+            target = self._queued
+        self._wake.set()
+        end = None if timeout is None else monotonic() + timeout
+        with self._done:
+            while self._written < target and self._thread.is_alive():
+                left = None if end is None else end - monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._done.wait(left)
+        return True
+
+    #--------------------------------------------------------------------------------
+    def close(self):                                                           # RunLog
+    #--------------------------------------------------------------------------------
+        # Write the remaining records and stop the writer, the text file is not closed
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        if self.json:
+            self.json.close()
+        atexit.unregister(self.close)
+
+    #--------------------------------------------------------------------------------
+    def _run(self):                                                            # RunLog
+    #--------------------------------------------------------------------------------
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            if self.delay and not self._closed:
+                # Collect more records before writing
+                sleep(self.delay)
+            self._write_batch()
+
+    #--------------------------------------------------------------------------------
+    def _write_batch(self):                                                    # RunLog
+    #--------------------------------------------------------------------------------
+        # Records counted in _queued before this point are written (or dropped) below
+        with self._lock:
+            queued = self._queued
+            records = list(self._records)
+            self._records.clear()
+            dropped, self.dropped = self.dropped, 0
+        lines, jsons = [], []
+        if dropped:
+            lines.append(f'[{dropped} run-log messages dropped]\n')
+        for stamp, name, txt, v, end in records:
+            text = _format(name, txt)
+            lines.append(text + end)
+            if self.json:
+                jsons.append(json.dumps({'time': stamp, 'name': name, 'v': v, 'msg': text}) + '\n')
+        try:
+            file = self.file or sys.stdout
+            file.write(''.join(lines))
+            file.flush()
+            if jsons:
+                self.json.write(''.join(jsons))
+                self.json.flush()
+        except (OSError, ValueError):
+            # Closed or failing file, the records are lost but the controller goes on
+            pass
+        with self._done:
+            self._written = queued
+            self._done.notify_all()
+
+
+#------------------------------------------------
+def _format(name, txt):
+#------------------------------------------------
+    # The text of a message, each line tagged with name if name is given
+    try:
+        if callable(txt):
+            txt = txt()
+    except Exception as error:
+        txt = f'<message failed: {error!r}>'
+    lines = [txt] if isinstance(txt, str) else [str(t) for t in txt]
+    if name:
+        return f'{name}: ' + f'\n{name}: '.join(lines)
+    return '\n'.join(lines)
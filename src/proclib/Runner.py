@@ -1,20 +1,53 @@
 
 # -*- coding: utf-8 -*-
+import os
+import errno
 from datetime import datetime
-from re import findall
+from re import search
 from subprocess import Popen, PIPE, STDOUT
-from shutil import SameFileError, which, copy
-from time import sleep
+from shutil import SameFileError, which, copymode, copyfileobj
+from tempfile import mkstemp
+from fnmatch import fnmatchcase
+from time import sleep, time as _time
 from pathlib import Path
 from locale import getpreferredencoding
+from contextlib import nullcontext, contextmanager
+from threading import Thread
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
 
 import psutil
 from proclib.Process import Process
+from proclib.ProcessGroup import ProcessGroup, SNAPSHOT_TTL, TERM_GRACE, KILL_TIMEOUT
 from proclib.Timer import Timer, TimerThread
+from proclib.Watcher import watch_files, watch_exit
+from proclib.Wait import Fixed, Backoff
+from proclib.ProcTable import ProcTable
+from proclib.Follower import LogFollower
+from proclib.Sampler import Sampler
+from proclib.Capture import OutputCapture
+from proclib.Transport import make_transport
+from proclib.Trace import Tracer, NULL_TRACER, traced
+from proclib.Status import StatusRecord, RUNNING, SUSPENDED, DELAYED
+from proclib.Reclaim import Reclaimer
+from proclib.Placement import format_cpulist
+from proclib.Cgroup import Cgroup
+from proclib.RunLog import RunLog
 
 
 # Constants
-SUSPEND_TIMER_PRECICION = 0.1  # Precision of the delayed-suspend-timer in seconds
+SUSPEND_TIMER_PRECICION = 0.1  # Not used, kept for backward compatibility (the suspend timers share one TimerService thread)
+FILE_CHECK_PAUSE = 0.1         # Seconds between process checks while waiting for files
+EXIT_CHECK_PAUSE = 1.0         # Seconds between loop_func calls while waiting for the process to exit
+CAPTURE_JOIN_TIMEOUT = 1.0     # Seconds to wait for the end of the captured output in close()
+RUNLOG_FLUSH_TIMEOUT = 5.0     # Seconds to wait for the run-log messages to be written on errors
+
+FICLONE = 0x40049409           # ioctl that reflinks a file (btrfs, xfs)
+COPY_CHUNK = 1 << 30           # Bytes per copy_file_range() call
+DELETE_LIST_MIN = 4            # Registered files from which delete_all() lists the directory once instead of unlinking each
 
 DEBUG = False
 
@@ -69,6 +102,11 @@ class Control_file:
         self._nr = (lambda x : f'{int(x):{args[2]}}') if len(args)>2 else (lambda x : '')
         self._path = Path(path if path else self._base + self._nr(0))
         self._log = log
+        # Files created by this object, deleted by delete_all() without a directory 
+        # scan. Only if the first file to create already exists, files left by an 
+        # earlier run are suspected and added by one scan.
+        self._registry = set()
+        self._created = False
 
     #--------------------------------------------------------------------------------
     def __repr__(self) -> str:
@@ -80,20 +118,53 @@ class Control_file:
     #--------------------------------------------------------------------------------
         return f'{self._path.name}'
 
+    #--------------------------------------------------------------------------------
+    def __fspath__(self) -> str:
+    #--------------------------------------------------------------------------------
+        return str(self._path)
+
     #--------------------------------------------------------------------------------
     def __call__(self, n):
     #--------------------------------------------------------------------------------
         self._path = Path(self._base + self._nr(n))
         return self
 
+    #--------------------------------------------------------------------------------
+    def _register(self):
+    #--------------------------------------------------------------------------------
+        # Called before the file is created
+        if self._base == '':
+            return
+        if not self._created:
+            self._created = True
+            if self._path.exists():
+                # Left by an earlier run, one scandir() finds the others whatever their numbers
+                self._registry.update(self._base_dir()/name for name in self._listing())
+        self._registry.add(self._path)
+
     #--------------------------------------------------------------------------------
     def glob(self):
     #--------------------------------------------------------------------------------
         if self._base == '':
             return ()
-        nr = self._nr(0).replace('0','?')
-        path = Path(self._base + nr)
-        return (Control_file(path=f, log=self._log) for f in path.parent.glob(path.name))
+        return (Control_file(path=self._base_dir()/name, log=self._log) for name in self._listing())
+
+    #--------------------------------------------------------------------------------
+    def _base_dir(self):
+    #--------------------------------------------------------------------------------
+        return Path(self._base).parent
+
+    #--------------------------------------------------------------------------------
+    def _listing(self):
+    #--------------------------------------------------------------------------------
+        # Names of the matching files, one scandir() of the directory filtered on the name prefix
+        pattern = Path(self._base + self._nr(0).replace('0','?')).name
+        prefix = Path(self._base).name
+        try:
+            with os.scandir(self._base_dir()) as entries:
+                return [e.name for e in entries if e.name.startswith(prefix) and fnmatchcase(e.name, pattern)]
+        except OSError:
+            return []
 
     #--------------------------------------------------------------------------------
     def name(self):
@@ -109,6 +180,7 @@ class Control_file:
     #--------------------------------------------------------------------------------
     def create(self):
     #--------------------------------------------------------------------------------
+        self._register()
         if self._log:
             self._log(f'Create empty {self}')
         self._path.touch()
@@ -117,51 +189,83 @@ class Control_file:
     #--------------------------------------------------------------------------------
     def create_from(self, file=None, string=None, delete=False):
     #--------------------------------------------------------------------------------
+        self._register()
         if file is None and string is None:
             raise SyntaxError(
                 "ERROR Both 'file' and 'string' argument missing in Control_file.create_from()!"
             )
         file = file and Path(file)
+        # The file appears complete or not at all: the content is staged in a
+        # temporary file in the same directory and renamed into place
         ### Create from file
         if file and file.is_file:
             if self._log:
                 self._log(f'Create {self} from file {file.name}')
             try:
-                copy(file, self._path)
+                if self._path.exists() and file.samefile(self._path):
+                    raise SameFileError
+                # Move the file if it is deleted anyway, copy if on another file-system
+                if not (delete and move_file(file, self._path)):
+                    with staged(self._path) as tmp:
+                        clone_file(file, tmp)
+                        copymode(file, tmp)
+                    if delete:
+                        silentdelete(file)
             except SameFileError:
                 if self._log:
                     self._log(f'WARNING in {self}: trying to copy same files {file.name}!')
-            if delete:
-                silentdelete(file)
         ### Create from string
         elif string:
             if self._log:
                 self._log(f'Create {self} from text')
-            self._path.write_text(string, encoding=getpreferredencoding())
+            with staged(self._path) as tmp:
+                tmp.write_text(string, encoding=getpreferredencoding())
 
     @catch_permission_error
     #--------------------------------------------------------------------------------
-    def append(self, string):
+    def append(self, string, atomic=False):
     #--------------------------------------------------------------------------------
+        # Appended in place, the file keeps its inode (e.g. for a Follower). With 
+        # atomic=True the content is cloned to a staged file that replaces the file.
+        self._register()
         if self._log:
             self._log(f'Append text to {self}')
-        with open(self._path, 'a', encoding=getpreferredencoding()) as file:
-            file.write(f'{string}\n')
+        if not atomic:
+            with open(self._path, 'a', encoding=getpreferredencoding()) as file:
+                file.write(f'{string}\n')
+            return
+        with staged(self._path) as tmp:
+            if self._path.is_file():
+                clone_file(self._path, tmp)
+            with open(tmp, 'a', encoding=getpreferredencoding()) as file:
+                file.write(f'{string}\n')
 
     @ignore_permission_error
     #--------------------------------------------------------------------------------
     def delete(self):
     #--------------------------------------------------------------------------------
+        self._registry.discard(self._path)
         if self._path.is_file():
             if self._log:
                 self._log(f'Delete {self}')
             self._path.unlink()
 
     #--------------------------------------------------------------------------------
-    def delete_all(self):
+    def delete_all(self, scan=False):
     #--------------------------------------------------------------------------------
-        for file in self.glob():
-            file.delete()
+        # Delete the created files, and with scan=True all matching files. The program
+        # usually deletes most of the created files, so with many registered files
+        # the directory is listed once and only the remaining ones are unlinked.
+        if self._base == '':
+            return
+        names = {p.name for p in self._registry}
+        if scan or len(names) >= DELETE_LIST_MIN:
+            listed = self._listing()
+            names = set(listed) if scan else names.intersection(listed)
+        for name in unlink_in(self._base_dir(), sorted(names)):
+            if self._log:
+                self._log(f'Delete {name}')
+        self._registry.clear()
         #[file.delete() for file in self.glob()]
 
     #--------------------------------------------------------------------------------
@@ -172,6 +276,13 @@ class Control_file:
         except PermissionError:
             return False
 
+    #--------------------------------------------------------------------------------
+    def wait(self, timeout=None):
+    #--------------------------------------------------------------------------------
+        # Block until the file exists, return False if timeout (seconds) is reached
+        with watch_files(self._path) as watcher:
+            return watcher.wait(timeout)
+
 
 
 
@@ -199,9 +310,12 @@ class Runner:                                                               # Ru
     def __init__(self, end_time=0, n=0, t=0, name='', app_name='', case='', exe='', cmd=None, pipe=False,
                  verbose=3, timer=None, runlog=None, ext_iface=(), ext_OK=(),
                  keep_files=False, stop_children=True, keep_alive=False, logtag=None, 
-                 time_regex=None, **kwargs):           # Runner
+                 time_regex=None, snapshot_ttl=SNAPSHOT_TTL, new_session=False, sample=None, capture=False,
+                 transport='file', trace=False, status=False, cold_suspend=None, placement=None,
+                 cgroup=False, batch_log=False, json_log=False, **kwargs):           # Runner
     #--------------------------------------------------------------------------------
         #print('runner.__init__: ',end_time, n, t, name, case,exe,cmd,ext_iface,ext_OK)
+        self.snapshot_ttl = snapshot_ttl
         self.reset_processes()
         self.name = name
         self.app_name = app_name
@@ -209,16 +323,24 @@ class Runner:                                                               # Ru
         self.children = ()
         self.main = None
         self.active = ()
+        self.group = ProcessGroup(ttl=snapshot_ttl)
         self.case = Path(case)
         self.exe = exe
         self.cmd = cmd
         self.logname = self.case.parent/f'{name.lower()}{logtag or ""}.log'
         self.logname.write_text('') # Clear old logs
         self.log = None
+        # Messages go to runlog (a file or a RunLog shared by several runners). With
+        # batch_log (or json_log) this runner writes them through its own RunLog.
+        self._own_runlog = not isinstance(runlog, RunLog) and bool(batch_log or json_log)
+        if self._own_runlog:
+            runlog = RunLog(runlog, json_path=json_log and self.case.parent/f'{name.lower()}_runlog.jsonl')
         self.runlog = runlog
         log4 = lambda x: self._print(x, v=4)
         self.interface_file = Control_file(self.case, *ext_iface, log=log4)
         self.OK_file = Control_file(self.case, *ext_OK, log=log4)
+        # Handshake with the program: 'file' (interface- and OK-files), 'pipe', 'fifo' or 'socket'
+        self.transport = make_transport(transport, self.interface_file, self.OK_file, self.case)
         self.popen = None
         self.stop_children = stop_children
         self.pipe = pipe
@@ -236,8 +358,45 @@ class Runner:                                                               # Ru
         self.keep_alive = keep_alive
         self.suspend_timer = None
         self.time_regex = time_regex
+        self.log_follower = LogFollower(self.logname, time_regex)
+        # Capture the output through a pipe instead of writing it directly to the log-file.
+        # Register patterns with self.output.watch()
+        self.output = OutputCapture() if capture else None
+        if self.output and time_regex:
+            self.output.watch('time', time_regex, convert=float)
         self.kwargs = kwargs
         self.unexpected_stop = False
+        self.wait_stats = None
+        # Start the run in a new session (and process group) so that all its 
+        # processes can be signalled with one killpg()
+        self.new_session = new_session
+        self.signal_results = []
+        # Spans of the life-cycle phases, exported to <name>_trace.json by close(). A
+        # Tracer can be passed to collect the spans of several runners in one trace.
+        self.tracer = trace if isinstance(trace, Tracer) else (Tracer() if trace else NULL_TRACER)
+        self._own_tracer = self.tracer is not trace
+        # Seconds between resource samples of the active processes (None: no sampling)
+        self.sample = sample
+        self.sampler = None
+        # Status record read by 'proclib top'. It is memory-mapped, so an update
+        # is a few memory writes and costs nothing measurable per step.
+        self.status = StatusRecord(name, case) if status else None
+        self.publish(end_time=float(end_time))
+        # Page out the memory of the processes after they have been suspended for
+        # cold_suspend seconds (None: never). The fault-in after each resume is in reclaim_stats.
+        self.cold_suspend = cold_suspend
+        self.reclaimer = None
+        self.cold_timer = None
+        self.reclaim_thread = None
+        self.reclaim_stats = []
+        # CPU pinning and priority of the processes, see Placement
+        self.placement = placement
+        # Run in a cgroup v2 leaf and suspend by freezing it, if cgroups are writable.
+        # With cgroup='accounting' this controller may be moved to a leaf of its own
+        # to enable the cpu/memory/io accounting, see Cgroup.
+        self.use_cgroup = cgroup
+        self.cgroup = None
+        self.teardown_report = None
         self.stdin = None
         if DEBUG:
             print(f'Creating {self}')
@@ -256,6 +415,14 @@ class Runner:                                                               # Ru
     def set_time(self, time):                                                # Runner
     #--------------------------------------------------------------------------------
         self.end_time = int(time)
+        self.publish(end_time=float(self.end_time))
+
+    #--------------------------------------------------------------------------------
+    def publish(self, **fields):                                             # Runner
+    #--------------------------------------------------------------------------------
+        # Update the status record with the step number and the given fields
+        if self.status:
+            self.status.update(n=self.n, **fields)
 
     #--------------------------------------------------------------------------------
     def reset_processes(self):                                               # Runner
@@ -264,6 +431,7 @@ class Runner:                                                               # Ru
         self.main = None
         self.children = []
         self.active = []
+        self.group = ProcessGroup(ttl=self.snapshot_ttl)
 
     #--------------------------------------------------------------------------------
     def check_input(self):                                                   # Runner
@@ -284,47 +452,101 @@ class Runner:                                                               # Ru
     def unexpected_stop_error(self, **kwargs):                               # Runner
     #--------------------------------------------------------------------------------
         self.unexpected_stop = True
+        self.flush_runlog()
         raise SystemError(f'ERROR {self.name} stopped unexpectedly after {self.time()} days'
                           + (self.log and f', check {Path(self.log.name).name} for details' or '') 
                           )
 
 
+    @traced
     #--------------------------------------------------------------------------------
     def start(self, error_func=None):                                        # Runner
     #--------------------------------------------------------------------------------
-        self.log = safeopen(self.logname, 'w') if not self.kwargs.get('to_screen', False) else None
+        self.popen = Popen(self.cmd, **self.prepare_start())
+        self.enter_cgroup()
+        self.stdin = self.popen.stdin
+        if self.output:
+            self.output.start(self.popen.stdout, log=self.log)
+        self.transport.connect(self.popen)
+        self.set_processes(error_func=error_func)
+        self.start_suspend_timer()
+
+    #--------------------------------------------------------------------------------
+    def prepare_start(self):                                                 # Runner
+    #--------------------------------------------------------------------------------
+        # Open the log-file and return the keyword arguments of the Popen call
+        kwargs = self.transport.prepare(self._popen_kwargs())
+        if self.use_cgroup:
+            self.cgroup = Cgroup.create(self.name.lower(), move_self=self.use_cgroup == 'accounting')
+            if self.cgroup:
+                # The program enters the cgroup before exec, so all its children are in it
+                kwargs['preexec_fn'] = self.cgroup.enter
+        return kwargs
+
+    #--------------------------------------------------------------------------------
+    def _popen_kwargs(self):                                                 # Runner
+    #--------------------------------------------------------------------------------
+        self.log = safeopen(self.logname, 'wb' if self.output else 'w') if not self.kwargs.get('to_screen', False) else None
+        self.log_follower.reset()
         self.starttime = datetime.now()
+        if self.output:
+            self._print(f"Starting \'{' '.join(self.cmd)}\' with output capture", v=1)
+            return {'stdin': PIPE if self.pipe else None, 'stdout': PIPE, 'stderr': STDOUT, 'start_new_session': self.new_session}
         if self.pipe:
             self._print("Starting in PIPE-mode", v=1)
-            self.popen = Popen(self.cmd, stdin=PIPE, stdout=self.log, stderr=STDOUT)
-            self.stdin = self.popen.stdin
-        else:
-            self._print(f"Starting \'{' '.join(self.cmd)}\'", v=1)
-            self.popen = Popen(self.cmd, stdout=self.log, stderr=self.log)
-            #self.popen = Popen(self.cmd, stdout=self.log, stderr=STDOUT)
-        self.set_processes(error_func=error_func)
+            return {'stdin': PIPE, 'stdout': self.log, 'stderr': STDOUT, 'start_new_session': self.new_session}
+        self._print(f"Starting \'{' '.join(self.cmd)}\'", v=1)
+        #self.popen = Popen(self.cmd, stdout=self.log, stderr=STDOUT)
+        return {'stdout': self.log, 'stderr': self.log, 'start_new_session': self.new_session}
+
+    #--------------------------------------------------------------------------------
+    def enter_cgroup(self):                                                  # Runner
+    #--------------------------------------------------------------------------------
+        # Check that the new process is in its cgroup, the signals are used if not
+        if not self.use_cgroup:
+            return
+        if self.cgroup:
+            if self.popen.pid in self.cgroup.pids():
+                self._print(f'Cgroup {self.cgroup.path}', v=2)
+                if not self.cgroup.accounting:
+                    self._print(f'Cgroup accounting is off: {self.cgroup.accounting_error}', v=1)
+                return
+            self._print(f'Unable to enter cgroup {self.cgroup.path}', v=2)
+            self.cgroup.remove()
+            self.cgroup = None
+        self._print('Cgroup v2 not writable, suspending with signals', v=2)
+
+    #--------------------------------------------------------------------------------
+    def cgroup_stats(self):                                                  # Runner
+    #--------------------------------------------------------------------------------
+        # CPU, memory and I/O accounting of the run, empty without cgroup
+        return self.cgroup.stats() if self.cgroup else {}
+
+    #--------------------------------------------------------------------------------
+    def start_suspend_timer(self):                                           # Runner
+    #--------------------------------------------------------------------------------
         if self.keep_alive > 0:
-            self.suspend_timer = TimerThread(limit=self.keep_alive, prec=SUSPEND_TIMER_PRECICION, func=self.suspend_active)
+            self.suspend_timer = TimerThread(limit=self.keep_alive, func=self.suspend_active)
 
     #--------------------------------------------------------------------------------
-    def is_mpi_process(self, wait=0.1):                                # Runner
+    def is_mpi_process(self, wait=0.1, limit=20):                       # Runner
     #--------------------------------------------------------------------------------
-        proc = None
+        # Return the 'mpirun' process started by this runner, i.e. the Popen
+        # process itself or one of its descendants
         cmd = ' '.join(self.cmd)
         # Only mpirun if np > 1
-        if '--np ' in cmd and int(cmd.split('--np ')[-1][0]) > 1:
-            # attempts = 20
-            # while attempts and not (proc:=Process.find('mpirun')):
-            #     attempts -= 1
-            #     sleep(wait)
-            n = 0
-            while n < 20:
-                if proc:=Process.find('mpirun'):
+        np = search(r'--np\s+(\d+)', cmd)
+        if np and int(np.group(1)) > 1:
+            # The first Process.find() does the first scan
+            table = ProcTable(scan=False)
+            strategy = Backoff(start=1e-3, cap=wait)
+            strategy.start(timeout=wait*limit)
+            while not strategy.expired():
+                if proc := Process.find('mpirun', ancestor=self.popen.pid, table=table):
                     return proc
-                sleep(wait)
-                n += 1
-        #return proc
+                sleep(strategy.next_pause())
 
+    @traced
     #--------------------------------------------------------------------------------
     def set_processes(self, error_func=None):                                # Runner
     #--------------------------------------------------------------------------------
@@ -338,10 +560,12 @@ class Runner:                                                               # Ru
         self._print(f'Parent process : {self.parent}, ')
         #self.parent.assert_running()
         # Find child processes (if they exists)
-        self.children, time = self.parent.get_children(log=self.verbose>3 and self._print)
+        with self.tracer.span('get_children', pid=self.parent.pid()) as span:
+            self.children, time = self.parent.get_children(log=self.verbose>3 and self._print)
+            span['children'] = len(self.children)
         self._print(
             'Child process' + (len(self.children)>1 and 'es' or '')
-            + (time is not None and f' ({time:.1f} sec)' or '')
+            + (time is not None and f' ({time:.3f} sec)' or '')
             + f' : {", ".join([str(p) for p in self.children])}'
         )
         # Set active and main processes
@@ -350,63 +574,156 @@ class Runner:                                                               # Ru
         self.active = [self.parent]
         if self.stop_children:
             self.active = self.children + [self.parent]
+        self.group = ProcessGroup(self.active, ttl=self.snapshot_ttl, cgroup=self.cgroup)
+        self.publish(pid=self.popen.pid, state=RUNNING, resumed=_time())
+        if self.placement:
+            self.place_processes()
+        if self.cold_suspend is not None:
+            self.reclaimer = Reclaimer([p.pid() for p in self.active])
+            self.cold_timer = TimerThread(limit=self.cold_suspend, func=self.start_reclaim)
+        if self.sample:
+            self.sampler = Sampler([p.pid() for p in self.active], interval=self.sample, filename=self.name.lower()).start()
 
 
+    #--------------------------------------------------------------------------------
+    def place_processes(self):                                               # Runner
+    #--------------------------------------------------------------------------------
+        # Claim CPUs not used by other runs on the node and pin the processes to them
+        if self.placement.cpus is None:
+            self.placement.allocate(self.name.lower(), nprocs=len(self.active))
+        self.placement.apply(self.active)
+        self._print(f'CPUs {format_cpulist(self.placement.cpus)}' + (' (spread)' if self.placement.spread else ''), v=2)
+        if self.placement.shared:
+            self._printwarning('Not enough free CPUs, sharing CPUs with other runs')
+        self.print_placement_errors()
+
+    #--------------------------------------------------------------------------------
+    def print_placement_errors(self):                                        # Runner
+    #--------------------------------------------------------------------------------
+        for pid, method, error in self.placement.errors:
+            self._printwarning(f'{method}() of process {pid} failed: {error}')
+        self.placement.errors = []
+
     #--------------------------------------------------------------------------------
     def get_logfile(self):                                                   # Runner
     #--------------------------------------------------------------------------------
         return self.log and self.log.name
 
+    @traced
+    #--------------------------------------------------------------------------------
+    def suspend_active(self, check=False, strategy=None):                    # Runner
+    #--------------------------------------------------------------------------------
+        # All processes are signalled in one pass, and with check=True confirmed 
+        # together with one deadline. Per-process results are kept in signal_results.
+        self.fault_in_stats()
+        self.signal_results = self.group.suspend(check=check, strategy=strategy, killpg=self.new_session)
+        self.publish(state=SUSPENDED)
+        if self.cold_timer:
+            self.reclaimer.arm()
+            self.cold_timer.start()
+        return all(r.sent for r in self.signal_results)
+
+    @traced
+    #--------------------------------------------------------------------------------
+    def resume_active(self, check=False, strategy=None):                     # Runner
+    #--------------------------------------------------------------------------------
+        # Cancel a pending page-out, or stop a running one
+        if self.cold_timer:
+            self.cold_timer.cancel_if_alive()
+            self.reclaimer.cancel()
+        self.signal_results = self.group.resume(check=check, strategy=strategy, killpg=self.new_session)
+        self.publish(state=RUNNING, resumed=_time())
+        if self.reclaimer:
+            self.reclaimer.resumed()
+        return all(r.sent for r in self.signal_results)
+
     #--------------------------------------------------------------------------------
-    def suspend_active(self):                                                # Runner
+    def start_reclaim(self):                                                 # Runner
     #--------------------------------------------------------------------------------
-        suspended = [p.suspend() for p in self.active]
-        return all(suspended)
+        # Called by the cold_timer when the processes have been suspended long enough.
+        # The page-out can take seconds and runs in its own thread, not in the timer thread.
+        self.reclaim_thread = Thread(target=self.reclaim_memory, name='proclib-reclaim', daemon=True)
+        self.reclaim_thread.start()
 
+    @traced
     #--------------------------------------------------------------------------------
-    def resume_active(self):                                                # Runner
+    def reclaim_memory(self):                                                # Runner
     #--------------------------------------------------------------------------------
-        resumed = [p.resume() for p in self.active]
-        return all(resumed)
+        size = self.reclaimer.reclaim()
+        self._print(f'Reclaimed {size/2**20:.1f} MB of suspended memory ({self.reclaimer.method})', v=3)
+        for target, error in self.reclaimer.errors:
+            self._printwarning(f'Unable to reclaim memory of {target}: {error}')
+        return size
 
+    #--------------------------------------------------------------------------------
+    def fault_in_stats(self):                                                # Runner
+    #--------------------------------------------------------------------------------
+        # Save the cost of getting the paged out memory back since the last resume
+        if self.reclaimer and (fault_in := self.reclaimer.fault_in()):
+            faults, swapped_in = fault_in
+            self.reclaim_stats.append({'n': self.n, 'reclaimed': self.reclaimer.reclaimed,
+                                       'major_faults': faults, 'swapped_in': swapped_in})
+            self.reclaimer.reclaimed = 0
+            self._print(f'Fault-in after cold suspend: {faults} major faults, {swapped_in/2**20:.1f} MB from swap', v=3)
 
     #--------------------------------------------------------------------------------
-    def suspend(self, check=False, v=2):                                     # Runner
+    def print_signal_results(self, v=3):                                     # Runner
+    #--------------------------------------------------------------------------------
+        results = self.signal_results
+        times = [r.confirmed for r in results if r.confirmed is not None]
+        self._print(f'{len(times)} of {len(results)} processes confirmed' 
+                    + (f' in {1000*max(times):.2f} ms' if times else ''), v=v)
+        # Raise error if processes disappeared
+        self.group.assert_running(log=self.log and self.log.name)
+
+
+    @traced
+    #--------------------------------------------------------------------------------
+    def suspend(self, check=False, v=2, strategy=None):                      # Runner
     #--------------------------------------------------------------------------------
         if self.keep_alive > 0:
             self._print('Delayed suspend', v=v)
+            self.publish(state=DELAYED)
+            if self.placement:
+                self.placement.lower()
             self.suspend_timer.start()
         elif self.keep_alive < 0:
             self._print('No suspend', v=v)
         else:
             self._print('Suspend', v=v)
-            self.suspend_active()
-            if check:
-                for proc in self.active:
-                    # self.wait_for(proc.is_sleeping, limit=100)
-                    self.wait_for(proc.is_sleeping, wait_min=0.02)
             if self.timer:
                 self.timer.stop()
+            with self.timed('suspend'):
+                self.suspend_active(check=check, strategy=strategy)
+            if check:
+                self.print_signal_results()
         self.print_process_status()
 
 
+    @traced
     #--------------------------------------------------------------------------------
-    def resume(self, check=False, v=2):                                      # Runner
+    def resume(self, check=False, v=2, strategy=None):                       # Runner
     #--------------------------------------------------------------------------------
+        # Restore the priority lowered in the delayed-suspend window
+        if self.placement:
+            self.placement.restore()
+            self.print_placement_errors()
         if self.keep_alive > 0 and self.suspend_timer.cancel_if_alive():
             self._print(f'No resume (suspend delayed {self.suspend_timer.endtime():.0f} sec)', v=v)
+            self.publish(state=RUNNING)
         elif self.keep_alive < 0:
             self._print('No resume (not suspended)', v=v)
         else:
             msg = 'Resume'
             if self.suspend_timer and not self.suspend_timer.is_alive():
+                # A delayed suspend may still be signalling the processes
+                self.suspend_timer.join()
                 msg += f' (suspended {-self.suspend_timer.uptime():.0f} sec ago)'
             self._print(msg, v=v)
-            self.resume_active()
+            with self.timed('resume'):
+                self.resume_active(check=check, strategy=strategy)
             if check:
-                for proc in self.active:
-                    # self.wait_for(proc.is_running, limit=100)
-                    self.wait_for(proc.is_running, wait_min=0.02)
+                self.print_signal_results()
             if self.timer:
                 self.timer.start()
         self.print_process_status()
@@ -414,7 +731,8 @@ class Runner:                                                               # Ru
     #--------------------------------------------------------------------------------
     def print_process_status(self, v=3):                                     # Runner
     #--------------------------------------------------------------------------------
-        self._print(', '.join( [str(p.current_status()) for p in self.active] ), v=v)
+        if v <= self.verbose:
+            self._print(self.group.status(), v=v)
 
 
     #--------------------------------------------------------------------------------
@@ -426,20 +744,20 @@ class Runner:                                                               # Ru
             self._print(text, v=v)
 
 
+    @traced
     #--------------------------------------------------------------------------------
     def time(self, tag='TIME'):                                              # Runner
     #--------------------------------------------------------------------------------
+        # Only the part of the log written since the last call is scanned
         t = 0
-        if self.log:
+        if self.output and 'time' in self.output.patterns:
+            # Updated by the capture as the output arrives
+            t = self.output.value('time', 0)
+        elif self.log:
             self.log.flush() 
-        #     match = matches(file=self.logname, pattern=self.time_regex)
-        #     time = [m.group(1) for m in match]
-        #     t = time[-1] if time else 0           
-        # return float(t)
-            chunks = (txt for txt in tail_file(self.logname, size=10*1024) if tag in txt)
-            if data:=next(chunks, None):
-                days = findall(self.time_regex, data)
-                t = float(days[-1]) if days else 0
+            self.log_follower.update(tag=tag)
+            t = self.log_follower.value()
+        self.publish(t=float(t))
         return t
 
 
@@ -453,10 +771,16 @@ class Runner:                                                               # Ru
                 f'INFO Run stopped after {self.time():.2f}'.rstrip('0').rstrip('.') + f' {unit}')
         return True
 
+    #--------------------------------------------------------------------------------
+    def _iteration(self):                                                    # Runner
+    #--------------------------------------------------------------------------------
+        # One wait-loop iteration reads the state of the processes once
+        return self.group.pinned()
+
     #--------------------------------------------------------------------------------
     def is_running(self):                                                    # Runner
     #--------------------------------------------------------------------------------
-        return all(proc.is_running() for proc in self.active)
+        return self.group.is_running()
 
     #--------------------------------------------------------------------------------
     def assert_running_and_stop_if_canceled(self, raise_error=True):         # Runner
@@ -464,7 +788,7 @@ class Runner:                                                               # Ru
         log = self.log and self.log.name
         # for proc in self.active:
         #     proc.assert_running(raise_error=raise_error, log=log)
-        is_running = [proc.assert_running(raise_error=raise_error, log=log) for proc in self.active]            
+        is_running = self.group.assert_running(raise_error=raise_error, log=log)
         is_not_stopped = self.stop_if_canceled()
         return all(is_running) and is_not_stopped
 
@@ -494,39 +818,64 @@ class Runner:                                                               # Ru
     #--------------------------------------------------------------------------------
     #def wait_for(self, func, *args, timer=False, limit=None, pause=0.01, v=2, error=None, raise_error=False, log=None, loop_func=None, **kwargs):
     def wait_for(self, func, *args, timer=False, wait_min=None, pause=0.01, v=2, error=None, 
-                 raise_error=False, log=None, loop_func=None, func_name=None, **kwargs):
-    #--------------------------------------------------------------------------------
-        limit = int(wait_min*60/pause) if wait_min else None
-        if timer:
-            starttime = datetime.now()
+                 raise_error=False, log=None, loop_func=None, func_name=None, sleep_func=sleep, strategy=None, **kwargs):
+    #--------------------------------------------------------------------------------
+        # The wait_min deadline is measured with a monotonic clock. The strategy 
+        # (see proclib.Wait) sets the pause between checks, default is a fixed pause
+        strategy, timeout, loop_func, func_name = self._wait_for_setup(func, wait_min, pause, v, loop_func,
+                                                                       func_name, strategy, kwargs)
+        # If the deadline is reached this function returns -1
+        with self.tracer.span('wait_for', func=func_name, n=self.n) as span:
+            n = loop_until(func, *args, timeout=timeout, strategy=strategy, loop_func=loop_func, sleep_func=sleep_func,
+                           iteration=self._iteration, **kwargs)
+            span['loops'] = n
+        return self._wait_for_result(n, strategy, timer, wait_min, v, error, raise_error, log, func_name)
+
+    #--------------------------------------------------------------------------------
+    def _wait_for_setup(self, func, wait_min, pause, v, loop_func, func_name, strategy, kwargs):  # Runner
+    #--------------------------------------------------------------------------------
+        # Shared by Runner.wait_for and AsyncRunner.wait_for: the strategy, the
+        # timeout in seconds, the loop function and the name of the waited function
+        strategy = strategy or Fixed(pause)
+        timeout = wait_min*60 if wait_min else None
         if not loop_func:
             # Default checks during loop
             loop_func = self.assert_running_and_stop_if_canceled
         func_name = func_name or func.__qualname__
-        passed_args = ','.join([f'{k}={v}' for k,v in kwargs.items()])
-        self._print(f'Calling wait_for( {func_name}({passed_args}), limit={limit}, pause={pause} )... ', v=v, end='')
-        # If limit is reached this function returns -1
-        n = loop_until(func, *args, pause=pause, limit=limit, loop_func=loop_func, **kwargs)
+        self._print(lambda: f'Calling wait_for( {func_name}({",".join(f"{k}={a}" for k, a in kwargs.items())}), '
+                            + f'wait_min={wait_min}, strategy={strategy} )... ', v=v, end='')
+        return strategy, timeout, loop_func, func_name
+
+    #--------------------------------------------------------------------------------
+    def _wait_for_result(self, n, strategy, timer, wait_min, v, error, raise_error, log, func_name):  # Runner
+    #--------------------------------------------------------------------------------
+        # Save the wait statistics and report the outcome of the loop, n<0 if the deadline was reached
+        self.wait_stats = strategy.stats()
         time = ''
         if timer:
-            time = f' ({(datetime.now()-starttime).total_seconds():.2f} sec)'
+            time = f' ({self.wait_stats["elapsed"]:.2f} sec)'
         if n<0:
             if raise_error:
-                raise SystemError(error or f'wait_for({func_name}) reached loop-limit {limit}')
-            self._print(f'loop limit reached!{time}' or '', tag='', v=v)
+                raise SystemError(error or f'wait_for({func_name}) reached time-limit of {wait_min} minutes')
+            self._print(f'time limit reached!{time}' or '', tag='', v=v)
             return False
-        self._print(str(n) + f' loops{time}', tag='', v=v)
+        wakeups, wasted = strategy.wakeups, strategy.wasted
+        self._print(lambda: f'{n} loops, {wakeups} wakeups, {wasted} wasted checks{time}', tag='', v=v)
         if callable(log):
             self._print(log())
         return True
 
 
     #--------------------------------------------------------------------------------
-    def wait_for_process_to_finish(self, v=2, wait_min=None, pause=None, loop_func=None, msg=None):      # Runner
+    def wait_for_process_to_finish(self, v=2, wait_min=None, pause=None, loop_func=None, msg=None, strategy=None):      # Runner
     #--------------------------------------------------------------------------------
         msg = msg or 'Waiting for parent process to finish'
         self._print(msg, v=v)
-        success = self.wait_for(self.parent.is_not_running, raise_error=False, pause=pause, wait_min=wait_min, loop_func=loop_func)
+        # The watcher wakes up when the process exits (pidfd), pause is only the
+        # interval between the loop_func calls. The Popen child is reaped.
+        with watch_exit(self.parent, popen=self.popen) as watcher:
+            success = self.wait_for(watcher.done, raise_error=False, pause=pause or EXIT_CHECK_PAUSE, wait_min=wait_min, 
+                                    loop_func=loop_func, strategy=strategy, sleep_func=watcher.wait, func_name='exit')
         if not success:
             #time = (limit or 0)*(pause or 0)/60
             self._print('', tag='')
@@ -535,14 +884,46 @@ class Runner:                                                               # Ru
             self.kill()
 
 
+    @traced
+    #--------------------------------------------------------------------------------
+    def wait_for_files(self, *files, wait_min=None, log=None, pause=FILE_CHECK_PAUSE, **kwargs):        # Runner
+    #--------------------------------------------------------------------------------
+        # The watcher wakes up as soon as a file appears, pause is only the
+        # interval between the process checks done by loop_func
+        paths = [Path(f) for f in files]
+        with self.timed('wait'), watch_files(*paths) as watcher:
+            for path in paths:
+                func_name = f'Path({path.name}).is_file'
+                self.wait_for(path.is_file, wait_min=wait_min, pause=pause, sleep_func=watcher.wait, raise_error=True, 
+                              error=f'{path} is missing', func_name=func_name, **kwargs)
+                if callable(log):
+                    log(f'{path.name} exists')
+
+
+    @traced
+    #--------------------------------------------------------------------------------
+    def send(self, message='', n=None):                                      # Runner
+    #--------------------------------------------------------------------------------
+        # Hand over to the program: create interface-file n (file transport) 
+        # or write the message (or n) as one line
+        self.publish()
+        try:
+            self.transport.send(message, n=n)
+        except BrokenPipeError:
+            self.unexpected_stop_error()
+
+    @traced
     #--------------------------------------------------------------------------------
-    def wait_for_files(self, *files, wait_min=None, log=None, **kwargs):        # Runner
+    def receive(self, wait_min=None, pause=FILE_CHECK_PAUSE, **kwargs):      # Runner
     #--------------------------------------------------------------------------------
-        for path in map(Path, files):
-            func_name = f'Path({path.name}).is_file'
-            self.wait_for(path.is_file, wait_min=wait_min, raise_error=True, error=f'{path} is missing', func_name=func_name, **kwargs)
-            if callable(log):
-                log(f'{path.name} exists')
+        # Wait for the reply of the program (OK-file or message) and return its text
+        with self.timed('wait'), self.transport.waiting() as waiter:
+            self.wait_for(self.transport.ready, wait_min=wait_min, pause=pause, sleep_func=waiter.wait,
+                          raise_error=True, error=f'No reply from {self.name}', func_name='transport.ready', **kwargs)
+        message = self.transport.take()
+        if message is None:
+            self.unexpected_stop_error()
+        return message
 
 
     #--------------------------------------------------------------------------------
@@ -550,22 +931,62 @@ class Runner:                                                               # Ru
     #--------------------------------------------------------------------------------
         self.canceled = True
 
+    #--------------------------------------------------------------------------------
+    def timed(self, phase):                                                  # Runner
+    #--------------------------------------------------------------------------------
+        # Context manager that times a phase if the timer is on
+        return self.timer.phase(phase) if self.timer else nullcontext()
+
     #--------------------------------------------------------------------------------
     def close(self):                                                         # Runner
     #--------------------------------------------------------------------------------
-        self.reset_processes()
-        # Close log-file
-        if self.log:
-            self.log.close()
-        self.log = None
-        # Stop and delete the suspend-timer-thread
-        if self.suspend_timer:
-            self.suspend_timer.close()
-        self.suspend_timer = None # For garbage collector (__del__)
-        # Delete interface-files
-        if not self.keep_files:
-            self.interface_file.delete_all()
-            self.OK_file.delete()
+        with self.tracer.span('close', n=self.n):
+            self.reset_processes()
+            # Stop the resource sampler and save the samples
+            if self.sampler:
+                self.sampler.close()
+            # Save buffered step times and statistics
+            if self.timer:
+                self.timer.close()
+            # Let the capture write the last output before the log-file is closed
+            if self.output:
+                self.output.join(timeout=CAPTURE_JOIN_TIMEOUT)
+                self.output.detach()
+            # Close log-file
+            if self.log:
+                self.log.close()
+            self.log = None
+            # Stop and delete the suspend-timer-thread
+            if self.suspend_timer:
+                self.suspend_timer.close()
+            self.suspend_timer = None # For garbage collector (__del__)
+            # Delete the cgroup, kept if processes are still in it
+            if self.cgroup and self.cgroup.remove():
+                self.cgroup = None
+            # Free the claimed CPUs
+            if self.placement:
+                self.placement.release()
+            if self.cold_timer:
+                self.cold_timer.close()
+                self.reclaimer.cancel()
+                if self.reclaim_thread:
+                    self.reclaim_thread.join()
+                self.fault_in_stats()
+            self.cold_timer = None
+            self.reclaim_thread = None
+            # Delete interface-files, or close the pipe/socket
+            self.transport.close(keep_files=self.keep_files)
+            # Remove the status record
+            if self.status:
+                self.status.close()
+        # Write the queued messages
+        if self._own_runlog:
+            self.runlog.close()
+        else:
+            self.flush_runlog()
+        # Export the trace after the close-span has ended
+        if self.tracer and self._own_tracer:
+            self.tracer.export(f'{self.name.lower()}_trace.json')
 
 
     #--------------------------------------------------------------------------------
@@ -575,25 +996,29 @@ class Runner:                                                               # Ru
         self._print('Quitting', v=v)
         self.resume()
         #self.wait_for_process_to_finish(msg='Waiting for process to quit', limit=6000, pause=0.01, loop_func=loop_func)
-        self.wait_for_process_to_finish(msg='Waiting for process to quit', wait_min=1, pause=0.01, loop_func=loop_func)
+        self.wait_for_process_to_finish(msg='Waiting for process to quit', wait_min=1, pause=60, loop_func=loop_func)
         self.close()
         self._print('Finished', v=v)
 
 
     #--------------------------------------------------------------------------------
-    def kill(self, v=2):                                                     # Runner
-    #--------------------------------------------------------------------------------
-        # terminate children before parent
-        #procs = self.children + (self.parent and [self.parent] or []) 
-        for process in self.active:
-            try:
-                self._print(f'Killing {process}...', end='', v=v)
-                process.kill()
-                self._print('done', tag='', v=v)
-            except (psutil.NoSuchProcess, ProcessLookupError):
-                self._print('process already gone', tag='', v=v)            
-            except psutil.AccessDenied:
-                self._print('access denied!!!', tag='', v=v)            
+    def kill(self, v=2, grace=TERM_GRACE, timeout=KILL_TIMEOUT):             # Runner
+    #--------------------------------------------------------------------------------
+        # The whole process tree gets SIGTERM at once, and SIGKILL if still alive
+        # after 'grace' seconds (right away if grace=0). The outcome is in teardown_report.
+        with self.tracer.span('kill', n=self.n, pid=self.popen and self.popen.pid) as span:
+            roots = [self.popen.pid] if self.popen and self.popen.returncode is None else []
+            report = self.group.teardown(grace=grace, timeout=timeout, roots=roots, popen=roots and self.popen)
+            span.update(terminated=len(report.terminated), killed=len(report.killed), alive=len(report.alive))
+        self.teardown_report = report
+        self._print(f'Stopped {len(report.terminated) + len(report.killed) + len(report.zombies)} processes in {report.elapsed:.3f} sec ' 
+                    + f'({len(report.terminated)} terminated, {len(report.killed)} killed, {len(report.zombies)} zombies, '
+                    + f'{len(report.gone)} already gone)', v=v)
+        if report.alive:
+            self._printwarning(f'Processes still alive after kill: {", ".join(str(p) for p in report.alive)}')
+        # Reap the child process
+        if hasattr(self.popen, 'poll'):
+            self.popen.poll()
         self.close()
 
     
@@ -611,7 +1036,14 @@ class Runner:                                                               # Ru
     #--------------------------------------------------------------------------------
     def _print(self, txt, v=1, tag=True, flush=True, **kwargs):              # Runner
     #--------------------------------------------------------------------------------
+        # txt can be a callable returning the text, it is only called if the message is printed
         if v <= self.verbose:
+            if isinstance(self.runlog, RunLog):
+                # Formatted and written by the RunLog thread
+                self.runlog.write(self.name if tag is True else None, txt, v=v, end=kwargs.get('end', '\n'))
+                return
+            if callable(txt):
+                txt = txt()
             if isinstance(txt, str):
                 txt = [txt]
             txt = (str(t) for t in txt)
@@ -623,9 +1055,16 @@ class Runner:                                                               # Ru
             print(txt, file=self.runlog, flush=flush, **kwargs)
 
 
+    #--------------------------------------------------------------------------------
+    def flush_runlog(self, timeout=RUNLOG_FLUSH_TIMEOUT):                   # Runner
+    #--------------------------------------------------------------------------------
+        if isinstance(self.runlog, RunLog):
+            self.runlog.flush(timeout=timeout)
+
     #--------------------------------------------------------------------------------
     def _printerror(self, txt, **kwargs):                                    # Runner
     #--------------------------------------------------------------------------------
+        self.flush_runlog()
         print()
         print('  ERROR: ' + txt, **kwargs)
         print('', flush=True)
@@ -634,6 +1073,7 @@ class Runner:                                                               # Ru
     #--------------------------------------------------------------------------------
     def _printwarning(self, txt, **kwargs):                                  # Runner
     #--------------------------------------------------------------------------------
+        self.flush_runlog()
         print()
         print('  WARNING: ' + txt, **kwargs)
         print('', flush=True)
@@ -646,20 +1086,48 @@ class Runner:                                                               # Ru
 
 
 #------------------------------------------------
-def loop_until(func, *args, limit=None, pause=None, loop_func=None, **kwargs):
+def loop_until(func, *args, sleep_func=sleep, **kwargs):
+#------------------------------------------------
+    # Returns the number of loops, or -1 if the loop limit or the timeout (seconds) is reached.
+    # The strategy (see proclib.Wait) gives the pause between checks.
+    steps = loop_steps(func, *args, **kwargs)
+    try:
+        while True:
+            if pause := next(steps):
+                sleep_func(pause)
+    except StopIteration as stop:
+        return stop.value
+
 #------------------------------------------------
+def loop_steps(func, *args, limit=None, pause=None, timeout=None, strategy=None, loop_func=None,
+               iteration=nullcontext, **kwargs):
+#------------------------------------------------
+    # The loop of loop_until and AsyncRunner's async_loop_until as a generator: it 
+    # yields the pauses to sleep (0 when spinning) and returns the number of loops.
+    # loop_func and func of one iteration are called inside the iteration() context
+    strategy = strategy or Fixed(pause)
+    strategy.start(timeout)
     n = 0
     if not loop_func:
         loop_func = lambda:None
     while True:
-        if func(*args, **kwargs):
+        with iteration():
+            if n and not strategy.spinning():
+                loop_func()
+            strategy.checks += 1
+            done = func(*args, **kwargs)
+        if done:
             return n
+        strategy.wasted += 1
+        if strategy.expired():
+            return -1
+        pause = strategy.next_pause()
+        yield pause
         if pause:
-            sleep(pause)
+            strategy.wakeups += 1
         n += 1
         if limit and n > limit:
             return -1
-        loop_func()
 
 #------------------------------------------------
 def safeopen(filename, mode):
@@ -670,6 +1138,105 @@ def safeopen(filename, mode):
     except OSError as error:
         raise SystemError(f'Unable to open file {filename}: {error}') from error
 
+#------------------------------------------------
+def umask():
+#------------------------------------------------
+    # The umask of the process, read from /proc so that it is not changed
+    # (os.umask() sets it while other threads may create files)
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+@contextmanager
+#------------------------------------------------
+def staged(path):
+#------------------------------------------------
+    # Yield a temporary path next to 'path' that replaces 'path' atomically
+    # on exit, or is deleted if an exception is raised
+    path = Path(path)
+    fd, tmp = mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.close(fd)
+    tmp = Path(tmp)
+    try:
+        # mkstemp() creates files that are only readable by the owner
+        os.chmod(tmp, 0o666 & ~umask())
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        silentdelete(tmp)
+        raise
+
+#------------------------------------------------
+def move_file(src, dst):
+#------------------------------------------------
+    # Rename src to dst, return False if they are on different file-systems
+    try:
+        os.replace(src, dst)
+        return True
+    except OSError as error:
+        if error.errno == errno.EXDEV:
+            return False
+        raise
+
+#------------------------------------------------
+def clone_file(src, dst):
+#------------------------------------------------
+    # Copy src to dst without passing the data through user space: reflink
+    # if the file-system supports it, else copy_file_range(), else a plain copy
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if fcntl:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_CHUNK):
+                    pass
+                return
+            except OSError as error:
+                if error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        copyfileobj(fsrc, fdst)
+
+#------------------------------------------------
+def unlink_in(directory, names):
+#------------------------------------------------
+    # Delete files in one directory, using unlink relative to a directory
+    # descriptor if supported. Return the names of the deleted files.
+    deleted = []
+    dir_fd = None
+    if os.unlink in os.supports_dir_fd:
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+        except OSError:
+            return deleted
+    try:
+        for name in names:
+            try:
+                if dir_fd is None:
+                    os.unlink(Path(directory)/name)
+                else:
+                    os.unlink(name, dir_fd=dir_fd)
+                deleted.append(name)
+            except (FileNotFoundError, PermissionError, IsADirectoryError):
+                pass
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return deleted
+
 #------------------------------------------------
 def silentdelete(*fname, echo=False):
 #------------------------------------------------
@@ -0,0 +1,240 @@
+import os
+from re import search
+from threading import Thread, Condition
+from collections import namedtuple
+from time import monotonic
+
+from proclib.Runner import Runner
+
+
+# Result of one run. status is 'complete', 'failed' or 'canceled',
+# run_time is the wall time in seconds
+RunResult = namedtuple('RunResult', 'name status run_time message')
+
+
+#--------------------------------------------------------------------------------
+def available_cores():
+#--------------------------------------------------------------------------------
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+#--------------------------------------------------------------------------------
+def cores_of(spec):
+#--------------------------------------------------------------------------------
+    # Number of cores used by a run: 'np' in the spec or the mpirun --np value
+    if spec.get('np'):
+        return int(spec['np'])
+    np = search(r'--np\s+(\d+)', ' '.join(spec.get('cmd') or ()))
+    return int(np.group(1)) if np else 1
+
+
+#--------------------------------------------------------------------------------
+def run_to_end(runner):
+#--------------------------------------------------------------------------------
+    # Default driver: wait for the program to finish
+    runner.wait_for_process_to_finish(loop_func=runner.stop_if_canceled)
+
+
+#====================================================================================
+class Run:
+#====================================================================================
+    # Book-keeping of one run in the pool
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, index, spec):                                          # Run
+    #--------------------------------------------------------------------------------
+        self.index = index
+        self.spec = dict(spec)
+        self.driver = self.spec.pop('driver', None) or run_to_end
+        self.np = cores_of(self.spec)
+        self.spec.pop('np', None)
+        self.runner = None
+        self.thread = None
+        self.ready = False        # True when the processes are started and known
+        self.done = False
+        self.suspended = False    # Suspended by the pool (time-slicing)
+        self.since = monotonic()  # Time of the last suspend or resume by the pool
+        self.result = None
+
+
+#====================================================================================
+class RunnerPool:
+#====================================================================================
+    """
+
+    Run an ensemble of Runners, keeping as many runs in flight as the
+    available cores allow.
+
+    Each run is given by a spec, a dict of Runner arguments (cmd, case,
+    ext_iface, ext_OK, end_time, ...) with two optional extra keys:
+      'np'     : number of cores used by the run (default from mpirun --np)
+      'driver' : function called with the started Runner that drives the
+                 run, e.g. the coupling loop (default waits for the program
+                 to finish)
+
+    The driver may raise SystemError, as Runner does, and runs that raise
+    an 'INFO' message (e.g. end_time reached) count as complete.
+
+    With oversubscribe > 1 more runs than cores are started, and the pool
+    time-slices them by suspending and resuming the processes every
+    time_slice seconds, which is then required. Drivers that suspend/resume the runner themselves
+    should not be time-sliced.
+
+    Initialization:
+    RunnerPool(cores=None, oversubscribe=1, time_slice=None, runner=Runner, **defaults)
+
+    Methods:
+      run(specs)
+      cancel()
+
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, cores=None, oversubscribe=1, time_slice=None, runner=Runner, **defaults):   # RunnerPool
+    #--------------------------------------------------------------------------------
+        if oversubscribe > 1 and not time_slice:
+            raise ValueError(f'RunnerPool with oversubscribe={oversubscribe} needs a time_slice (seconds)')
+        self.cores = cores or available_cores()
+        self.oversubscribe = oversubscribe
+        self.time_slice = time_slice
+        self.runner_class = runner
+        self.defaults = defaults
+        self.canceled = False
+        self._runs = []
+        self._cond = Condition()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                   # RunnerPool
+    #--------------------------------------------------------------------------------
+        return f'<RunnerPool(cores={self.cores}, oversubscribe={self.oversubscribe}, time_slice={self.time_slice})>'
+
+    #--------------------------------------------------------------------------------
+    def in_flight(self):                                                  # RunnerPool
+    #--------------------------------------------------------------------------------
+        return [r for r in self._runs if r.thread and not r.done]
+
+    #--------------------------------------------------------------------------------
+    def cancel(self):                                                     # RunnerPool
+    #--------------------------------------------------------------------------------
+        # Stop launching new runs and cancel the runs in flight
+        with self._cond:
+            self.canceled = True
+            for run in self.in_flight():
+                if run.runner:
+                    run.runner.cancel()
+            self._cond.notify_all()
+
+    #--------------------------------------------------------------------------------
+    def run(self, specs):                                                 # RunnerPool
+    #--------------------------------------------------------------------------------
+        # Run all specs and return a list of RunResult in the same order
+        self._runs = [Run(i, spec) for i, spec in enumerate(specs)]
+        queue = list(self._runs)
+        with self._cond:
+            while queue or self.in_flight():
+                while queue and not self.canceled and self._fits(queue[0].np):
+                    self._launch(queue.pop(0))
+                if self.canceled:
+                    for run in queue:
+                        run.result = RunResult(run.spec.get('name', ''), 'canceled', 0, '')
+                    queue = []
+                self._cond.wait(timeout=self.time_slice)
+                if self.time_slice:
+                    self._rotate()
+        for run in self._runs:
+            run.thread and run.thread.join()
+        return [run.result for run in self._runs]
+
+    #--------------------------------------------------------------------------------
+    def _fits(self, np):                                                  # RunnerPool
+    #--------------------------------------------------------------------------------
+        used = sum(r.np for r in self.in_flight())
+        # A run larger than the node is started when nothing else runs
+        return used + np <= self.cores*self.oversubscribe or used == 0
+
+    #--------------------------------------------------------------------------------
+    def _launch(self, run):                                               # RunnerPool
+    #--------------------------------------------------------------------------------
+        run.thread = Thread(target=self._execute, args=(run,), daemon=True)
+        run.thread.start()
+
+    #--------------------------------------------------------------------------------
+    def _execute(self, run):                                              # RunnerPool
+    #--------------------------------------------------------------------------------
+        # Worker thread, uses the normal Runner life-cycle
+        starttime = monotonic()
+        status, message = 'complete', ''
+        runner = None
+        try:
+            runner = self.runner_class(**{**self.defaults, **run.spec})
+            with self._cond:
+                run.runner = runner
+            runner.start()
+            with self._cond:
+                run.ready = True
+            run.driver(runner)
+            code = runner.popen.poll()
+            if code:
+                status, message = 'failed', f'exit code {code}'
+        except SystemError as error:
+            message = str(error)
+            if not message.startswith('INFO'):
+                status = 'failed'
+            if runner and runner.canceled:
+                status = 'canceled'
+        except Exception as error:
+            status, message = 'failed', repr(error)
+        with self._cond:
+            run.done = True
+            suspended = run.suspended
+        self._teardown(runner, status, suspended)
+        run.result = RunResult(run.spec.get('name', ''), status, monotonic() - starttime, message)
+        with self._cond:
+            self._cond.notify_all()
+
+    #--------------------------------------------------------------------------------
+    def _teardown(self, runner, status, suspended):                       # RunnerPool
+    #--------------------------------------------------------------------------------
+        if not runner or not runner.popen:
+            return
+        try:
+            if suspended:
+                runner.resume_active()
+            if status == 'complete':
+                runner.quit()
+            else:
+                runner.kill()
+        except (SystemError, OSError):
+            runner.close()
+
+    #--------------------------------------------------------------------------------
+    def _rotate(self):                                                    # RunnerPool
+    #--------------------------------------------------------------------------------
+        # Time-slicing: keep at most 'cores' cores resumed. Runs that have used
+        # their slice are suspended to make room for runs waiting the longest.
+        runs = [r for r in self.in_flight() if r.ready]
+        now = monotonic()
+        resumed = sorted([r for r in runs if not r.suspended], key=lambda r: r.since)
+        waiting = sorted([r for r in runs if r.suspended], key=lambda r: r.since)
+        used = sum(r.np for r in resumed)
+        while used > self.cores and len(resumed) > 1:
+            used -= self._slice(resumed.pop(0), suspend=True, now=now)
+        for run in waiting:
+            while used + run.np > self.cores and resumed and now - resumed[0].since >= self.time_slice:
+                used -= self._slice(resumed.pop(0), suspend=True, now=now)
+            if used + run.np <= self.cores:
+                used += self._slice(run, suspend=False, now=now)
+
+    #--------------------------------------------------------------------------------
+    def _slice(self, run, suspend, now):                                  # RunnerPool
+    #--------------------------------------------------------------------------------
+        if suspend:
+            run.runner.suspend_active()
+        else:
+            run.runner.resume_active()
+        run.suspended = suspend
+        run.since = now
+        return run.np
@@ -0,0 +1,302 @@
+import os
+from array import array
+from pathlib import Path
+from time import monotonic
+from threading import Thread, Event, Lock
+
+import psutil
+
+
+PROC = '/proc'
+SAMPLE_INTERVAL = 1.0    # Seconds between samples
+SAMPLE_ROWS = 100000     # Rows (one per process and sample) kept in the ring buffer
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# Columns of the ring buffer. cpu is user+system seconds, rss and pss are bytes,
+# read and write are bytes of storage I/O, vcs and ivcs are the voluntary and
+# involuntary context switches. All counters are cumulative since process start.
+FIELDS = ('time', 'pid', 'cpu', 'rss', 'pss', 'read', 'write', 'threads', 'vcs', 'ivcs')
+
+
+#====================================================================================
+class SampleBuffer:
+#====================================================================================
+    """
+    Fixed-size columnar ring buffer, one array per field. When full, the
+    oldest rows are overwritten.
+
+    Methods:
+      append(row)
+      column(field, pid=None)
+      rows()
+      clear()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, size=SAMPLE_ROWS, fields=FIELDS):                # SampleBuffer
+    #--------------------------------------------------------------------------------
+        self.size = size
+        self.fields = fields
+        self.columns = {f: array('q' if f == 'pid' else 'd', bytes(8*size)) for f in fields}
+        self.clear()
+
+    #--------------------------------------------------------------------------------
+    def __len__(self):                                                  # SampleBuffer
+    #--------------------------------------------------------------------------------
+        return min(self.count, self.size)
+
+    #--------------------------------------------------------------------------------
+    def clear(self):                                                    # SampleBuffer
+    #--------------------------------------------------------------------------------
+        self.count = 0     # Rows appended in total
+
+    #--------------------------------------------------------------------------------
+    def append(self, row):                                              # SampleBuffer
+    #--------------------------------------------------------------------------------
+        i = self.count % self.size
+        for field, value in zip(self.fields, row):
+            self.columns[field][i] = value
+        self.count += 1
+
+    #--------------------------------------------------------------------------------
+    def _order(self):                                                   # SampleBuffer
+    #--------------------------------------------------------------------------------
+        # Row indices from oldest to newest
+        if self.count <= self.size:
+            return range(self.count)
+        start = self.count % self.size
+        return [*range(start, self.size), *range(start)]
+
+    #--------------------------------------------------------------------------------
+    def column(self, field, pid=None):                                  # SampleBuffer
+    #--------------------------------------------------------------------------------
+        # Values of one field, oldest first, optionally for one process only
+        col = self.columns[field]
+        if pid is None:
+            return [col[i] for i in self._order()]
+        pids = self.columns['pid']
+        return [col[i] for i in self._order() if pids[i] == pid]
+
+    #--------------------------------------------------------------------------------
+    def rows(self):                                                     # SampleBuffer
+    #--------------------------------------------------------------------------------
+        cols = [self.columns[f] for f in self.fields]
+        return [tuple(c[i] for c in cols) for i in self._order()]
+
+
+#====================================================================================
+class Sampler:
+#====================================================================================
+    """
+    Sample the resource use of a set of processes at a fixed interval in a
+    background thread. Each tick reads /proc/<pid>/stat, status and io once
+    per process (and smaps_rollup if pss=True, which is more costly) and
+    appends one row per process to a SampleBuffer. Without /proc the values
+    are read with psutil oneshot().
+
+    Initialization:
+    Sampler(pids, interval=SAMPLE_INTERVAL, size=SAMPLE_ROWS, pss=False, filename=None)
+
+    Methods:
+      start()
+      sample()
+      latest()
+      column(field, pid=None)
+      summary()
+      dump(path=None)
+      close()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, pids, interval=SAMPLE_INTERVAL, size=SAMPLE_ROWS, pss=False, filename=None):  # Sampler
+    #--------------------------------------------------------------------------------
+        self.pids = [int(p) for p in pids if p]
+        self.interval = interval
+        self.pss = pss
+        self.buffer = SampleBuffer(size)
+        self.samplefile = filename and Path(f'{filename}_samples.dat')
+        self.ticks = 0
+        self.overhead = 0.0     # Seconds spent reading the samples
+        self._read = self._read_proc if os.path.isdir(PROC) else self._read_psutil
+        self._psutil = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                      # Sampler
+    #--------------------------------------------------------------------------------
+        return f'<Sampler(pids={self.pids}, interval={self.interval}, ticks={self.ticks})>'
+
+    #--------------------------------------------------------------------------------
+    def start(self):                                                         # Sampler
+    #--------------------------------------------------------------------------------
+        if not self._thread:
+            self._thread = Thread(target=self._run, name='Sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    #--------------------------------------------------------------------------------
+    def _run(self):                                                          # Sampler
+    #--------------------------------------------------------------------------------
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    #--------------------------------------------------------------------------------
+    def sample(self):                                                        # Sampler
+    #--------------------------------------------------------------------------------
+        # Read all processes once and append one row per living process
+        now = monotonic()
+        rows = [row for pid in self.pids if (row := self._read(pid))]
+        with self._lock:
+            for row in rows:
+                self.buffer.append((now, *row))
+            self.ticks += 1
+            self.overhead += monotonic() - now
+        return len(rows)
+
+    #--------------------------------------------------------------------------------
+    def _read_proc(self, pid):                                               # Sampler
+    #--------------------------------------------------------------------------------
+        base = f'{PROC}/{pid}'
+        try:
+            with open(f'{base}/stat', 'rb') as file:
+                stat = file.read().rpartition(b')')[2].split()
+            with open(f'{base}/status', 'rb') as file:
+                status = file.read()
+        except OSError:
+            # The process has ended
+            return None
+        # Fields after comm: utime (14), stime (15), num_threads (20), rss (24)
+        cpu = (int(stat[11]) + int(stat[12]))/CLOCK_TICKS
+        threads, rss = int(stat[17]), int(stat[21])*PAGE_SIZE
+        vcs = _field(status, b'voluntary_ctxt_switches:')
+        ivcs = _field(status, b'nonvoluntary_ctxt_switches:')
+        read = write = 0
+        try:
+            with open(f'{base}/io', 'rb') as file:
+                io = file.read()
+            read, write = _field(io, b'read_bytes:'), _field(io, b'write_bytes:')
+        except OSError:
+            # /proc/<pid>/io requires ptrace permission
+            pass
+        pss = 0
+        if self.pss:
+            try:
+                with open(f'{base}/smaps_rollup', 'rb') as file:
+                    pss = _field(file.read(), b'Pss:')*1024
+            except OSError:
+                pass
+        return pid, cpu, rss, pss, read, write, threads, vcs, ivcs
+
+    #--------------------------------------------------------------------------------
+    def _read_psutil(self, pid):                                             # Sampler
+    #--------------------------------------------------------------------------------
+        try:
+            proc = self._psutil.get(pid) or self._psutil.setdefault(pid, psutil.Process(pid))
+            with proc.oneshot():
+                times = proc.cpu_times()
+                mem = proc.memory_info()
+                ctx = proc.num_ctx_switches()
+                threads = proc.num_threads()
+                try:
+                    io = proc.io_counters()
+                    read, write = io.read_bytes, io.write_bytes
+                except (AttributeError, psutil.AccessDenied):
+                    read = write = 0
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+        return pid, times.user + times.system, mem.rss, 0, read, write, threads, ctx.voluntary, ctx.involuntary
+
+    #--------------------------------------------------------------------------------
+    def latest(self):                                                        # Sampler
+    #--------------------------------------------------------------------------------
+        # Return a dict pid -> dict of the last sample of each process
+        with self._lock:
+            rows = self.buffer.rows()
+        last = {}
+        for row in rows:
+            last[int(row[1])] = dict(zip(FIELDS, row))
+        return last
+
+    #--------------------------------------------------------------------------------
+    def column(self, field, pid=None):                                       # Sampler
+    #--------------------------------------------------------------------------------
+        with self._lock:
+            return self.buffer.column(field, pid=pid)
+
+    #--------------------------------------------------------------------------------
+    def summary(self):                                                       # Sampler
+    #--------------------------------------------------------------------------------
+        # Per process: mean CPU utilization (cores), peak memory and the total I/O
+        # and context switches over the sampled period
+        with self._lock:
+            rows = self.buffer.rows()
+        first, last, peak, samples = {}, {}, {}, {}
+        for row in rows:
+            sample = dict(zip(FIELDS, row))
+            pid = int(sample['pid'])
+            samples[pid] = samples.get(pid, 0) + 1
+            first.setdefault(pid, sample)
+            last[pid] = sample
+            p = peak.setdefault(pid, {'rss': 0, 'pss': 0, 'threads': 0})
+            for field in p:
+                p[field] = max(p[field], sample[field])
+        summary = {}
+        for pid, end in last.items():
+            begin = first[pid]
+            span = end['time'] - begin['time']
+            summary[pid] = {
+                'samples': samples[pid],
+                'cpu_time': end['cpu'],
+                'cpu_util': span and (end['cpu'] - begin['cpu'])/span,
+                **{f'peak_{field}': value for field, value in peak[pid].items()},
+                **{field: end[field] - begin[field] for field in ('read', 'write', 'vcs', 'ivcs')},
+            }
+        return summary
+
+    #--------------------------------------------------------------------------------
+    def dump(self, path=None):                                               # Sampler
+    #--------------------------------------------------------------------------------
+        # Write the buffer as tab separated columns, time relative to the first sample
+        path = Path(path) if path else self.samplefile
+        if not path:
+            return None
+        with self._lock:
+            rows = self.buffer.rows()
+        t0 = rows[0][0] if rows else 0
+        with path.open('w') as file:
+            file.write('# ' + ' \t '.join(FIELDS) + '\n')
+            file.write(''.join(f'{t-t0:.3f}\t{int(pid)}\t{cpu:.2f}\t' + '\t'.join(str(int(v)) for v in rest) + '\n'
+                               for t, pid, cpu, *rest in rows))
+        return path
+
+    #--------------------------------------------------------------------------------
+    def stop(self):                                                          # Sampler
+    #--------------------------------------------------------------------------------
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._thread = None
+
+    #--------------------------------------------------------------------------------
+    def close(self):                                                         # Sampler
+    #--------------------------------------------------------------------------------
+        self.stop()
+        return self.dump()
+
+
+#------------------------------------------------
+def _field(data, key):
+#------------------------------------------------
+    # Integer value following 'key' at the start of a line in a /proc key-value file
+    # ('write_bytes:' is also the end of 'cancelled_write_bytes:')
+    if data.startswith(key):
+        start = 0
+    elif (start := data.find(b'\n' + key)) < 0:
+        return 0
+    else:
+        start += 1
+    return int(data[start + len(key):data.find(b'\n', start)].split()[0])
@@ -0,0 +1,158 @@
+import os
+import mmap
+import struct
+from pathlib import Path
+from tempfile import gettempdir
+from threading import Lock
+from itertools import count
+from time import time
+
+from psutil import pid_exists
+
+
+# Fixed binary layout of the status record:
+#   seq (odd while a write is in progress), version, controller pid, program pid,
+#   state, step n, simulated time t, end_time, start, last resume and update time (epoch), name, case
+LAYOUT = struct.Struct('<QIIIB3xqddddd64s192s')
+SEQ = struct.Struct('<Q')
+VERSION = 1
+SUFFIX = '.status'
+
+# States
+STOPPED, RUNNING, SUSPENDED, DELAYED = 0, 1, 2, 3
+STATE_NAMES = {STOPPED: 'stopped', RUNNING: 'running', SUSPENDED: 'suspended', DELAYED: 'delayed-suspend'}
+FIELDS = ('seq', 'version', 'controller', 'pid', 'state', 'n', 't', 'end_time', 'started', 'resumed', 'updated', 'name', 'case')
+_instances = count(1)       # Makes the file names of objects of one process unique
+
+
+#--------------------------------------------------------------------------------
+def status_dir():
+#--------------------------------------------------------------------------------
+    # Directory of the status records of this user
+    if path := os.environ.get('PROCLIB_STATUS_DIR'):
+        return Path(path)
+    if path := os.environ.get('XDG_RUNTIME_DIR'):
+        return Path(path)/'proclib'
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return Path(gettempdir())/f'proclib-{user}'
+
+
+#--------------------------------------------------------------------------------
+def instance_id():
+#--------------------------------------------------------------------------------
+    # A number that is unique within this process, for the names of per-object files
+    return next(_instances)
+
+
+#====================================================================================
+class StatusRecord:
+#====================================================================================
+    """
+    Status of one Runner published in a small memory-mapped file, so that
+    updates are memory writes without system calls. A sequence number
+    (odd while writing) lets readers detect and retry torn reads.
+
+    Initialization:
+    StatusRecord(name, case='', directory=None)
+
+    Methods:
+      update(**fields)
+      close()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, name, case='', directory=None):               # StatusRecord
+    #--------------------------------------------------------------------------------
+        directory = Path(directory or status_dir())
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # Unique also for runners with the same (or no) name in one process
+        self.path = directory/f'{os.getpid()}-{instance_id()}-{name}{SUFFIX}'
+        with open(self.path, 'wb') as file:
+            file.write(bytes(LAYOUT.size))
+        self._file = open(self.path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), LAYOUT.size)
+        self._lock = Lock()
+        now = time()
+        self._values = {'seq': 0, 'version': VERSION, 'controller': os.getpid(), 'pid': 0, 'state': STOPPED,
+                        'n': 0, 't': 0.0, 'end_time': 0.0, 'started': now, 'resumed': 0.0, 'updated': now,
+                        'name': name.encode()[:64], 'case': str(case).encode()[-192:]}
+        self.update()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                              # StatusRecord
+    #--------------------------------------------------------------------------------
+        return f'<StatusRecord({self.path.name})>'
+
+    #--------------------------------------------------------------------------------
+    def update(self, **fields):                                      # StatusRecord
+    #--------------------------------------------------------------------------------
+        if not self._map:
+            return
+        with self._lock:
+            values = self._values
+            values.update(fields)
+            values['updated'] = time()
+            # Mark the record as being written (odd seq), write it, and mark it as complete
+            values['seq'] += 1
+            SEQ.pack_into(self._map, 0, values['seq'])
+            LAYOUT.pack_into(self._map, 0, *(values[f] for f in FIELDS))
+            values['seq'] += 1
+            SEQ.pack_into(self._map, 0, values['seq'])
+
+    #--------------------------------------------------------------------------------
+    def close(self):                                                 # StatusRecord
+    #--------------------------------------------------------------------------------
+        if self._map:
+            self._map.close()
+            self._file.close()
+            self._map = None
+        self.path.unlink(missing_ok=True)
+
+
+#--------------------------------------------------------------------------------
+def read_record(path, retries=10):
+#--------------------------------------------------------------------------------
+    # Return the record as a dict, None if it can not be read consistently
+    try:
+        with open(path, 'rb') as file:
+            for _ in range(retries):
+                file.seek(0)
+                data = file.read(LAYOUT.size)
+                if len(data) < LAYOUT.size:
+                    return None
+                values = dict(zip(FIELDS, LAYOUT.unpack(data)))
+                # Consistent if the seq is even and unchanged after the read
+                file.seek(0)
+                if values['seq'] % 2 == 0 and SEQ.unpack(file.read(SEQ.size))[0] == values['seq']:
+                    break
+            else:
+                return None
+    except OSError:
+        return None
+    values['name'] = values['name'].rstrip(b'\0').decode(errors='replace')
+    values['case'] = values['case'].rstrip(b'\0').decode(errors='replace')
+    values['path'] = Path(path)
+    return values
+
+
+#--------------------------------------------------------------------------------
+def read_all(directory=None, clean=True):
+#--------------------------------------------------------------------------------
+    # Return the records of all live controllers. Records left by controllers
+    # that are gone are deleted if clean is True.
+    directory = Path(directory or status_dir())
+    records = []
+    try:
+        paths = [Path(e.path) for e in os.scandir(directory) if e.name.endswith(SUFFIX)]
+    except OSError:
+        return records
+    for path in sorted(paths):
+        record = read_record(path)
+        if not record:
+            continue
+        if not pid_exists(record['controller']):
+            if clean:
+                path.unlink(missing_ok=True)
+            continue
+        records.append(record)
+    return records
@@ -1,58 +1,315 @@
+import json
+import traceback
+from math import frexp
+from array import array
 from pathlib import Path
-from time import time, sleep
-from threading import Thread
-from datetime import datetime
+from contextlib import contextmanager
+from time import time, monotonic
+from threading import Thread, Condition, Lock, Event
+from heapq import heappush, heappop, heapify
+from itertools import count
+from functools import partial
+
+
+FLUSH_STEPS = 1000      # Step times are written to the timer-file in batches of this size
+STEP = 'step'           # Name of the default phase timed by start() and stop()
+
+
+#====================================================================================
+class Histogram:
+#====================================================================================
+    """
+    Log-linear (HDR-style) histogram of positive values. Each power of two
+    above 'low' is split in 'sub' buckets, giving a relative error of about
+    1/sub for the percentiles.
+
+    Methods:
+      add(value)
+      percentile(p)
+      buckets()
+      summary()
+    """
+
+    #--------------------------------------------------------------------------------    
+    def __init__(self, sub=32, low=1e-6):
+    #--------------------------------------------------------------------------------    
+        self.sub = sub
+        self.low = low
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    #--------------------------------------------------------------------------------    
+    def _index(self, value):
+    #--------------------------------------------------------------------------------    
+        scaled = value/self.low
+        if scaled < 1:
+            return 0
+        mantissa, exponent = frexp(scaled)     # scaled = mantissa * 2**exponent, 0.5 <= mantissa < 1
+        return 1 + (exponent - 1)*self.sub + int((2*mantissa - 1)*self.sub)
+
+    #--------------------------------------------------------------------------------    
+    def _upper(self, index):
+    #--------------------------------------------------------------------------------    
+        # Upper bound of the bucket
+        if index == 0:
+            return self.low
+        exponent, sub = divmod(index - 1, self.sub)
+        return self.low * 2**exponent * (1 + (sub + 1)/self.sub)
+
+    #--------------------------------------------------------------------------------    
+    def add(self, value):
+    #--------------------------------------------------------------------------------    
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    #--------------------------------------------------------------------------------    
+    def percentile(self, p):
+    #--------------------------------------------------------------------------------    
+        if not self.count:
+            return 0.0
+        rank = p/100*self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    #--------------------------------------------------------------------------------    
+    def buckets(self):
+    #--------------------------------------------------------------------------------    
+        # List of (upper bound, count) for the non-empty buckets
+        return [(self._upper(i), self.counts[i]) for i in sorted(self.counts)]
+
+    #--------------------------------------------------------------------------------    
+    def summary(self):
+    #--------------------------------------------------------------------------------    
+        return {'count': self.count,
+                'mean': self.total/self.count if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self.max}
 
 
 #====================================================================================
 class Timer:
 #====================================================================================
+    # Step times (start() to stop()) are kept in memory and written to the 
+    # timer-file in batches. Named phases, e.g. 'suspend' or 'wait', can be 
+    # timed with start(phase)/stop(phase) or the phase() context manager, and
+    # nested. Summary statistics are available from summary() and are saved
+    # in <filename>_timer.json by close().
 
     #--------------------------------------------------------------------------------    
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, flush_steps=FLUSH_STEPS):
     #--------------------------------------------------------------------------------    
         self.counter = 0
         self.timefile = Path(f'{filename}_timer.dat')
         self.timefile.write_text('# step \t seconds\n')
+        self.statfile = Path(f'{filename}_timer.json')
         self.starttime = time()
         self.info = f'Execution time saved in {self.timefile.name}'
+        self.flush_steps = flush_steps
+        self.histograms = {}
+        self._steps = array('L')
+        self._times = array('d')
+        self._started = {STEP: [monotonic()]}
 
 
     #--------------------------------------------------------------------------------    
-    def start(self):
+    def start(self, phase=STEP):
     #--------------------------------------------------------------------------------    
-        self.counter += 1
-        self.starttime = time()
+        if phase == STEP:
+            self.counter += 1
+            self.starttime = time()
+            self._started[STEP] = []
+        self._started.setdefault(phase, []).append(monotonic())
 
 
     #--------------------------------------------------------------------------------    
-    def stop(self):
+    def stop(self, phase=STEP):
+    #--------------------------------------------------------------------------------    
+        # Return the elapsed time of the phase, None if the phase is not started
+        started = self._started.get(phase)
+        if not started:
+            return None
+        seconds = monotonic() - started.pop()
+        self.histograms.setdefault(phase, Histogram()).add(seconds)
+        if phase == STEP:
+            self._steps.append(self.counter)
+            self._times.append(seconds)
+            if len(self._times) >= self.flush_steps:
+                self.flush()
+        return seconds
+
+    @contextmanager
+    #--------------------------------------------------------------------------------    
+    def phase(self, name):
     #--------------------------------------------------------------------------------    
-        with self.timefile.open('a') as f:
-            f.write(f'{self.counter:d}\t{time()-self.starttime:.3e}\n')
+        self.start(name)
+        try:
+            yield self
+        finally:
+            self.stop(name)
+
+
+    #--------------------------------------------------------------------------------    
+    def flush(self):
+    #--------------------------------------------------------------------------------    
+        if self._times:
+            with self.timefile.open('a') as f:
+                f.write(''.join(f'{n:d}\t{t:.3e}\n' for n, t in zip(self._steps, self._times)))
+            self._steps = array('L')
+            self._times = array('d')
+
+
+    #--------------------------------------------------------------------------------    
+    def summary(self, phase=None):
+    #--------------------------------------------------------------------------------    
+        # Statistics of one phase, or a dict of all phases
+        if phase:
+            return self.histograms.get(phase, Histogram()).summary()
+        return {name: hist.summary() for name, hist in self.histograms.items()}
+
+
+    #--------------------------------------------------------------------------------    
+    def close(self):
+    #--------------------------------------------------------------------------------    
+        self.flush()
+        phases = {name: {**hist.summary(), 'histogram': hist.buckets()} for name, hist in self.histograms.items()}
+        self.statfile.write_text(json.dumps({'steps': self.counter, 'phases': phases}, indent=1))
+
+#====================================================================================
+class TimerService:
+#====================================================================================
+    """
+    Process-wide timer service: one daemon thread that sleeps until the
+    earliest deadline (time.monotonic) and then calls its callback. Used by
+    all TimerThread objects instead of one polling thread per timer. A
+    callback that raises is reported and does not stop the other timers.
+
+    Methods:
+      schedule(delay, callback)
+      cancel(entry)
+    """
+
+    #--------------------------------------------------------------------------------    
+    def __init__(self):
+    #--------------------------------------------------------------------------------    
+        self._heap = []         # Entries [deadline, seq, callback, active]
+        self._active = 0
+        self._seq = count()
+        self._cond = Condition()
+        self._thread = None
+
+    #--------------------------------------------------------------------------------    
+    def __len__(self):
+    #--------------------------------------------------------------------------------    
+        return self._active
+
+    #--------------------------------------------------------------------------------    
+    def schedule(self, delay, callback):
+    #--------------------------------------------------------------------------------    
+        # Call callback (from the service thread) after delay seconds
+        entry = [monotonic() + delay, next(self._seq), callback, True]
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='proclib-timer', daemon=True)
+                self._thread.start()
+            heappush(self._heap, entry)
+            self._active += 1
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    #--------------------------------------------------------------------------------    
+    def cancel(self, entry):
+    #--------------------------------------------------------------------------------    
+        # Entries are removed lazily, the heap is compacted if mostly canceled
+        with self._cond:
+            if entry and entry[3]:
+                entry[3] = False
+                self._active -= 1
+                if len(self._heap) > 2*self._active + 64:
+                    self._heap = [e for e in self._heap if e[3]]
+                    heapify(self._heap)
+
+    #--------------------------------------------------------------------------------    
+    def _run(self):
+    #--------------------------------------------------------------------------------    
+        with self._cond:
+            while True:
+                while self._heap and not self._heap[0][3]:
+                    heappop(self._heap)
+                if not self._heap:
+                    # Nothing scheduled, sleep until notified
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                entry = heappop(self._heap)
+                entry[3] = False
+                self._active -= 1
+                self._cond.release()
+                try:
+                    entry[2]()
+                except Exception:
+                    # Keep the thread alive for the other timers
+                    print(f'WARNING Exception in timer callback {entry[2]}:')
+                    traceback.print_exc()
+                finally:
+                    self._cond.acquire()
+
+
+_service = None
+_service_lock = Lock()
+
+#--------------------------------------------------------------------------------    
+def timer_service():
+#--------------------------------------------------------------------------------    
+    # Return the shared TimerService, created on first use
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TimerService()
+    return _service
+
 
 #====================================================================================
 class TimerThread:
 #====================================================================================
+    # Delayed call of func, 'limit' seconds after start(). The timers share 
+    # one TimerService thread, 'prec' is kept for backward compatibility.
     DEBUG = False
     
     #--------------------------------------------------------------------------------    
     def __init__(self, limit=0, prec=0.5, func=None):
     #--------------------------------------------------------------------------------    
         self._func = func
-        self._call_func = func
         self._limit = limit
-        self._idle = prec   # Idle time between checks given by precision
-        self._running = False
+        self._idle = prec
         self._starttime = None
         self._endtime = None
-        self._thread = Thread(target=self._timer, daemon=True)
+        self._entry = None
+        self._generation = 0
+        self._lock = Lock()
+        self._done = Event()     # Cleared while func is running
+        self._done.set()
+        self._service = timer_service()
         self.DEBUG and print(f'Creating {self}')
 
     #--------------------------------------------------------------------------------    
     def __str__(self):
     #--------------------------------------------------------------------------------    
-        return f'<TimerThread (limit={self._limit}, prec={self._idle}, func={self._func.__qualname__}, thread={self._thread})>'
+        return f'<TimerThread (limit={self._limit}, prec={self._idle}, func={self._func.__qualname__}, scheduled={bool(self._entry and self._entry[3])})>'
 
     #--------------------------------------------------------------------------------    
     def __del__(self):
@@ -83,29 +340,39 @@ class TimerThread:
     #--------------------------------------------------------------------------------    
     def start(self):
     #--------------------------------------------------------------------------------    
-        self._endtime = None
-        self._call_func = self._func
-        self._starttime = datetime.now()
-        if not self._running:
-            self._running = True
-            self._thread.start()
+        with self._lock:
+            self._service.cancel(self._entry)
+            self._endtime = None
+            self._starttime = monotonic()
+            self._generation += 1
+            self._entry = self._service.schedule(self._limit, partial(self._fire, self._generation))
 
     #--------------------------------------------------------------------------------    
     def close(self):
     #--------------------------------------------------------------------------------    
-        self._running = False
-        if self._thread.is_alive():
-            self._thread.join()
+        with self._lock:
+            self._service.cancel(self._entry)
+            self._entry = None
 
     #--------------------------------------------------------------------------------    
     def cancel_if_alive(self):
     #--------------------------------------------------------------------------------    
-        #print((datetime.now()-self._starttime).total_seconds(), self._is_alive)
-        if not self._endtime:
-            self._call_func = lambda : None
-            self._endtime = self.time()
-            return True
-        return False
+        # Return True if func was not called (or the timer was never started). 
+        # A func that is running is not waited for, see join().
+        with self._lock:
+            if self._starttime is None:
+                return False
+            if not self._endtime:
+                self._service.cancel(self._entry)
+                self._endtime = self.time()
+                return True
+            return False
+
+    #--------------------------------------------------------------------------------    
+    def join(self, timeout=None):
+    #--------------------------------------------------------------------------------    
+        # Wait until a running func has returned, False on timeout
+        return self._done.wait(timeout)
 
     #--------------------------------------------------------------------------------    
     def is_alive(self):
@@ -115,18 +382,19 @@ class TimerThread:
     #--------------------------------------------------------------------------------    
     def time(self):
     #--------------------------------------------------------------------------------    
-        return (datetime.now()-self._starttime).total_seconds()
+        return monotonic() - self._starttime
 
     #--------------------------------------------------------------------------------    
-    def _timer(self):
+    def _fire(self, generation):
     #--------------------------------------------------------------------------------    
-        while self._running:
-            sleep(self._idle)
-            if not self._endtime:
-                time = self.time()
-                if time >= self._limit:
-                    self._call_func()
-                    self._endtime = time
-                    #print('Called '+self._caller.__qualname__+f' at {sec}')
-
-
+        # Called from the TimerService thread, ignored if restarted or canceled.
+        # func is called outside the lock so that cancel_if_alive() never blocks.
+        with self._lock:
+            if generation != self._generation or self._endtime:
+                return
+            self._endtime = self.time()
+            self._done.clear()
+        try:
+            self._func()
+        finally:
+            self._done.set()
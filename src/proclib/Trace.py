@@ -0,0 +1,207 @@
+import os
+import json
+from time import monotonic_ns
+from pathlib import Path
+from collections import deque
+from functools import wraps
+from inspect import iscoroutinefunction
+from threading import get_ident, current_thread
+
+
+TRACE_EVENTS = 100000    # Events kept in memory, the oldest are dropped
+
+
+#====================================================================================
+class Span:
+#====================================================================================
+    # Context manager that records one complete event. The dict returned by
+    # __enter__ holds the event attributes and can be updated inside the block.
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, tracer, name, args):                                    # Span
+    #--------------------------------------------------------------------------------
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    #--------------------------------------------------------------------------------
+    def __enter__(self):                                                       # Span
+    #--------------------------------------------------------------------------------
+        self.start = monotonic_ns()
+        return self.args
+
+    #--------------------------------------------------------------------------------
+    def __exit__(self, kind, value, traceback):                                # Span
+    #--------------------------------------------------------------------------------
+        if kind:
+            self.args['error'] = kind.__name__
+        self.tracer.add(self.name, self.start, monotonic_ns(), self.args)
+
+
+#====================================================================================
+class Tracer:
+#====================================================================================
+    """
+    Records spans (name, monotonic start and duration, thread, attributes) in
+    a bounded in-memory buffer and exports them in the Chrome trace event
+    format, which can be opened in Perfetto or chrome://tracing. Events can
+    be added from any thread.
+
+    Initialization:
+    Tracer(size=TRACE_EVENTS)
+
+    Methods:
+      span(name, **args)
+      add(name, start, end, args=None)
+      instant(name, **args)
+      events()
+      export(path)
+      clear()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, size=TRACE_EVENTS):                                   # Tracer
+    #--------------------------------------------------------------------------------
+        self._events = deque(maxlen=size)    # deque.append is thread-safe
+        self._threads = {}
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                      # Tracer
+    #--------------------------------------------------------------------------------
+        return f'<Tracer({len(self._events)} events)>'
+
+    #--------------------------------------------------------------------------------
+    def __bool__(self):                                                      # Tracer
+    #--------------------------------------------------------------------------------
+        # True also when empty, NullTracer is false
+        return True
+
+    #--------------------------------------------------------------------------------
+    def __len__(self):                                                       # Tracer
+    #--------------------------------------------------------------------------------
+        return len(self._events)
+
+    #--------------------------------------------------------------------------------
+    def span(self, name, **args):                                            # Tracer
+    #--------------------------------------------------------------------------------
+        return Span(self, name, args)
+
+    #--------------------------------------------------------------------------------
+    def add(self, name, start, end, args=None):                              # Tracer
+    #--------------------------------------------------------------------------------
+        # Add a complete event, start and end are time.monotonic_ns() values
+        tid = get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = current_thread().name
+        self._events.append((name, start, end - start, tid, args))
+
+    #--------------------------------------------------------------------------------
+    def instant(self, name, **args):                                         # Tracer
+    #--------------------------------------------------------------------------------
+        now = monotonic_ns()
+        self.add(name, now, now, args)
+
+    #--------------------------------------------------------------------------------
+    def events(self):                                                        # Tracer
+    #--------------------------------------------------------------------------------
+        # The events in Chrome trace format, times in microseconds
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in list(self._threads.items())]
+        for name, start, duration, tid, args in list(self._events):
+            event = {'name': name, 'ph': 'X' if duration else 'i', 'ts': start/1000, 'pid': pid, 'tid': tid}
+            if duration:
+                event['dur'] = duration/1000
+            else:
+                event['s'] = 't'
+            if args:
+                event['args'] = {k: v if isinstance(v, (int, float, str, bool, type(None))) else str(v)
+                                 for k, v in args.items()}
+            events.append(event)
+        return events
+
+    #--------------------------------------------------------------------------------
+    def export(self, path):                                                  # Tracer
+    #--------------------------------------------------------------------------------
+        path = Path(path)
+        path.write_text(json.dumps({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}))
+        return path
+
+    #--------------------------------------------------------------------------------
+    def clear(self):                                                         # Tracer
+    #--------------------------------------------------------------------------------
+        self._events.clear()
+
+
+#====================================================================================
+class NullTracer:
+#====================================================================================
+    # Used when tracing is off. It is false, so callers can skip the tracing
+    # with one test, and span() returns a shared no-op context manager.
+
+    #--------------------------------------------------------------------------------
+    def __bool__(self):                                                  # NullTracer
+    #--------------------------------------------------------------------------------
+        return False
+
+    #--------------------------------------------------------------------------------
+    def __len__(self):                                                   # NullTracer
+    #--------------------------------------------------------------------------------
+        return 0
+
+    #--------------------------------------------------------------------------------
+    def span(self, name, **args):                                        # NullTracer
+    #--------------------------------------------------------------------------------
+        return NULL_SPAN
+
+    #--------------------------------------------------------------------------------
+    def add(self, name, start, end, args=None):                          # NullTracer
+    #--------------------------------------------------------------------------------
+        pass
+
+    #--------------------------------------------------------------------------------
+    def instant(self, name, **args):                                     # NullTracer
+    #--------------------------------------------------------------------------------
+        pass
+
+
+#====================================================================================
+class _NullSpan:
+#====================================================================================
+    #--------------------------------------------------------------------------------
+    def __enter__(self):                                                  # _NullSpan
+    #--------------------------------------------------------------------------------
+        return {}
+
+    #--------------------------------------------------------------------------------
+    def __exit__(self, kind, value, traceback):                           # _NullSpan
+    #--------------------------------------------------------------------------------
+        return False
+
+
+NULL_TRACER = NullTracer()
+NULL_SPAN = _NullSpan()
+
+
+#--------------------------------------------------------------------------------
+def traced(func):
+#--------------------------------------------------------------------------------
+    # Decorator for methods of objects with a 'tracer' attribute. The span is
+    # named after the method and has the step number 'n' and 'pid' attributes.
+    name = func.__name__
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def inner(self, *args, **kwargs):
+            if not self.tracer:
+                return await func(self, *args, **kwargs)
+            with self.tracer.span(name, n=self.n, pid=self.popen and self.popen.pid):
+                return await func(self, *args, **kwargs)
+        return inner
+    @wraps(func)
+    def inner(self, *args, **kwargs):
+        if not self.tracer:
+            return func(self, *args, **kwargs)
+        with self.tracer.span(name, n=self.n, pid=self.popen and self.popen.pid):
+            return func(self, *args, **kwargs)
+    return inner
@@ -0,0 +1,337 @@
+import os
+import socket
+from select import select, PIPE_BUF
+from subprocess import PIPE
+from pathlib import Path
+from tempfile import gettempdir
+from contextlib import nullcontext
+from itertools import count
+from time import monotonic
+
+from proclib.Watcher import watch_files
+
+
+ENV = 'PROCLIB_TRANSPORT'   # Tells the program where to read and write handshake messages
+CONNECT_TIMEOUT = 60        # Seconds to wait for the program to connect to the socket
+CONNECT_PAUSE = 0.1         # Seconds between checks of the program while waiting for the connection
+SEND_TIMEOUT = 60           # Seconds to wait for the program to read a message
+READ_SIZE = 64*1024
+
+_socket_ids = count()
+
+
+#====================================================================================
+class FileTransport:
+#====================================================================================
+    """
+    The handshake by interface- and OK-files: send() creates the interface
+    file, the program answers by creating the OK-file, which is read and
+    deleted by take().
+
+    Initialization:
+    FileTransport(interface_file, OK_file)
+
+    Methods:
+      prepare(kwargs)
+      connect(popen)
+      send(message='', n=None)
+      ready()
+      waiting()
+      take()
+      close(keep_files=False)
+    """
+    env = None
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, interface_file, OK_file):                      # FileTransport
+    #--------------------------------------------------------------------------------
+        self.interface_file = interface_file
+        self.OK_file = OK_file
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                               # FileTransport
+    #--------------------------------------------------------------------------------
+        return f'<FileTransport({self.interface_file!r}, {self.OK_file!r})>'
+
+    #--------------------------------------------------------------------------------
+    def prepare(self, kwargs):                                        # FileTransport
+    #--------------------------------------------------------------------------------
+        # Update the Popen keyword arguments
+        return kwargs
+
+    #--------------------------------------------------------------------------------
+    def connect(self, popen):                                         # FileTransport
+    #--------------------------------------------------------------------------------
+        pass
+
+    #--------------------------------------------------------------------------------
+    def send(self, message='', n=None):                               # FileTransport
+    #--------------------------------------------------------------------------------
+        file = self.interface_file if n is None else self.interface_file(n)
+        if message:
+            file.create_from(string=message)
+        else:
+            file.create()
+
+    #--------------------------------------------------------------------------------
+    def ready(self):                                                  # FileTransport
+    #--------------------------------------------------------------------------------
+        return self.OK_file.path().is_file()
+
+    #--------------------------------------------------------------------------------
+    def waiting(self):                                                # FileTransport
+    #--------------------------------------------------------------------------------
+        # Context manager that returns an object with wait(timeout) that wakes
+        # up when a reply may have arrived
+        return watch_files(self.OK_file.path())
+
+    #--------------------------------------------------------------------------------
+    def take(self):                                                   # FileTransport
+    #--------------------------------------------------------------------------------
+        # Return the content of the OK-file and delete it
+        try:
+            message = self.OK_file.path().read_text().strip()
+        except OSError:
+            message = ''
+        self.OK_file.delete()
+        return message
+
+    #--------------------------------------------------------------------------------
+    def close(self, keep_files=False):                                # FileTransport
+    #--------------------------------------------------------------------------------
+        if not keep_files:
+            self.interface_file.delete_all()
+            self.OK_file.delete()
+
+
+#====================================================================================
+class StreamTransport:
+#====================================================================================
+    """
+    Handshake by newline-terminated messages over a byte stream. The reply
+    is read with select() instead of polling the file system. The program
+    finds the channel in the PROCLIB_TRANSPORT environment variable:
+      'pipe:<fd>'        : messages on stdin, replies written to file descriptor <fd>
+      'fifo:<in>,<out>'  : messages read from FIFO <in>, replies written to FIFO <out>
+      'socket:<path>'    : connect to the Unix socket <path>, messages both ways
+
+    Initialization:
+    StreamTransport.pipe()
+    StreamTransport.fifo(base)
+    StreamTransport.socket(path=None)
+
+    Methods:
+      same as FileTransport, and
+      wait(timeout)
+      fileno()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, kind, address=''):                           # StreamTransport
+    #--------------------------------------------------------------------------------
+        self.kind = kind
+        self.address = address
+        self.env = None
+        self.eof = False
+        self._rfd = None       # Replies are read from this descriptor
+        self._wfd = None       # Messages are written to this descriptor
+        self._child_fd = None  # Descriptor passed to the program (pipe)
+        self._listener = None
+        self._conn = None
+        self._popen = None
+        self._buffer = bytearray()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                             # StreamTransport
+    #--------------------------------------------------------------------------------
+        return f'<StreamTransport({self.kind}:{self.address})>'
+
+    @classmethod
+    #--------------------------------------------------------------------------------
+    def pipe(cls):                                                  # StreamTransport
+    #--------------------------------------------------------------------------------
+        return cls('pipe')
+
+    @classmethod
+    #--------------------------------------------------------------------------------
+    def fifo(cls, base):                                            # StreamTransport
+    #--------------------------------------------------------------------------------
+        return cls('fifo', f'{base}.in,{base}.out')
+
+    @classmethod
+    #--------------------------------------------------------------------------------
+    def socket(cls, path=None):                                     # StreamTransport
+    #--------------------------------------------------------------------------------
+        # Unix socket paths are limited to about 100 characters
+        path = path or Path(gettempdir())/f'proclib-{os.getpid()}-{next(_socket_ids)}.sock'
+        return cls('socket', str(path))
+
+    #--------------------------------------------------------------------------------
+    def prepare(self, kwargs):                                      # StreamTransport
+    #--------------------------------------------------------------------------------
+        # Create the channel and update the Popen keyword arguments
+        if self.kind == 'pipe':
+            self._rfd, self._child_fd = os.pipe()
+            self.address = str(self._child_fd)
+            kwargs = {**kwargs, 'stdin': PIPE, 'pass_fds': (self._child_fd,)}
+        elif self.kind == 'fifo':
+            for path in self.address.split(','):
+                if not Path(path).exists():
+                    os.mkfifo(path)
+            to_app, from_app = self.address.split(',')
+            # Opened read-write so that open() does not block until the program opens its end
+            self._wfd = os.open(to_app, os.O_RDWR)
+            # Read-only, so that EOF is seen when the program closes its end or dies. select()
+            # does not report the FIFO as readable before the program has opened it.
+            self._rfd = os.open(from_app, os.O_RDONLY | os.O_NONBLOCK)
+        elif self.kind == 'socket':
+            Path(self.address).unlink(missing_ok=True)
+            self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._listener.bind(self.address)
+            self._listener.listen(1)
+        else:
+            raise ValueError(f"Unknown transport '{self.kind}'")
+        self.env = {ENV: f'{self.kind}:{self.address}'}
+        return {**kwargs, 'env': {**(kwargs.get('env') or os.environ), **self.env}}
+
+    #--------------------------------------------------------------------------------
+    def connect(self, popen, timeout=CONNECT_TIMEOUT):              # StreamTransport
+    #--------------------------------------------------------------------------------
+        # Called after the program is started
+        self._popen = popen
+        if self.kind == 'pipe':
+            os.close(self._child_fd)
+            self._child_fd = None
+            stdin = popen.stdin
+            # Popen gives a file object, asyncio a StreamWriter
+            self._wfd = stdin.fileno() if hasattr(stdin, 'fileno') else stdin.get_extra_info('pipe').fileno()
+        elif self.kind == 'socket':
+            deadline = monotonic() + timeout
+            self._listener.settimeout(CONNECT_PAUSE)
+            while not self._conn:
+                try:
+                    self._conn, _ = self._listener.accept()
+                except socket.timeout:
+                    if not is_running(popen) or monotonic() > deadline:
+                        raise SystemError(f'ERROR The program did not connect to {self.address}')
+            self._conn.setblocking(False)
+            self._rfd = self._wfd = self._conn.fileno()
+
+    #--------------------------------------------------------------------------------
+    def fileno(self):                                               # StreamTransport
+    #--------------------------------------------------------------------------------
+        return self._rfd
+
+    #--------------------------------------------------------------------------------
+    def send(self, message='', n=None, timeout=SEND_TIMEOUT):       # StreamTransport
+    #--------------------------------------------------------------------------------
+        # Wait at most timeout seconds for the program to make room for the message,
+        # the program is checked every CONNECT_PAUSE seconds while waiting
+        message = message or ('' if n is None else str(n))
+        data = memoryview(f'{message}\n'.encode())
+        deadline = monotonic() + timeout
+        while data:
+            if not select([], [self._wfd], [], CONNECT_PAUSE)[1]:
+                if self._popen and not is_running(self._popen):
+                    raise SystemError(f'ERROR The program ended before reading the message from {self}')
+                if monotonic() > deadline:
+                    raise SystemError(f'ERROR The program did not read the message from {self} in {timeout} seconds')
+                continue
+            try:
+                if self._conn:
+                    sent = self._conn.send(data)
+                else:
+                    # A writable pipe has room for PIPE_BUF bytes, more could block
+                    sent = os.write(self._wfd, data[:PIPE_BUF])
+            except BlockingIOError:
+                continue
+            except (BrokenPipeError, ConnectionResetError) as error:
+                raise SystemError(f'ERROR The program closed {self}: {error}') from error
+            data = data[sent:]
+
+    #--------------------------------------------------------------------------------
+    def _read(self):                                                # StreamTransport
+    #--------------------------------------------------------------------------------
+        # Read what is available without blocking
+        while not self.eof and select([self._rfd], [], [], 0)[0]:
+            try:
+                data = os.read(self._rfd, READ_SIZE)
+            except BlockingIOError:
+                return
+            if not data:
+                self.eof = True
+            self._buffer += data
+
+    #--------------------------------------------------------------------------------
+    def ready(self):                                                # StreamTransport
+    #--------------------------------------------------------------------------------
+        # True if a complete reply is available (or the program closed the channel)
+        if b'\n' not in self._buffer:
+            self._read()
+        return b'\n' in self._buffer or self.eof
+
+    #--------------------------------------------------------------------------------
+    def wait(self, timeout=None):                                   # StreamTransport
+    #--------------------------------------------------------------------------------
+        # Block until there is data to read, return False if timeout is reached
+        if b'\n' in self._buffer or self.eof:
+            return True
+        return bool(select([self._rfd], [], [], timeout)[0])
+
+    #--------------------------------------------------------------------------------
+    def waiting(self):                                              # StreamTransport
+    #--------------------------------------------------------------------------------
+        return nullcontext(self)
+
+    #--------------------------------------------------------------------------------
+    def take(self):                                                 # StreamTransport
+    #--------------------------------------------------------------------------------
+        # Return the first reply, None if the program closed the channel
+        end = self._buffer.find(b'\n')
+        if end < 0:
+            return None
+        message = self._buffer[:end].decode(errors='replace').strip()
+        del self._buffer[:end + 1]
+        return message
+
+    #--------------------------------------------------------------------------------
+    def close(self, keep_files=False):                              # StreamTransport
+    #--------------------------------------------------------------------------------
+        if self._conn:
+            self._conn.close()
+        elif self.kind == 'fifo':
+            for fd in (self._rfd, self._wfd):
+                fd is not None and os.close(fd)
+        elif self.kind == 'pipe' and self._rfd is not None:
+            # stdin is closed by Popen
+            os.close(self._rfd)
+        if self._child_fd is not None:
+            os.close(self._child_fd)
+        if self._listener:
+            self._listener.close()
+        if self.kind in ('fifo', 'socket') and not keep_files:
+            for path in self.address.split(','):
+                Path(path).unlink(missing_ok=True)
+        self._rfd = self._wfd = self._child_fd = self._listener = self._conn = None
+
+
+#--------------------------------------------------------------------------------
+def is_running(popen):
+#--------------------------------------------------------------------------------
+    # Popen gives poll(), asyncio a returncode
+    return popen.poll() is None if hasattr(popen, 'poll') else popen.returncode is None
+
+
+#--------------------------------------------------------------------------------
+def make_transport(kind, interface_file, OK_file, base):
+#--------------------------------------------------------------------------------
+    # Return the transport for 'file', 'pipe', 'fifo' or 'socket'
+    if kind in (None, 'file'):
+        return FileTransport(interface_file, OK_file)
+    if kind == 'pipe':
+        return StreamTransport.pipe()
+    if kind == 'fifo':
+        return StreamTransport.fifo(base)
+    if kind == 'socket':
+        return StreamTransport.socket()
+    raise ValueError(f"Unknown transport '{kind}', use 'file', 'pipe', 'fifo' or 'socket'")
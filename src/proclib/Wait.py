@@ -0,0 +1,180 @@
+from time import monotonic
+
+
+#====================================================================================
+class Fixed:
+#====================================================================================
+    """
+    Wait strategy with a fixed pause between checks.
+
+    A strategy is passed to loop_until (or Runner.wait_for) and decides how
+    long to sleep between each check. The deadline is measured with a
+    monotonic clock, and the strategy counts the checks and wakeups of
+    the last wait.
+
+    Methods:
+      start(timeout)
+      pause()
+      expired()
+      stats()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, pause=0.01):                                           # Fixed
+    #--------------------------------------------------------------------------------
+        self._pause = pause
+        self.start()
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                       # Fixed
+    #--------------------------------------------------------------------------------
+        return f'<{self.__class__.__name__}(pause={self._pause})>'
+
+    #--------------------------------------------------------------------------------
+    def start(self, timeout=None):                                            # Fixed
+    #--------------------------------------------------------------------------------
+        # Reset counters and set the deadline (seconds from now)
+        self.checks = 0     # Number of calls to the checked function
+        self.wasted = 0     # Checks that returned False
+        self.wakeups = 0    # Number of sleeps that ended
+        self._starttime = monotonic()
+        self._endtime = None if timeout is None else self._starttime + timeout
+
+    #--------------------------------------------------------------------------------
+    def pause(self):                                                          # Fixed
+    #--------------------------------------------------------------------------------
+        return self._pause
+
+    #--------------------------------------------------------------------------------
+    def spinning(self):                                                       # Fixed
+    #--------------------------------------------------------------------------------
+        # Loop checks (loop_func) are skipped while spinning
+        return False
+
+    #--------------------------------------------------------------------------------
+    def elapsed(self):                                                        # Fixed
+    #--------------------------------------------------------------------------------
+        return monotonic() - self._starttime
+
+    #--------------------------------------------------------------------------------
+    def remaining(self):                                                      # Fixed
+    #--------------------------------------------------------------------------------
+        if self._endtime is None:
+            return None
+        return max(self._endtime - monotonic(), 0)
+
+    #--------------------------------------------------------------------------------
+    def expired(self):                                                        # Fixed
+    #--------------------------------------------------------------------------------
+        return self._endtime is not None and monotonic() >= self._endtime
+
+    #--------------------------------------------------------------------------------
+    def next_pause(self):                                                     # Fixed
+    #--------------------------------------------------------------------------------
+        # Pause limited by the time left to the deadline
+        pause = self.pause() or 0
+        left = self.remaining()
+        return pause if left is None else min(pause, left)
+
+    #--------------------------------------------------------------------------------
+    def stats(self):                                                          # Fixed
+    #--------------------------------------------------------------------------------
+        return {'checks': self.checks, 'wasted': self.wasted, 'wakeups': self.wakeups,
+                'elapsed': self.elapsed()}
+
+
+#====================================================================================
+class Backoff(Fixed):
+#====================================================================================
+    """
+    Exponential backoff: the pause starts at 'start' and is multiplied by
+    'factor' after each check, up to 'cap' seconds
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, start=1e-4, factor=2, cap=0.1):                      # Backoff
+    #--------------------------------------------------------------------------------
+        self._first = start
+        self._factor = factor
+        self._cap = cap
+        super().__init__(pause=start)
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                     # Backoff
+    #--------------------------------------------------------------------------------
+        return f'<Backoff(start={self._first}, factor={self._factor}, cap={self._cap})>'
+
+    #--------------------------------------------------------------------------------
+    def start(self, timeout=None):                                          # Backoff
+    #--------------------------------------------------------------------------------
+        self._pause = self._first
+        super().start(timeout)
+
+    #--------------------------------------------------------------------------------
+    def pause(self):                                                        # Backoff
+    #--------------------------------------------------------------------------------
+        pause = self._pause
+        self._pause = min(self._pause*self._factor, self._cap)
+        return pause
+
+
+#====================================================================================
+class SpinSleep(Fixed):
+#====================================================================================
+    """
+    Check without sleeping for 'spin' seconds, then sleep 'pause' seconds
+    between checks
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, spin=1e-3, pause=0.01):                            # SpinSleep
+    #--------------------------------------------------------------------------------
+        self._spin = spin
+        super().__init__(pause=pause)
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                   # SpinSleep
+    #--------------------------------------------------------------------------------
+        return f'<SpinSleep(spin={self._spin}, pause={self._pause})>'
+
+    #--------------------------------------------------------------------------------
+    def spinning(self):                                                   # SpinSleep
+    #--------------------------------------------------------------------------------
+        return self.elapsed() < self._spin
+
+    #--------------------------------------------------------------------------------
+    def pause(self):                                                      # SpinSleep
+    #--------------------------------------------------------------------------------
+        if self.spinning():
+            return 0
+        return self._pause
+
+
+#====================================================================================
+class Deadline(Fixed):
+#====================================================================================
+    """
+    Sleep a fraction of the time left to the deadline, limited to the range
+    ['low', 'high'] seconds. Without a deadline the pause is 'high'.
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, fraction=0.1, low=1e-3, high=1.0):                  # Deadline
+    #--------------------------------------------------------------------------------
+        self._fraction = fraction
+        self._low = low
+        self._high = high
+        super().__init__(pause=high)
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                    # Deadline
+    #--------------------------------------------------------------------------------
+        return f'<Deadline(fraction={self._fraction}, low={self._low}, high={self._high})>'
+
+    #--------------------------------------------------------------------------------
+    def pause(self):                                                       # Deadline
+    #--------------------------------------------------------------------------------
+        left = self.remaining()
+        if left is None:
+            return self._high
+        return min(max(left*self._fraction, self._low), self._high)
@@ -0,0 +1,491 @@
+import os
+import errno
+import ctypes
+import selectors
+import ctypes.util
+from struct import Struct
+from select import select
+from pathlib import Path
+from functools import lru_cache
+from time import monotonic, sleep
+
+import psutil
+
+
+# inotify constants, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE
+EVENT = Struct('iIII')   # wd, mask, cookie, len
+READ_SIZE = 64*1024
+
+# Filesystems where inotify misses changes made on other nodes
+REMOTE_FS = ('nfs', 'cifs', 'smb', 'lustre', 'gpfs', 'beegfs', 'panfs', 'ceph', 'fuse', '9p')
+
+POLL_MIN = 0.001     # First pause (seconds) of the adaptive polling fallback
+POLL_MAX = 0.05      # Upper limit of the polling pause
+POLL_FACTOR = 2      # Pause multiplier between polls
+
+_libc = None
+
+
+#--------------------------------------------------------------------------------
+def libc():
+#--------------------------------------------------------------------------------
+    # Return libc with inotify support, or False if not available
+    global _libc
+    if _libc is None:
+        _libc = False
+        name = ctypes.util.find_library('c')
+        try:
+            lib = ctypes.CDLL(name, use_errno=True)
+            if hasattr(lib, 'inotify_init1'):
+                _libc = lib
+        except OSError:
+            pass
+    return _libc
+
+
+#--------------------------------------------------------------------------------
+def filesystem_type(path):
+#--------------------------------------------------------------------------------
+    # Return the filesystem type of the mount holding path, None if unknown
+    path = os.path.realpath(path)
+    mount, fstype = '', None
+    try:
+        with open('/proc/self/mountinfo', encoding='utf-8') as file:
+            for line in file:
+                head, _, tail = line.partition(' - ')
+                point = head.split()[4].replace('\\040', ' ')
+                inside = path == point or path.startswith(point.rstrip('/') + '/')
+                if inside and len(point) >= len(mount):
+                    mount, fstype = point, tail.split()[0]
+    except (OSError, IndexError):
+        return None
+    return fstype
+
+
+@lru_cache(maxsize=256)
+#--------------------------------------------------------------------------------
+def is_remote(path):
+#--------------------------------------------------------------------------------
+    # Cached per directory, mountinfo is not parsed again for every wait
+    fstype = filesystem_type(path)
+    return fstype is not None and fstype.startswith(REMOTE_FS)
+
+
+#--------------------------------------------------------------------------------
+def watch_files(*paths, backend=None):
+#--------------------------------------------------------------------------------
+    """
+    Return a watcher that blocks until one of the given files appears.
+
+    The inotify backend is used on local Linux filesystems, otherwise
+    the watcher falls back to adaptive polling.
+
+    Arguments:
+        backend : default, None
+            force 'inotify' or 'poll' backend
+    """
+    paths = [Path(p) for p in paths]
+    dirs = {p.parent for p in paths}
+    if backend is None:
+        local = not any(is_remote(d) for d in dirs)
+        backend = 'inotify' if libc() and local else 'poll'
+    if backend == 'inotify':
+        try:
+            return InotifyWatcher(*paths)
+        except OSError:
+            pass
+    return PollWatcher(*paths)
+
+
+#====================================================================================
+class PollWatcher:
+#====================================================================================
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, *paths, pause_min=POLL_MIN, pause_max=POLL_MAX):    # PollWatcher
+    #--------------------------------------------------------------------------------
+        self._pending = [Path(p) for p in paths]
+        self._min = pause_min
+        self._max = pause_max
+        self._pause = pause_min
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                 # PollWatcher
+    #--------------------------------------------------------------------------------
+        return f'<PollWatcher({", ".join(p.name for p in self._pending)})>'
+
+    #--------------------------------------------------------------------------------
+    def __enter__(self):                                                # PollWatcher
+    #--------------------------------------------------------------------------------
+        return self
+
+    #--------------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):                 # PollWatcher
+    #--------------------------------------------------------------------------------
+        self.close()
+
+    #--------------------------------------------------------------------------------
+    def close(self):                                                    # PollWatcher
+    #--------------------------------------------------------------------------------
+        self._pending = []
+
+    #--------------------------------------------------------------------------------
+    def _found(self):                                                   # PollWatcher
+    #--------------------------------------------------------------------------------
+        for path in self._pending:
+            if path.is_file():
+                self._pending.remove(path)
+                return True
+        return False
+
+    #--------------------------------------------------------------------------------
+    def wait(self, timeout=None):                                       # PollWatcher
+    #--------------------------------------------------------------------------------
+        # Return True when a watched file appears, False on timeout
+        end = None if timeout is None else monotonic() + timeout
+        while not self._found():
+            left = None if end is None else end - monotonic()
+            if left is not None and left <= 0:
+                return False
+            sleep(self._pause if left is None else min(self._pause, left))
+            self._pause = min(self._pause*POLL_FACTOR, self._max)
+        self._pause = self._min
+        return True
+
+
+#====================================================================================
+class InotifyWatcher:
+#====================================================================================
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, *paths):                                      # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        lib = libc()
+        if not lib:
+            raise OSError('inotify is not available')
+        self._fd = lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._pending = [Path(p) for p in paths]
+        self._arrived = []      # Pending paths seen in events but not yet returned by wait()
+        self._dirs = {}
+        for folder in {p.parent for p in self._pending}:
+            wd = lib.inotify_add_watch(self._fd, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                self.close()
+                raise OSError(errno, f'inotify_add_watch failed for {folder}')
+            self._dirs[wd] = folder
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                              # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        return f'<InotifyWatcher({", ".join(p.name for p in self._pending)})>'
+
+    #--------------------------------------------------------------------------------
+    def __enter__(self):                                             # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        return self
+
+    #--------------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):              # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        self.close()
+
+    #--------------------------------------------------------------------------------
+    def close(self):                                                 # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        if self._fd >= 0:
+            os.close(self._fd)
+        self._fd = -1
+
+    #--------------------------------------------------------------------------------
+    def fileno(self):                                                # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        return self._fd
+
+    #--------------------------------------------------------------------------------
+    def _found(self, paths):                                         # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        # Keep all pending paths of a batch of events, and take the first one
+        for path in paths:
+            if path in self._pending and path not in self._arrived:
+                self._arrived.append(path)
+        if self._arrived:
+            self._pending.remove(self._arrived.pop(0))
+            return True
+        return False
+
+    #--------------------------------------------------------------------------------
+    def _read_events(self):                                          # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos < len(data):
+            wd, _, _, size = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            name = data[pos:pos+size].rstrip(b'\0')
+            pos += size
+            if wd in self._dirs and name:
+                yield self._dirs[wd]/os.fsdecode(name)
+
+    #--------------------------------------------------------------------------------
+    def wait(self, timeout=None):                                    # InotifyWatcher
+    #--------------------------------------------------------------------------------
+        # Return True when a watched file appears, False on timeout
+        # Files created before the watch was added do not generate events
+        if self._found([p for p in self._pending if p.is_file()]):
+            return True
+        end = None if timeout is None else monotonic() + timeout
+        while True:
+            left = None if end is None else max(end - monotonic(), 0)
+            ready, _, _ = select([self._fd], [], [], left)
+            if ready and self._found(self._read_events()):
+                return True
+            if left == 0 or (not ready and end is not None):
+                return False
+
+
+#--------------------------------------------------------------------------------
+def open_pidfd(process):
+#--------------------------------------------------------------------------------
+    # Return a pidfd (Linux >= 5.3) of process (pid, psutil or proclib Process), None
+    # if it has exited. Raises OSError if pidfds are not supported.
+    if not hasattr(os, 'pidfd_open'):
+        raise OSError(errno.ENOSYS, 'os.pidfd_open is not available')
+    proc = process.process() if hasattr(process, 'process') else process
+    pid = proc if isinstance(proc, int) else proc.pid
+    try:
+        fd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return None
+    # The pid may have been reused before the pidfd was opened
+    if not isinstance(proc, int) and not proc.is_running():
+        os.close(fd)
+        return None
+    return fd
+
+
+#--------------------------------------------------------------------------------
+def watch_exit(*processes, popen=None, backend=None):
+#--------------------------------------------------------------------------------
+    """
+    Return a watcher that blocks until one of the processes exits.
+
+    pidfds are used on Linux >= 5.3, otherwise the watcher falls back to
+    adaptive polling. The Popen child is reaped when it exits.
+
+    Arguments:
+        processes : pids, psutil or proclib Process objects
+        popen : default, None
+            the Popen (or asyncio) child, reaped by the watcher
+        backend : default, None
+            force 'pidfd' or 'poll' backend
+    """
+    if backend in (None, 'pidfd'):
+        try:
+            return ExitWatcher(*processes, popen=popen)
+        except OSError:
+            pass
+    return PollExitWatcher(*processes, popen=popen)
+
+
+#====================================================================================
+class PollExitWatcher:
+#====================================================================================
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, *processes, popen=None, pause_min=POLL_MIN, pause_max=POLL_MAX):  # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        self._popen = popen
+        self._pending = []
+        self.exited = []
+        if popen:
+            processes += (popen.pid,)
+        for proc in processes:
+            proc = proc.process() if hasattr(proc, 'process') else proc
+            try:
+                proc = psutil.Process(proc) if isinstance(proc, int) else proc
+            except psutil.NoSuchProcess:
+                self.exited.append(proc)
+                continue
+            if proc.pid not in [p.pid for p in self._pending]:
+                self._pending.append(proc)
+        self._min = pause_min
+        self._max = pause_max
+        self._pause = pause_min
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                             # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        return f'<PollExitWatcher({", ".join(str(p.pid) for p in self._pending)})>'
+
+    #--------------------------------------------------------------------------------
+    def __enter__(self):                                            # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        return self
+
+    #--------------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):             # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        self.close()
+
+    #--------------------------------------------------------------------------------
+    def close(self):                                                # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        self._pending = []
+
+    #--------------------------------------------------------------------------------
+    def done(self):                                                 # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        # True when all watched processes have exited
+        self._found()
+        return not self._pending
+
+    #--------------------------------------------------------------------------------
+    def _found(self):                                               # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        # Reap the child, so that it does not stay as a zombie
+        if self._popen:
+            _poll(self._popen)
+        exited = []
+        for proc in self._pending:
+            try:
+                if not proc.is_running() or proc.status() == psutil.STATUS_ZOMBIE:
+                    exited.append(proc)
+            except psutil.NoSuchProcess:
+                exited.append(proc)
+        for proc in exited:
+            self._pending.remove(proc)
+            self.exited.append(proc.pid)
+        return bool(exited)
+
+    #--------------------------------------------------------------------------------
+    def wait(self, timeout=None):                                   # PollExitWatcher
+    #--------------------------------------------------------------------------------
+        # Return True when a watched process exits, False on timeout
+        end = None if timeout is None else monotonic() + timeout
+        while not self._found():
+            left = None if end is None else end - monotonic()
+            if left is not None and left <= 0 or not self._pending:
+                return False
+            sleep(self._pause if left is None else min(self._pause, left))
+            self._pause = min(self._pause*POLL_FACTOR, self._max)
+        self._pause = self._min
+        return True
+
+
+#====================================================================================
+class ExitWatcher:
+#====================================================================================
+    # One pidfd per process registered in an epoll selector. The selector fd
+    # is readable when a process has exited, so it can be added to an asyncio
+    # loop (add_reader) or another selector.
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, *processes, popen=None):                         # ExitWatcher
+    #--------------------------------------------------------------------------------
+        self._popen = popen
+        self._selector = selectors.DefaultSelector()
+        self._pending = {}
+        self.exited = []
+        if popen:
+            processes += (popen.pid,)
+        try:
+            for proc in processes:
+                pid = _pid_of(proc)
+                if pid in self._pending or pid in self.exited:
+                    continue
+                fd = open_pidfd(proc)
+                if fd is None:
+                    self._exit(pid)
+                    continue
+                self._selector.register(fd, selectors.EVENT_READ, pid)
+                self._pending[pid] = fd
+        except OSError:
+            self.close()
+            raise
+
+    #--------------------------------------------------------------------------------
+    def __repr__(self):                                                 # ExitWatcher
+    #--------------------------------------------------------------------------------
+        return f'<ExitWatcher({", ".join(str(p) for p in self._pending)})>'
+
+    #--------------------------------------------------------------------------------
+    def __enter__(self):                                                # ExitWatcher
+    #--------------------------------------------------------------------------------
+        return self
+
+    #--------------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):                 # ExitWatcher
+    #--------------------------------------------------------------------------------
+        self.close()
+
+    #--------------------------------------------------------------------------------
+    def close(self):                                                    # ExitWatcher
+    #--------------------------------------------------------------------------------
+        for fd in self._pending.values():
+            os.close(fd)
+        self._pending = {}
+        self._selector.close()
+
+    #--------------------------------------------------------------------------------
+    def fileno(self):                                                   # ExitWatcher
+    #--------------------------------------------------------------------------------
+        return self._selector.fileno()
+
+    #--------------------------------------------------------------------------------
+    def done(self):                                                     # ExitWatcher
+    #--------------------------------------------------------------------------------
+        # True when all watched processes have exited
+        if self._pending:
+            self.wait(0)
+        return not self._pending
+
+    #--------------------------------------------------------------------------------
+    def _exit(self, pid):                                               # ExitWatcher
+    #--------------------------------------------------------------------------------
+        if fd := self._pending.pop(pid, None):
+            self._selector.unregister(fd)
+            os.close(fd)
+        self.exited.append(pid)
+        # Reap the child, so that it does not stay as a zombie
+        if self._popen and pid == self._popen.pid:
+            _poll(self._popen)
+
+    #--------------------------------------------------------------------------------
+    def wait(self, timeout=None):                                       # ExitWatcher
+    #--------------------------------------------------------------------------------
+        # Return True when a watched process exits, False on timeout
+        if not self._pending:
+            return False
+        events = self._selector.select(timeout)
+        for key, _ in events:
+            self._exit(key.data)
+        return bool(events)
+
+
+#--------------------------------------------------------------------------------
+def _pid_of(process):
+#--------------------------------------------------------------------------------
+    if isinstance(process, int):
+        return process
+    return process.pid() if callable(process.pid) else process.pid
+
+
+#--------------------------------------------------------------------------------
+def _poll(popen):
+#--------------------------------------------------------------------------------
+    # Reap a subprocess.Popen child, an asyncio child is reaped by its loop
+    if hasattr(popen, 'poll'):
+        return popen.poll()
+    return popen.returncode
@@ -9,9 +9,14 @@ from ._version import version as __version__
 #       from proclib.Process import Process
 
 from .Process import Process
+from .ProcessGroup import ProcessGroup
 from .Runner import Runner
+from .AsyncRunner import AsyncRunner
+from .RunnerPool import RunnerPool
 from .Timer import Timer, TimerThread
+from .Sampler import Sampler
+from .RunLog import RunLog
 
 #from psutil import NoSuchProcess
 
-__all__ = ['Process', 'Runner', 'Timer', 'TimerThread']
\ No newline at end of file
+__all__ = ['Process', 'ProcessGroup', 'Runner', 'AsyncRunner', 'RunnerPool', 'Timer', 'TimerThread', 'Sampler', 'RunLog']
\ No newline at end of file
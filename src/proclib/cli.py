@@ -0,0 +1,143 @@
+import sys
+import argparse
+from time import time, sleep, monotonic
+
+from psutil import Process as psutil_Process, NoSuchProcess, AccessDenied
+
+from proclib.Status import read_all, status_dir, STATE_NAMES
+
+
+REFRESH = 0.5     # Seconds between screen updates
+CLEAR = '\033[H\033[J'
+
+
+#====================================================================================
+class Top:
+#====================================================================================
+    """
+    Table of the Runners on this node, read from their status records.
+    CPU (% of one core, summed over the process tree) and the step rate
+    are measured between two refreshes.
+
+    Initialization:
+    Top(directory=None)
+
+    Methods:
+      rows()
+      table()
+    """
+
+    #--------------------------------------------------------------------------------
+    def __init__(self, directory=None):                                         # Top
+    #--------------------------------------------------------------------------------
+        self.directory = directory
+        self._last = {}      # path -> (monotonic, n, cpu seconds)
+
+    #--------------------------------------------------------------------------------
+    def _cpu(self, pid):                                                        # Top
+    #--------------------------------------------------------------------------------
+        # User+system seconds of the process and its children
+        try:
+            proc = psutil_Process(pid)
+            procs = [proc] + proc.children(recursive=True)
+        except (NoSuchProcess, AccessDenied, ValueError):
+            return None
+        total = 0.0
+        for p in procs:
+            try:
+                times = p.cpu_times()
+                total += times.user + times.system
+            except (NoSuchProcess, AccessDenied):
+                pass
+        return total
+
+    #--------------------------------------------------------------------------------
+    def rows(self):                                                             # Top
+    #--------------------------------------------------------------------------------
+        now, wall = monotonic(), time()
+        rows = []
+        last = {}
+        for rec in read_all(self.directory):
+            cpu = self._cpu(rec['pid']) if rec['pid'] else None
+            key = rec['path']
+            prev = self._last.get(key)
+            rate = cpu_pct = None
+            if prev:
+                dt = now - prev[0]
+                if dt > 0:
+                    rate = (rec['n'] - prev[1])/dt
+                    if cpu is not None and prev[2] is not None:
+                        cpu_pct = 100*(cpu - prev[2])/dt
+            elif rec['n'] and wall > rec['started']:
+                rate = rec['n']/(wall - rec['started'])
+            last[key] = (now, rec['n'], cpu)
+            rows.append({
+                'name': rec['name'],
+                'pid': rec['pid'] or '',
+                'n': rec['n'],
+                't': rec['t'],
+                'end': rec['end_time'],
+                'state': STATE_NAMES.get(rec['state'], '?'),
+                'resumed': wall - rec['resumed'] if rec['resumed'] else None,
+                'rate': rate,
+                'cpu': cpu_pct,
+            })
+        self._last = last
+        return rows
+
+    #--------------------------------------------------------------------------------
+    def table(self):                                                            # Top
+    #--------------------------------------------------------------------------------
+        rows = self.rows()
+        head = f'{"NAME":<16} {"PID":>8} {"N":>8} {"T":>12} {"END":>12} {"%":>5} {"STATE":<15} {"RESUMED":>8} {"STEP/S":>8} {"CPU%":>6}'
+        lines = [head]
+        for r in rows:
+            pct = f'{100*r["t"]/r["end"]:.0f}' if r['end'] else ''
+            lines.append(
+                f'{r["name"][:16]:<16} {r["pid"]:>8} {r["n"]:>8} {r["t"]:>12.6g} {r["end"]:>12.6g} {pct:>5} {r["state"]:<15} '
+                + f'{_fmt(r["resumed"], ".1f"):>8} {_fmt(r["rate"], ".2f"):>8} {_fmt(r["cpu"], ".0f"):>6}'
+            )
+        if not rows:
+            lines.append(f'No active runners in {self.directory or status_dir()}')
+        return '\n'.join(lines)
+
+
+#------------------------------------------------
+def _fmt(value, spec):
+#------------------------------------------------
+    return '' if value is None else format(value, spec)
+
+
+#------------------------------------------------
+def top(args):
+#------------------------------------------------
+    monitor = Top(args.dir)
+    if args.once:
+        print(monitor.table())
+        return 0
+    try:
+        while True:
+            table = monitor.table()
+            sys.stdout.write(CLEAR + table + '\n')
+            sys.stdout.flush()
+            sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+#------------------------------------------------
+def main(argv=None):
+#------------------------------------------------
+    parser = argparse.ArgumentParser(prog='proclib', description='Tools for proclib Runners')
+    commands = parser.add_subparsers(dest='command', required=True)
+    parser_top = commands.add_parser('top', help='Live view of the Runners on this node')
+    parser_top.add_argument('-i', '--interval', type=float, default=REFRESH, help='Seconds between updates')
+    parser_top.add_argument('--once', action='store_true', help='Print the table once and exit')
+    parser_top.add_argument('--dir', help='Directory of the status records')
+    args = parser.parse_args(argv)
+    if args.command == 'top':
+        return top(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())